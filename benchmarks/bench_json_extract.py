@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Micro benchmark of the JSON extraction used by every agent (Agent._extract_response)
+
+Compares src/utils/json_extract.py with the extractor it replaced on answers
+shaped like the ones of the reporter and the planner: a long reasoning part
+full of citations like [3] and {braces}, then the JSON, 20 to 100 KB.
+
+    python benchmarks/bench_json_extract.py [--repeat 5]
+"""
+
+import argparse
+import ast
+import importlib.util
+import json
+import os
+import random
+import re
+import statistics
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# load the module alone , the src package pulls in every agent and its dependencies
+_spec = importlib.util.spec_from_file_location(
+    "json_extract", os.path.join(ROOT, "src", "utils", "json_extract.py")
+)
+json_extract = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(json_extract)
+
+
+def legacy_extract(res: str):
+    """
+    Agent._extract_response before json_extract.py , kept here for the comparison
+    """
+    markdown_pattern = r"```(?:json\s*)?\n?(.*?)\n?```"
+    for match in re.findall(markdown_pattern, res, re.DOTALL):
+        match = match.strip()
+        if match.startswith(("{", "[")):
+            try:
+                return json.loads(match)
+            except json.JSONDecodeError:
+                try:
+                    return ast.literal_eval(match)
+                except Exception:
+                    continue
+
+    json_candidates = []
+    for start_char, end_char in [("{", "}"), ("[", "]")]:
+        start_idx = 0
+        while True:
+            start_pos = res.find(start_char, start_idx)
+            if start_pos == -1:
+                break
+            bracket_count = 0
+            end_pos = start_pos
+            for i in range(start_pos, len(res)):
+                char = res[i]
+                if char == start_char:
+                    bracket_count += 1
+                elif char == end_char:
+                    bracket_count -= 1
+                    if bracket_count == 0:
+                        end_pos = i
+                        break
+            if bracket_count == 0:
+                json_candidates.append(res[start_pos : end_pos + 1].strip())
+            start_idx = start_pos + 1
+
+    valid_candidates = []
+    for candidate in json_candidates:
+        try:
+            valid_candidates.append((candidate, json.loads(candidate)))
+        except json.JSONDecodeError:
+            try:
+                valid_candidates.append((candidate, ast.literal_eval(candidate)))
+            except Exception:
+                continue
+    if valid_candidates:
+        return max(valid_candidates, key=lambda x: len(x[0]))[1]
+    return None
+
+
+WORDS = (
+    "the model compares sources before it writes a section about the market and "
+    "its growth while checking every claim against the evidence it was given"
+).split()
+
+
+def _prose(rng: random.Random, size: int) -> str:
+    parts = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        roll = rng.random()
+        if roll < 0.04:
+            word = f"[{rng.randint(1, 40)}]"
+        elif roll < 0.05:
+            word = "{" + word + "}"
+        elif roll < 0.06:
+            word = "don't"
+        parts.append(word)
+        length += len(word) + 1
+    return " ".join(parts)
+
+
+def reporter_answer(rng: random.Random, size: int) -> str:
+    reasoning = _prose(rng, size // 2)
+    content = "\n\n".join(
+        f"## Section {i}\n{_prose(rng, 400)}" for i in range(max(1, size // 900))
+    )
+    return f"<think>{reasoning}</think>\n" + json.dumps({"content": content})
+
+
+def planner_answer(rng: random.Random, size: int) -> str:
+    reasoning = _prose(rng, size // 2)
+    tasks = [
+        {
+            "id": i + 1,
+            "task": _prose(rng, 200),
+            "agent": rng.choice(["searcher", "local-retrieval", "reporter"]),
+            "depends_on": list(range(1, i + 1))[-2:],
+        }
+        for i in range(max(1, size // 500))
+    ]
+    return f"{reasoning}\nHere is the plan:\n" + json.dumps(tasks, indent=2)
+
+
+def damaged_answer(rng: random.Random, size: int) -> str:
+    answer = planner_answer(rng, size)
+    # the trailing commas models like to leave
+    return answer.replace("]\n  }", "],\n  }", 3)
+
+
+def unclosed_answer(rng: random.Random, size: int) -> str:
+    # reasoning with citations the model never closed , every "[" scans to the end
+    reasoning = " ".join(
+        f"[{rng.randint(1, 40)}" if rng.random() < 0.3 else word
+        for word in _prose(rng, size // 2).split()
+    )
+    return reporter_answer(rng, size).replace("</think>", reasoning + "</think>", 1)
+
+
+def bench(fn, text: str, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cases = [
+        (kind, size, make(rng, size * 1024))
+        for kind, make in [
+            ("reporter", reporter_answer),
+            ("planner", planner_answer),
+            ("damaged", damaged_answer),
+            ("unclosed", unclosed_answer),
+        ]
+        for size in (20, 50, 100)
+    ]
+
+    print(f"{'answer':<10}{'KB':>5}{'legacy ms':>12}{'new ms':>10}{'speedup':>10}  same")
+    for kind, size, text in cases:
+        legacy = bench(legacy_extract, text, args.repeat)
+        new = bench(json_extract.extract_json, text, args.repeat)
+        same = legacy_extract(text) == json_extract.extract_json(text)
+        print(
+            f"{kind:<10}{size:>5}{legacy:>12.2f}{new:>10.2f}{legacy / new:>9.1f}x  {same}"
+        )
+
+
+if __name__ == "__main__":
+    main()
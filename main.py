@@ -35,6 +35,9 @@ async def generate_report(query, planner: Planner, agents: list[Agent]):
     return report
 
 from src.api.app import router  # Import the router with all your routes
+from src.api.routes.jobs import get_job_queue
+from src.model import transport
+from src.browser import session as browser_session
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI
 
@@ -60,6 +63,17 @@ app = FastAPI(
 # Include the imported router (which has all your routes)
 app.include_router(router)
 
+@app.on_event("startup")
+async def start_jobs():
+    # picks up the jobs that were queued or running before a restart
+    get_job_queue().start()
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    await get_job_queue().stop()
+    await transport.aclose()
+    await browser_session.aclose()
+
 origins = [
     "http://localhost:8080",
     "https://spy-search.onrender.com",
@@ -32,6 +32,18 @@ class VectorSearch:
         else:
             self.collection.add(documents=documents, ids=id, metadatas=metadatas)
 
+    def upsert_document(self, documents: str, id: str, metadatas: None = None):
+        """
+        like add_document but replaces the document if the id already exists
+        """
+        if metadatas == None:
+            self.collection.upsert(documents=documents, ids=id)
+        else:
+            self.collection.upsert(documents=documents, ids=id, metadatas=metadatas)
+
+    def delete_file(self, filepath: str):
+        self.collection.delete(where={"file": filepath})
+
     def query(self, query: str, k: int):
         return self.collection.query(query_texts=query, n_results=k)
 
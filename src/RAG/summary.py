@@ -14,8 +14,10 @@ import string
 
 
 class Summary(object):
-    def __init__(self, model: Model, k: int = 10000):
+    def __init__(self, model: Model, k: int = 10000, max_concurrency: int = 4):
         self.model = model
+        # chunks summarized at the same time
+        self.max_concurrency = max_concurrency
         self.db = []
         self.result = []
         # k corresponding to the chunk
@@ -32,6 +34,32 @@ class Summary(object):
             id , url, title , summary , brief_summary , keywords
         }
         """
+        self._chunk(content)
+        responses = self.model.batch_completion(
+            self._prompts(), max_concurrency=self.max_concurrency
+        )
+        for r in responses:
+            self._handle_response(r)
+        return self.result
+
+    async def asummary(self, content: str):
+        """
+        same as summary with the async model api
+        """
+        self._chunk(content)
+        responses = await self.model.abatch_completion(
+            self._prompts(), max_concurrency=self.max_concurrency
+        )
+        for r in responses:
+            self._handle_response(r)
+        return self.result
+
+    def _prompts(self) -> list[str]:
+        # the chunks are summarized at the same time , so every chunk sees the
+        # short summaries known before the batch and not the ones of its neighbours
+        return [summary_prompt(chunk, self.db) for chunk in self.chunks]
+
+    def _chunk(self, content: str):
         texts = content.split()
         counter = 0
         paragraph = ""
@@ -44,40 +72,38 @@ class Summary(object):
                 paragraph = ""
                 counter = 0
         self.chunks.append(paragraph)
-        for chunk in self.chunks:
-            prompt = summary_prompt(chunk, self.db)
-            """
-            """
-            alphabet = string.ascii_letters + string.digit
-
-            r = self.model.completion(prompt)
-            json_str = self.extract_json_from_codeblock(r)
-            if json_str is None:
-                print("No JSON code block found in response")
-                continue
-
-            try:
-                d = json.loads(json_str)
-                rand_id = "".join(secrets.choice(alphabet) for _ in range(self.length))
-                response_obj = {
-                    "id": rand_id,
-                    "url": d.get("url", ""),
-                    "title": d.get("title", ""),
-                    "summary": d.get("summary", ""),
-                    "brief_summary": d.get("brief_summary", ""),
-                    "keywords": d.get("keywords", []),
-                }
-
-                full_summary = response_obj["summary"]
-                short_summary = response_obj["brief_summary"]
-
-                self.db.append(short_summary)
-                self.result.append(response_obj)
-
-            except:
-                print(f"Failed to parse or validate JSON summary")
 
-        return self.result
+    def _handle_response(self, r: str):
+        if isinstance(r, Exception):
+            print(f"Failed to summarize a chunk: {r}")
+            return
+        alphabet = string.ascii_letters + string.digits
+
+        json_str = self.extract_json_from_codeblock(r)
+        if json_str is None:
+            print("No JSON code block found in response")
+            return
+
+        try:
+            d = json.loads(json_str)
+            rand_id = "".join(secrets.choice(alphabet) for _ in range(self.length))
+            response_obj = {
+                "id": rand_id,
+                "url": d.get("url", ""),
+                "title": d.get("title", ""),
+                "summary": d.get("summary", ""),
+                "brief_summary": d.get("brief_summary", ""),
+                "keywords": d.get("keywords", []),
+            }
+
+            full_summary = response_obj["summary"]
+            short_summary = response_obj["brief_summary"]
+
+            self.db.append(short_summary)
+            self.result.append(response_obj)
+
+        except:
+            print(f"Failed to parse or validate JSON summary")
 
     def extract_json_from_codeblock(self, text: str) -> str | None:
         pattern = r"```json\s*(.*?)\s*```"
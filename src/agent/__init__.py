@@ -2,5 +2,7 @@ from .planner import Planner
 from .search import Search_agent
 from .reporter import Reporter
 from .agent import Agent
+from .context import RunContext, Deadline
+from .evidence import Evidence, EvidenceStore
 from .retrival import RAG_agent
 from .quick_searcher import Quick_searcher
@@ -1,11 +1,10 @@
 from abc import ABC, abstractmethod
 
-import re
-import json
-import ast
-
 from pydantic import BaseModel
 
+from .context import RunContext
+from ..utils import extract_json
+
 """
     This is an abstract class for Agent
     Here we will list out method that an Agent should have 
@@ -13,7 +12,6 @@ from pydantic import BaseModel
 
 
 class Agent(ABC):
-
     def __init__(self, model):
         self.model = model
         self.name: str
@@ -22,10 +20,19 @@ class Agent(ABC):
     """
         An agent should have a run method such that it can run it's workflow 
         NOTE: choosing right tool for the right job should also place in the run method
+        NOTE: one agent serves many runs at the same time, keep per-run state in ctx not on self
     """
 
     @abstractmethod
-    async def run(self, response, data=None):
+    async def run(self, response, data=None, ctx: RunContext = None):
+        pass
+
+    def speculate(self, query: str, ctx: RunContext):
+        """
+        Called with the raw query while the planner is still planning.
+        An agent may start the work it expects to be asked for and keep it
+        with ctx.add_speculation, the server cancels whatever is not used
+        """
         pass
 
     @abstractmethod
@@ -42,61 +49,4 @@ class Agent(ABC):
         Handles both JSON (double quotes) and Python literals (single quotes).
         Returns a Python dict or list (parsed), or None if no valid data found.
         """
-        # Extract markdown code blocks first
-        markdown_pattern = r"```(?:json\s*)?\n?(.*?)\n?```"
-        markdown_matches = re.findall(markdown_pattern, res, re.DOTALL)
-
-        for match in markdown_matches:
-            match = match.strip()
-            if match.startswith(("{", "[")):
-                try:
-                    parsed = json.loads(match)
-                    return parsed
-                except json.JSONDecodeError:
-                    try:
-                        parsed = ast.literal_eval(match)
-                        return parsed
-                    except Exception:
-                        continue
-
-        # Find JSON or Python literals in plain string
-        json_candidates = []
-        for start_char, end_char in [("{", "}"), ("[", "]")]:
-            start_idx = 0
-            while True:
-                start_pos = res.find(start_char, start_idx)
-                if start_pos == -1:
-                    break
-                bracket_count = 0
-                end_pos = start_pos
-                for i in range(start_pos, len(res)):
-                    char = res[i]
-                    if char == start_char:
-                        bracket_count += 1
-                    elif char == end_char:
-                        bracket_count -= 1
-                        if bracket_count == 0:
-                            end_pos = i
-                            break
-                if bracket_count == 0:
-                    candidate = res[start_pos : end_pos + 1].strip()
-                    json_candidates.append(candidate)
-                start_idx = start_pos + 1
-
-        valid_candidates = []
-        for candidate in json_candidates:
-            try:
-                parsed = json.loads(candidate)
-                valid_candidates.append((candidate, parsed))
-            except json.JSONDecodeError:
-                try:
-                    parsed = ast.literal_eval(candidate)
-                    valid_candidates.append((candidate, parsed))
-                except Exception:
-                    continue
-
-        if valid_candidates:
-            largest = max(valid_candidates, key=lambda x: len(x[0]))
-            return largest[1]
-
-        return None
+        return extract_json(res)
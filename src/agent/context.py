@@ -0,0 +1,118 @@
+from uuid import uuid4
+
+from .evidence import EvidenceStore
+
+import asyncio
+import math
+import time
+
+
+class Deadline:
+    """
+    Time budget of a request. Deadline(None) never expires.
+    Agents check remaining() to do less work when time is short.
+    """
+
+    def __init__(self, seconds: float = None):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    @property
+    def bounded(self) -> bool:
+        return self.expires_at is not None
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, margin: float = 0.0) -> float | None:
+        """
+        remaining time minus margin as an asyncio timeout, None when unbounded
+        """
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.remaining() - margin)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class RunContext:
+    """
+    Everything that belongs to one report run.
+
+    Agents are long lived and shared between concurrent requests,
+    so anything that only makes sense for one run (the query, to do lists,
+    urls found so far ...) is kept here instead of on the agent.
+    Everything the agents find goes to the evidence store of the run.
+    """
+
+    def __init__(
+        self,
+        query: str = "",
+        run_id: str = "",
+        deadline: Deadline = None,
+        reserve: float = 0.0,
+    ):
+        """
+        reserve: seconds at the end of the deadline kept for writing the report ,
+                 the agents gathering evidence stop before it
+        """
+        self.query = query
+        self.run_id = run_id or uuid4().hex
+        self.deadline = deadline if deadline is not None else Deadline()
+        self.reserve = reserve
+        self.evidence = EvidenceStore()
+        self._state: dict[str, dict] = {}
+        # agent name -> (query , task) started before the plan was known
+        self._speculative: dict[str, tuple[str, asyncio.Task]] = {}
+
+    def work_remaining(self) -> float:
+        """
+        time left for the work before the report
+        """
+        return max(0.0, self.deadline.remaining() - self.reserve)
+
+    def work_timeout(self) -> float | None:
+        """
+        work_remaining() as an asyncio timeout , None when unbounded
+        """
+        return self.deadline.timeout(margin=self.reserve)
+
+    def work_expired(self) -> bool:
+        return self.work_remaining() <= 0
+
+    def state(self, name: str) -> dict:
+        """
+        scratch space of one agent for this run
+        """
+        return self._state.setdefault(name, {})
+
+    def add_speculation(self, name: str, query: str, task: asyncio.Task):
+        self.cancel_speculation(name)
+        self._speculative[name] = (query, task)
+
+    def speculation(self, name: str) -> tuple[str, asyncio.Task] | None:
+        return self._speculative.get(name)
+
+    def pop_speculation(self, name: str) -> tuple[str, asyncio.Task] | None:
+        return self._speculative.pop(name, None)
+
+    def cancel_speculation(self, name: str = None, keep: set = None):
+        """
+        cancel the speculative work of name , of every agent not in keep when name is None
+        """
+        names = [name] if name is not None else list(self._speculative)
+        for n in names:
+            if keep is not None and n in keep:
+                continue
+            entry = self._speculative.pop(n, None)
+            if entry is None:
+                continue
+            task = entry[1]
+            if task.done():
+                if not task.cancelled():
+                    # nobody will read it , don't let asyncio warn about it
+                    task.exception()
+            else:
+                task.cancel()
@@ -0,0 +1,206 @@
+"""
+Evidence gathered during a report run
+
+Every agent that finds something (a web page, a search snippet, a local document)
+adds it to the EvidenceStore of the run and passes the record it gets back.
+The store drops duplicates by url and by content, so the same page found by
+two searchers is carried through the plan and into the prompts only once,
+and gives every record a short id that never changes for the rest of the run
+(the reporter cites sources with it).
+"""
+
+from urllib.parse import urlsplit, urlunsplit
+
+import hashlib
+import threading
+
+
+class Evidence:
+    __slots__ = ("id", "url", "title", "summary", "brief_summary", "keywords", "digest")
+
+    def __init__(
+        self,
+        id: str,
+        url: str = "",
+        title: str = "",
+        summary: str = "",
+        brief_summary: str = "",
+        keywords: list = None,
+        digest: str = "",
+    ):
+        self.id = id
+        self.url = url
+        self.title = title
+        self.summary = summary
+        self.brief_summary = brief_summary
+        self.keywords = keywords or []
+        self.digest = digest
+
+    def get(self, key: str, default=None):
+        """
+        read a field like a dict so code written for the old dict items keeps working
+        """
+        if key in self.__slots__:
+            return getattr(self, key)
+        return default
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "url": self.url,
+            "title": self.title,
+            "summary": self.summary,
+            "brief_summary": self.brief_summary,
+            "keywords": self.keywords,
+        }
+
+    def __repr__(self):
+        return f"Evidence({self.id!r}, {self.url!r}, {self.title!r})"
+
+
+def _normalize_url(url: str) -> str:
+    url = (url or "").strip()
+    if not url:
+        return ""
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    if not parts.scheme:
+        # a local file path
+        return url
+    path = parts.path.rstrip("/")
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), path, parts.query, "")
+    )
+
+
+def _digest(title: str, summary: str, brief_summary: str) -> str:
+    """
+    hash of the most detailed text we have , ignoring case and spacing
+    """
+    text = summary or brief_summary or title
+    text = " ".join(str(text or "").split()).lower()
+    if not text:
+        return ""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EvidenceStore:
+    """
+    All evidence of one run, shared by the agents through the RunContext.
+    add() is safe to call from worker threads.
+    """
+
+    def __init__(self):
+        self._items: dict[str, Evidence] = {}
+        self._by_url: dict[str, Evidence] = {}
+        self._by_digest: dict[str, Evidence] = {}
+        self._next = 1
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        url: str = "",
+        title: str = "",
+        summary: str = "",
+        brief_summary: str = "",
+        keywords: list = None,
+    ) -> Evidence:
+        """
+        return the record of this evidence, the one already in the store
+        when the url or the content was seen before
+        """
+        key = _normalize_url(url)
+        digest = _digest(title, summary, brief_summary)
+        with self._lock:
+            found = self._by_url.get(key) if key else None
+            if found is None and digest:
+                found = self._by_digest.get(digest)
+            if found is not None:
+                self._fill(found, url, title, summary, brief_summary, keywords)
+                return found
+
+            record = Evidence(
+                f"e{self._next}",
+                url=url or "",
+                title=title or "",
+                summary=summary or "",
+                brief_summary=brief_summary or "",
+                keywords=list(keywords or []),
+                digest=digest,
+            )
+            self._next += 1
+            self._index(record)
+            return record
+
+    def add_dict(self, item: dict) -> Evidence:
+        return self.add(
+            url=item.get("url", ""),
+            title=item.get("title", ""),
+            summary=item.get("summary", ""),
+            brief_summary=item.get("brief_summary", ""),
+            keywords=item.get("keywords") or [],
+        )
+
+    def get(self, id: str) -> Evidence | None:
+        return self._items.get(str(id))
+
+    def __contains__(self, id) -> bool:
+        return str(id) in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(list(self._items.values()))
+
+    def to_list(self) -> list[dict]:
+        return [record.to_dict() for record in self]
+
+    def load(self, items: list[dict]):
+        """
+        put back the records of a checkpoint with their original ids
+        """
+        with self._lock:
+            for item in items or []:
+                record = Evidence(
+                    item["id"],
+                    url=item.get("url", ""),
+                    title=item.get("title", ""),
+                    summary=item.get("summary", ""),
+                    brief_summary=item.get("brief_summary", ""),
+                    keywords=item.get("keywords") or [],
+                    digest=_digest(
+                        item.get("title", ""),
+                        item.get("summary", ""),
+                        item.get("brief_summary", ""),
+                    ),
+                )
+                self._index(record)
+                if record.id[1:].isdigit():
+                    self._next = max(self._next, int(record.id[1:]) + 1)
+
+    def _index(self, record: Evidence):
+        self._items[record.id] = record
+        key = _normalize_url(record.url)
+        if key:
+            self._by_url.setdefault(key, record)
+        if record.digest:
+            self._by_digest.setdefault(record.digest, record)
+
+    def _fill(self, record, url, title, summary, brief_summary, keywords):
+        """
+        a later copy may know more than the first one , only empty fields are filled
+        """
+        if not record.url and url:
+            record.url = url
+            self._by_url.setdefault(_normalize_url(url), record)
+        if not record.title and title:
+            record.title = title
+        if not record.summary and summary:
+            record.summary = summary
+        if not record.brief_summary and brief_summary:
+            record.brief_summary = brief_summary
+        if not record.keywords and keywords:
+            record.keywords = list(keywords)
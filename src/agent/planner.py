@@ -1,8 +1,16 @@
 from .agent import Agent
+from .context import RunContext
 from ..prompt import planner_agent_prompt
 from ..model import model
+from ..utils import span, LRUCache, JSONArrayStream
 
+import asyncio
+import copy
+import hashlib
 import json
+import re
+import time
+import unicodedata
 
 from collections import deque
 
@@ -12,17 +20,27 @@ logger = logging.getLogger(__name__)
 
 
 class Planner(Agent):
-    def __init__(self, model: model, query: str = "", data=None):
+    def __init__(
+        self,
+        model: model,
+        query: str = "",
+        data=None,
+        plan_cache_size: int = 128,
+        plan_cache_ttl: float = 3600,
+        stream_plan: bool = True,
+    ):
+        """
+        plan_cache_size , plan_cache_ttl: plans are reused for the same query and agents,
+        a size of 0 turns the cache off
+        stream_plan: hand every task to the server as soon as the model has written it
+        """
+        # query is only used when run is called without a RunContext
         self.query = query
         self._model = model
         self._output_model = {}
-        self._todo_list = _todo()
+        self._plan_cache = LRUCache(plan_cache_size, ttl=plan_cache_ttl)
+        self.stream_plan = stream_plan
 
-        self.message = []
-        self.initialize = False
-
-        self.response = ""
-        self.db = []
         self.name = "planner"
         self.description = "plan the tasks"
 
@@ -35,45 +53,134 @@ class Planner(Agent):
     def set_name(self, name):
         self.name = name
 
-    async def run(self, response, data=[]):
+    async def run(self, response, data=[], ctx: RunContext = None):
         """
         It should generate a to do list
-        and then pass to different agent
+        and then pass the whole plan to the server, which runs
+        the tasks that don't depend on each other at the same time
         """
         # Initialization
-        # only run for oen time
+        # only run for oen time per run
 
         logger.info("planner running ... ...")
-        if not self.initialize:
-            prompt = planner_agent_prompt(
-                list(self._output_model.keys()),
-                list(self._output_model.values()),
-                self.query,
-            )
-            res = self._model.completion(prompt)
-
-            logger.info(f"get response {res}")
-
-            self._response_todo_handler(res)
-
-            self.initialize = True
+        ctx = ctx if ctx is not None else RunContext(query=self.query)
+        state = ctx.state(self.name)
+        if not state.get("initialized"):
+            query = ctx.query or self.query
+            key = self._plan_key(query)
+            tasks = self._plan_cache.get(key)
+            if tasks is not None:
+                with span("planner.plan", cached=True, tasks=len(tasks)):
+                    logger.info(f"reusing the plan of {query}")
+            elif self.stream_plan:
+                state["initialized"] = True
+                # the server schedules the tasks while the rest of the plan is written
+                return {
+                    "agent": "PLAN",
+                    "task": "",
+                    "tasks": [],
+                    "stream": self._plan_stream(query, key),
+                    "data": data,
+                }
+            else:
+                tasks = await self._plan(query)
+                if tasks:
+                    self._plan_cache.set(key, tasks)
 
-            task = self._todo_list.pop_task()
-            logger.info(f"handling {task.task}")
+            state["initialized"] = True
+            # the server writes into the tasks , never hand out the cached ones
+            tasks = copy.deepcopy(tasks)
+            logger.info(f"handling plan {tasks}")
 
-            obj = {"agent": task.agent, "task": task.task, "data": data}
+            obj = {"agent": "PLAN", "task": "", "tasks": tasks, "data": data}
             return obj
         else:
             self._response_handler(response)
-            new_task = self._todo_list.pop_task()
-            if new_task == None:
-                logger.info("Terminate processs")
-                obj = {"agent": "TERMINATE", "task": "TERMINATE", "data": data}
-            else:
-                obj = {"agent": new_task.agent, "task": new_task.task, "data": data}
-                logger.info(f"handling next obj {obj}")
+            logger.info("Terminate processs")
+            obj = {"agent": "TERMINATE", "task": "TERMINATE", "data": data}
             return obj
 
+    async def _plan(self, query: str) -> list[dict]:
+        prompt = planner_agent_prompt(
+            list(self._output_model.keys()),
+            list(self._output_model.values()),
+            query,
+        )
+        todo_list = _todo()
+        with span("planner.plan") as s:
+            res = await self._model.fork().acompletion(prompt)
+
+            logger.info(f"get response {res}")
+
+            self._response_todo_handler(res, todo_list)
+            s.set(tasks=todo_list.len())
+
+        tasks = []
+        task = todo_list.pop_task()
+        while task != None:
+            tasks.append(task.to_dict())
+            task = todo_list.pop_task()
+        return tasks
+
+    def _plan_stream(self, query: str, key: str):
+        """
+        async iterator over the tasks of the plan. The completion streams in its own
+        task so the span of the planner doesn't become the parent of the agents
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(self._stream_plan(query, key, queue))
+        return _drain(queue, producer)
+
+    async def _stream_plan(self, query: str, key: str, queue: asyncio.Queue):
+        prompt = planner_agent_prompt(
+            list(self._output_model.keys()),
+            list(self._output_model.values()),
+            query,
+        )
+        parser = JSONArrayStream()
+        chunks = []
+        tasks = []
+        start = time.perf_counter()
+        try:
+            with span("planner.plan", streamed=True) as s:
+                async for chunk in self._model.fork().acompletion_stream(prompt):
+                    chunks.append(chunk)
+                    for item in parser.feed(chunk):
+                        task = self._to_task(item, len(tasks))
+                        if task is None:
+                            continue
+                        if not tasks:
+                            s.set(first_task_ms=round((time.perf_counter() - start) * 1000))
+                        tasks.append(task)
+                        queue.put_nowait(copy.deepcopy(task))
+                    if parser.done:
+                        break
+
+                if not tasks:
+                    # not a plain array of objects , read the whole answer the old way
+                    res = "".join(chunks)
+                    logger.info(f"get response {res}")
+                    for item in self._extract_response(res) or []:
+                        task = self._to_task(item, len(tasks))
+                        if task is not None:
+                            tasks.append(task)
+                            queue.put_nowait(copy.deepcopy(task))
+                s.set(tasks=len(tasks))
+            if tasks:
+                self._plan_cache.set(key, tasks)
+        finally:
+            queue.put_nowait(None)
+
+    def _plan_key(self, query: str) -> str:
+        """
+        the same question asked with different case , spacing or final punctuation
+        to the same agents gets the same plan
+        """
+        query = unicodedata.normalize("NFKC", query or "").casefold()
+        query = re.sub(r"\s+", " ", query).strip().rstrip("?!.。？！ ")
+        agents = json.dumps(sorted(self._output_model.items()), ensure_ascii=False)
+        return query + "|" + hashlib.sha1(agents.encode("utf-8")).hexdigest()
+
     def _response_handler(self, response):
         pass
 
@@ -85,17 +192,55 @@ class Planner(Agent):
         """
         self._output_model[model] = description
 
-    def _response_todo_handler(self, json_response):
+    def _response_todo_handler(self, json_response, todo_list: "_todo"):
         """
         For planner json response should be handling an array []
         add everything into the todo list queue
         """
         obj = self._extract_response(json_response)
         logger.info(f"handling task {obj}")
-        for response in obj:
-            task = response["task"]
-            agent = response["agent"]
-            self._todo_list.add_task(task, agent)
+        for i, response in enumerate(obj):
+            task = self._to_task(response, i)
+            if task is not None:
+                todo_list.add_task(
+                    task["task"], task["agent"], task["id"], task["depends_on"]
+                )
+
+    def _to_task(self, response, i: int):
+        """
+        one item of the plan as a task dict , None when it isn't a task
+        """
+        if not isinstance(response, dict) or "task" not in response or "agent" not in response:
+            logger.warning(f"skipping invalid task {response}")
+            return None
+        depends_on = _depends_on(response.get("depends_on"))
+        return _task(
+            response["task"], response["agent"], str(response.get("id", i + 1)), depends_on
+        ).to_dict()
+
+
+def _depends_on(depends_on) -> list[str] | None:
+    """
+    the ids a task waits for as strings , the model may write one id without a list
+    """
+    if depends_on is None:
+        return None
+    if isinstance(depends_on, (str, int)):
+        return [str(depends_on)]
+    if isinstance(depends_on, list):
+        return [str(d) for d in depends_on]
+    logger.warning(f"ignoring depends_on {depends_on!r}")
+    return None
+
+
+async def _drain(queue: asyncio.Queue, producer: asyncio.Task):
+    try:
+        while (task := await queue.get()) is not None:
+            yield task
+        # the error of the planner , if it failed
+        await producer
+    finally:
+        producer.cancel()
 
 
 """
@@ -108,8 +253,10 @@ class _todo:
     def __init__(self):
         self.todo_list = deque()
 
-    def add_task(self, task: str, Agent: Agent):
-        self.todo_list.append(_task(task, Agent))
+    def add_task(
+        self, task: str, Agent: Agent, id: str = "", depends_on: list[str] = None
+    ):
+        self.todo_list.append(_task(task, Agent, id, depends_on))
 
     def pop_task(self):
         if self.len() == 0:
@@ -121,6 +268,23 @@ class _todo:
 
 
 class _task:
-    def __init__(self, task: str, agent: Agent):
+    """
+    depends_on lists the ids of earlier tasks this task needs.
+    None means the planner did not say, so it waits for every earlier task
+    """
+
+    def __init__(
+        self, task: str, agent: Agent, id: str = "", depends_on: list[str] = None
+    ):
         self.task = task
         self.agent = agent
+        self.id = id
+        self.depends_on = depends_on
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "task": self.task,
+            "agent": self.agent,
+            "depends_on": self.depends_on,
+        }
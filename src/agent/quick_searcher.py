@@ -1,5 +1,39 @@
 from ..browser import DuckSearch
 from .agent import Agent
+from .context import RunContext
+from ..utils import span
+
+import asyncio
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+_STOPWORDS = {
+    "a", "about", "an", "and", "are", "as", "at", "be", "by", "can", "could",
+    "do", "does", "for", "from", "give", "how", "i", "in", "is", "it", "me",
+    "of", "on", "or", "please", "report", "search", "tell", "the", "this",
+    "to", "what", "when", "where", "which", "who", "why", "with", "write", "you",
+}
+
+
+def _keywords(query: str) -> list[str]:
+    """
+    the words of the query that matter for a search engine , in order
+    """
+    words = re.findall(r"\w+", (query or "").casefold())
+    keywords = [w for w in words if w not in _STOPWORDS]
+    return list(dict.fromkeys(keywords or words))
+
+
+def _similarity(a: str, b: str) -> float:
+    """
+    overlap of the keywords of two queries , 1 means the same keywords
+    """
+    ka, kb = set(_keywords(a)), set(_keywords(b))
+    if not ka or not kb:
+        return 0.0
+    return len(ka & kb) / len(ka | kb)
 
 
 class Quick_searcher(Agent):
@@ -7,8 +41,23 @@ class Quick_searcher(Agent):
     Instead of search so slow use do do duck searcher to search faster
     """
 
-    def __init__(self, model):
+    def __init__(
+        self,
+        model,
+        k: int = 20,
+        deep_search_seconds: float = 30,
+        speculative_similarity: float = 0.5,
+    ):
+        """
+        k: number of search results
+        deep_search_seconds: fetching every page is only done with at least this much time left
+        speculative_similarity: a planned search reuses the search started before the plan
+                                when their keywords overlap at least this much
+        """
         self.model = model
+        self.k = k
+        self.deep_search_seconds = deep_search_seconds
+        self.speculative_similarity = speculative_similarity
         self.searcher = DuckSearch()
 
         self.name = "quick-searcher"
@@ -23,7 +72,25 @@ class Quick_searcher(Agent):
     def set_name(self, name):
         self.name = name
 
-    async def run(self, query, data=[]):
+    def speculate(self, query: str, ctx: RunContext):
+        """
+        almost every plan starts with a search on the query itself,
+        start it while the planner is still thinking
+        """
+        query = " ".join(_keywords(query))
+        if not query:
+            return
+        k, deep_search = self._budget(ctx)
+
+        async def search():
+            with span("quick_searcher.speculate", query=query):
+                return await self.searcher.asearch_result(
+                    query, k=k, deep_search=deep_search
+                )
+
+        ctx.add_speculation(self.name, query, asyncio.create_task(search()))
+
+    async def run(self, query, data=[], ctx: RunContext = None):
         """
         quick search use do do duck to do quick search and response
         different from the quick search response it return data and
@@ -31,14 +98,43 @@ class Quick_searcher(Agent):
 
         maybe selecte relevant web ?
         """
-        res = self.searcher.search_result(query)
+        ctx = ctx or RunContext()
+        try:
+            res = await asyncio.wait_for(
+                self._search(query, ctx), timeout=ctx.work_timeout()
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"deadline reached while searching {query}")
+            return {"agent": "planner", "data": data, "task": ""}
         for ele in res:
-            result = {
-                "title": ele["title"],
-                "summary": ele.get("full_content", ""),
-                "brief_summary": ele["snippet"],
-                "keywords": [],
-                "url": ele["link"],
-            }
-            data.append(result)
+            data.append(
+                ctx.evidence.add(
+                    url=ele["link"],
+                    title=ele["title"],
+                    summary=ele.get("full_content", ""),
+                    brief_summary=ele["snippet"],
+                )
+            )
         return {"agent": "planner", "data": data, "task": ""}
+
+    def _budget(self, ctx: RunContext) -> tuple[int, bool]:
+        remaining = ctx.work_remaining()
+        # less time , fewer results and snippets only
+        k = self.k if remaining >= self.deep_search_seconds / 2 else max(1, self.k // 2)
+        return k, remaining >= self.deep_search_seconds
+
+    async def _search(self, query: str, ctx: RunContext) -> list[dict]:
+        speculation = ctx.speculation(self.name)
+        if speculation is not None:
+            guess, task = speculation
+            if _similarity(query, guess) >= self.speculative_similarity:
+                ctx.pop_speculation(self.name)
+                try:
+                    res = await task
+                    logger.info(f"reusing the early search {guess} for {query}")
+                    return res
+                except Exception as e:
+                    logger.warning(f"early search {guess} failed: {e}")
+
+        k, deep_search = self._budget(ctx)
+        return await self.searcher.asearch_result(query, k=k, deep_search=deep_search)
@@ -1,13 +1,16 @@
 from .agent import Agent
+from .context import RunContext, Deadline
+from .evidence import Evidence, EvidenceStore
 from ..prompt.reporter import report_prompt, report_plan, report_task
 
 from ..model import Model
+from ..router.events import emit, SectionEvent
+from ..utils import span
 
-import string
-import secrets
 import json
 
 import time
+import asyncio
 
 import logging
 
@@ -15,28 +18,38 @@ logger = logging.getLogger(__name__)
 
 
 class Reporter(Agent):
-    def __init__(self, model: Model):
+    def __init__(
+        self,
+        model: Model,
+        max_concurrency: int = 4,
+        retries: int = 2,
+        section_seconds: float = 20,
+    ):
+        """
+        max_concurrency: how many sections are written at the same time
+        retries: how many times a failed section is written again
+        section_seconds: rough time to write one section, used to plan fewer sections near a deadline
+        """
         self.model: Model = model
-        self.todo = []
-        self.db = None
 
         self.description = "generateing report"
 
-        self.source = {}
         self.name = "reporter"
 
-        self.length = 4  # the length of uuid
+        self.max_concurrency = max(1, max_concurrency)
+        self.retries = retries
+        self.section_seconds = section_seconds
 
     def set_name(self, name):
         self.name = name
 
-    async def run(self, query: str, data=None):
+    async def run(self, query: str, data=None, ctx: RunContext = None):
         """
         based on query and data to write a response
         Maybe we plan what to write and write a report style ?
         """
-        self.db = self.data_handler(data=data)
-        short_summary = self.data_handler(data)
+        ctx = ctx if ctx is not None else RunContext(query=query)
+        short_summary, source = self.data_handler(data, ctx.evidence)
 
         logger.info(f"short summary {short_summary}")
 
@@ -50,47 +63,45 @@ class Reporter(Agent):
 
         logger.info(f"handling tasks {tasks}")
 
-        r = self._task_handler(tasks)
+        r = await self._task_handler(tasks, source, ctx.deadline)
 
         logger.info(f"response {r}")
 
         return {"agent": "TERMINATE", "data": r, "task": ""}
 
-    def data_handler(self, data):
+    def data_handler(self, data, store: EvidenceStore):
+        """
+        return the short summaries for planning and the evidence store for get_source.
+        items are cited with the id the store gave them, plain dicts
+        (from agents that don't use the store) are added to it first
+        """
         if not isinstance(data, list):
             print("error handling data")
-            return
+            return [], store
 
         short_summaries = []
-        alphabet = string.ascii_letters + string.digits
-
-        # Store processed items with IDs for future referencing
-        processed_data = []
-
+        seen = set()
         for d in data:
-            rand_id = "".join(secrets.choice(alphabet) for _ in range(self.length))
-
-            col = {
-                "id": rand_id,
-                "url": d.get("url", ""),
-                "title": d.get("title", ""),
-                "summary": d.get("summary", ""),
-                "brief_summary": d.get("brief_summary", ""),
-                "keywords": d.get("keywords", []),
-            }
-            processed_data.append(col)
-
-            if col["summary"] != "":
-                short_summaries.append({"id": rand_id, "short_summary": col["summary"]})
-        self.source = processed_data
-        return short_summaries
+            record = d if isinstance(d, Evidence) else store.add_dict(d)
+            if record.id in seen:
+                continue
+            seen.add(record.id)
+
+            if record.summary != "":
+                short_summaries.append(
+                    {"id": record.id, "short_summary": record.summary}
+                )
+        return short_summaries, store
 
     # Suppose you got a short summary id and want to get the long summary
-    def get_source(self, summary_ids: list[int]) -> list[object]:
+    def get_source(self, summary_ids: list, source: EvidenceStore) -> list[dict]:
+        if not isinstance(summary_ids, list):
+            summary_ids = [summary_ids]
         sources = []
-        for item in self.source:
-            if item["id"] in summary_ids:
-                sources.append(item)
+        for i in dict.fromkeys(str(i) for i in summary_ids):
+            record = source.get(i)
+            if record is not None:
+                sources.append(record.to_dict())
         return sources
 
     def get_recv_format(self):
@@ -102,38 +113,69 @@ class Reporter(Agent):
     async def _planner(self, query, db=None):
         print("planning what to write")
         prompt = report_plan(query, db)
-        res = self.model.completion(prompt)
+        with span("reporter.plan", sources=len(db or [])):
+            res = await self.model.fork().acompletion(prompt)
         return res
 
-    def _task_handler(self, tasks):
-        i = 0
-        final_report = ""
-        for task in tasks:
-            t = task.get("task", "")
-            data = task.get("data", "")
-
-            logger.info(f"handling task {t}")
+    async def _task_handler(
+        self, tasks, source: EvidenceStore, deadline: Deadline = None
+    ):
+        """
+        Write every planned section at the same time (at most max_concurrency)
+        and put them together in plan order.
+        With a deadline only the sections that fit in the time left are written,
+        sections still running just before the deadline are dropped.
+        """
+        if not isinstance(tasks, list) or not tasks:
+            logger.error(f"invalid report plan {tasks}")
+            return ""
+
+        deadline = deadline if deadline is not None else Deadline()
+        if deadline.bounded:
+            waves = max(1, int(deadline.remaining() // self.section_seconds))
+            limit = waves * self.max_concurrency
+            if len(tasks) > limit:
+                logger.warning(f"time for {limit} of {len(tasks)} sections only")
+                tasks = tasks[:limit]
+
+        def on_result(index, content):
+            emit(SectionEvent(index=index, task=tasks[index].get("task", ""), content=content))
+
+        # every attempt gets an empty history , the prompt carries everything it needs.
+        # a failed or malformed answer is retried on its own , after the last retry
+        # the section is left empty
+        prompts = [self._section_prompt(tasks, task, source) for task in tasks]
+        # keep a second to hand the partial report back before the server gives up
+        results = await self.model.abatch_completion(
+            prompts,
+            max_concurrency=self.max_concurrency,
+            retries=self.retries,
+            parse=lambda res: self._extract_response(res)["content"],
+            timeout=deadline.timeout(margin=1.0),
+            on_result=on_result,
+        )
+        dropped = sum(isinstance(r, asyncio.TimeoutError) for r in results)
+        if dropped:
+            logger.warning(f"deadline reached , dropping {dropped} sections")
+        for index, r in enumerate(results):
+            if isinstance(r, Exception) and not isinstance(r, asyncio.TimeoutError):
+                logger.error(f"giving up section {index} after {self.retries + 1} attempts")
+        sections = ["" if isinstance(r, Exception) else r for r in results]
+        final_report = "".join("\n" + section for section in sections)
+        logger.info("final report ... ")
+        return final_report
 
-            source = self.get_source(data)
+    def _section_prompt(self, tasks, task, source: EvidenceStore) -> str:
+        t = task.get("task", "")
+        data = task.get("data", "")
 
-            logger.info(f"reading sources ... {source}")
+        logger.info(f"handling task {t}")
 
-            prompt = report_task(tasks, t, source)
-            res = self.model.completion(prompt)
-            logger.info(f"geting response {res}")
-            res = self._extract_response(res)
+        source = self.get_source(data, source)
 
-            logger.info(f"getting response {res}")
-            try:
-                final_report += "\n"
-                final_report += res["content"]
-                logger.info(res)
-                logger.info(type(res))
-            except:
-                final_report += ""
-            logger.info("final report ... ")  # maybe yield final report here ?
+        logger.info(f"reading sources ... {source}")
 
-        return final_report
+        return report_task(tasks, t, source)
 
     def _get_relevant_data(self):
         pass
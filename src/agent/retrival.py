@@ -1,14 +1,16 @@
 from ..RAG.chrome import VectorSearch
 from .agent import Agent
+from .context import RunContext
 from ..model import Model
 from ..prompt import retrieval_prompt
-from ..utils import read_config
+from ..utils import read_config, span
 
 from markitdown import MarkItDown
 
 import os
 import string
 import json
+import asyncio
 
 import logging
 
@@ -25,52 +27,72 @@ class RAG_agent(Agent):
     """
 
     def __init__(
-        self, model: Model, path: str = "./local_db", filelist="./local_files"
+        self,
+        model: Model,
+        path: str = "./local_db",
+        filelist="./local_files",
+        max_concurrency: int = 4,
     ):
         logger.info("Initalize RAG agent")
         self.model = model
         self.db = VectorSearch(path=path)
         # TODO: maybe don't use hard reset ?
+        # the agent is long lived so this only happens once per process
         self.db.reset()
         self.tool_list = ["add_document", "query", "reset"]
 
+        # file path -> mtime of the version already in the db
+        self._indexed: dict[str, float] = {}
+        self._index_lock = asyncio.Lock()
+
         config = read_config()
         self.filelist = config.get("db", filelist)
+        self.max_concurrency = config.get("max_concurrency", max_concurrency)
 
         self.name = "local-retrieval"
         self.description = "read local files and get summary"
 
-    async def run(self, task: str, data: str) -> str:
+    async def run(self, task: str, data: str, ctx: RunContext = None) -> str:
         """
         one way work flow
         -- given a filelist
-        read every documents from the file list
+        read every new or changed document from the file list
         -- do query
         use model to form {} format
         """
         logger.info("retrival running ...")
-        mk = MarkItDown()
-        for root, dirs, files in os.walk(self.filelist):
-            for file in files:
-                logger.info(f"handling the file{file}")
-                self._file_handler(os.path.join(root, file), mk)
-
-        result = self.db.query(task, 2)
+        ctx = ctx if ctx is not None else RunContext()
+        if ctx.work_expired():
+            logger.warning("deadline reached , skip retrieval")
+            return {"agent": "planner", "data": data, "task": ""}
+        async with self._index_lock:
+            await asyncio.to_thread(self._index_files)
+
+        # the embedding and the chroma query block , the loop serves the other runs
+        result = await asyncio.to_thread(self.db.query, task, 2)
         logger.info(f"get the result {result}")
-        for i, docs in enumerate(result["documents"]):
-
-            """
-            TODO: refactor use localRAG class
-            """
-            file_path = result["metadatas"][0][i]["file"]  # fix: index correctly
-            prompt = retrieval_prompt(docs, file_path)
-            res = self.model.completion(prompt)
-            logger.info(f"response from llm: {res}")
-            res = self._extract_response(res)
+        """
+        TODO: refactor use localRAG class
+        """
+        # one prompt per retrieved chunk , all of them at the same time
+        docs = result["documents"][0] if result["documents"] else []
+        files = [meta["file"] for meta in result["metadatas"][0]] if docs else []
+        prompts = [retrieval_prompt(doc, file) for doc, file in zip(docs, files)]
+        with span("retrieval.summary", documents=len(prompts)):
+            answers = await self.model.abatch_completion(
+                prompts,
+                max_concurrency=self.max_concurrency,
+                parse=self._extract_response,
+                timeout=ctx.work_timeout(),
+            )
+        if any(isinstance(res, asyncio.TimeoutError) for res in answers):
+            logger.warning("deadline reached , keep the documents summarized so far")
+        for file_path, res in zip(files, answers):
             logger.info(f"getting response {res}")
-            # res = json.loads(res)
-            # logger.info(f"loading ... {res} ")
-            data.append(res)
+            if not isinstance(res, dict):
+                continue
+            res.setdefault("url", file_path)
+            data.append(ctx.evidence.add_dict(res))
 
         return {"agent": "planner", "data": data, "task": ""}
 
@@ -92,6 +114,23 @@ class RAG_agent(Agent):
     def _todo(self, task):
         pass
 
+    def _index_files(self):
+        """
+        add the files that are new or changed since they were last indexed
+        """
+        mk = MarkItDown()
+        for root, dirs, files in os.walk(self.filelist):
+            for file in files:
+                path = os.path.join(root, file)
+                mtime = os.path.getmtime(path)
+                if self._indexed.get(path) == mtime:
+                    continue
+                logger.info(f"handling the file{file}")
+                if path in self._indexed:
+                    self.db.delete_file(path)
+                self._file_handler(path, mk)
+                self._indexed[path] = mtime
+
     def _file_handler(self, filepath, mk: MarkItDown):
         result = mk.convert(filepath)
         result = result.markdown
@@ -99,6 +138,8 @@ class RAG_agent(Agent):
         for i, ch in enumerate(result):
             temp += ch
             if i % 1500 == 0 and i != 0:
-                self.db.add_document(temp, str(i), {"file": filepath})
+                self.db.upsert_document(temp, f"{filepath}:{i}", {"file": filepath})
 
-        self.db.add_document(temp, str(len(result) + 1), {"file": filepath})
+        self.db.upsert_document(
+            temp, f"{filepath}:{len(result) + 1}", {"file": filepath}
+        )
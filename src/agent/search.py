@@ -1,23 +1,26 @@
 from .agent import Agent
+from .context import RunContext
 from ..model import Model
 
 from ..prompt.searcher import search_plan
 
 from ..browser.crawl_ai import Crawl
+from ..utils import span
 
 from collections import deque
 import json
 
-import time 
+import asyncio
 
 import logging 
 logger = logging.getLogger(__name__)
 
 class Search_agent(Agent):
-    def __init__(self, model:Model, k: int = 10):
+    def __init__(self, model:Model, k: int = 10, page_seconds: float = 15):
         """
         take some default URL for search
         k: number of steps
+        page_seconds: rough time to summarize one page, fewer pages are read near a deadline
         """
         self.model = model
         self.crawl = Crawl(model=model)
@@ -30,16 +33,14 @@ class Search_agent(Agent):
             "https://scholar.google.com",
         ]
 
-        self.todo = deque()
         self.step = 10
-        self.url_list = []
-        self.db = [] 
+        self.page_seconds = page_seconds
         self.name = "searcher"
     
     def set_name(self , name):
         self.name = name
 
-    async def run(self, task, data) -> str:
+    async def run(self, task, data, ctx: RunContext = None) -> str:
         """
         Search function need to user the brower methods to search relevant contents
         - note that search agent should have it's own planner to plan search with what links
@@ -59,19 +60,23 @@ class Search_agent(Agent):
                 AGENT: PLANNER
         """
         logger.info("SEARCHER: RUNNING ")
-        logger.info(f"{self.todo} testing..")
-        steps =self._plan(task)
+        # the agent is shared between runs, everything of this task lives in state
+        ctx = ctx or RunContext()
+        state = _SearchState(self.model.fork(), ctx)
+        steps = await self._plan(task, state)
         tools = {} 
-        url_list = []
         cur_task = 0
 
         cur_db = [] 
         for d in data:
-            cur_db.append(d["summary_list"])
+            cur_db.append(d.get("brief_summary", ""))
         query = task[:]
 
-        while cur_task < len(self.todo):
-            new_task = self.todo[cur_task]
+        while cur_task < len(state.todo):
+            if ctx.work_expired():
+                logger.warning("deadline reached , stop searching")
+                break
+            new_task = state.todo[cur_task]
             logger.info(f"new task: {new_task}")
             tool , keyword , search_engine = new_task.get('tool', '') , new_task.get('keyword' , '') , new_task.get("search_engine" , "")
 
@@ -79,16 +84,15 @@ class Search_agent(Agent):
                 case "url_search":
                     urls = await self._search_url(keyword , cur_db , search_engine)
                     for url in urls:
-                        self.url_list.append(url)
+                        state.url_list.append(url)
                 case "page_content":
-                    #logger.info(self.url_list)
-                    await self._page_content(query)
-                    self.url_list = [] 
+                    await self._page_content(query, state)
+                    state.url_list = [] 
                 case _:
                     logger.info("TOOL NOT FOUND")
             cur_task +=1 
 
-        return {"agent": "planner" , "data":self.db , "task":""}
+        return {"agent": "planner" , "data":state.db , "task":""}
 
     def get_send_format(self):
         pass
@@ -96,24 +100,25 @@ class Search_agent(Agent):
     def get_recv_format(self):
         pass
 
-    def _plan(self , task:str , k:int=6):
+    async def _plan(self , task:str , state:"_SearchState" , k:int=6):
         """
         Searcher planner
         """
-        prompt = search_plan(task , self.todo , k)
+        prompt = search_plan(task , state.todo , k)
         logger.info(f"task {task}")
         logger.info(prompt)
 
-        response = self.model.completion(prompt)
+        with span("searcher.plan"):
+            response = await state.model.acompletion(prompt)
         logger.info(f"searcher response: {response}")
-        time.sleep(3) ## foo foo solution
+        await asyncio.sleep(3) ## foo foo solution
         todo_list = (self._extract_response(response))
         
         logger.info(todo_list)
         k -= len(todo_list)
         for todo in todo_list:
-            self.todo.append(todo)
-        logger.info(f"self.todo in searcher: {self.todo}") 
+            state.todo.append(todo)
+        logger.info(f"todo in searcher: {state.todo}") 
         #logger.info(tasks)
         return k
 
@@ -130,32 +135,46 @@ class Search_agent(Agent):
 
         logger.info("Search URL handling ... ")
 
-        result = await self.crawl.get_url_llm("https://google.com/search?q="+query , query)
+        with span("searcher.url_search", query=query) as s:
+            result = await self.crawl.get_url_llm("https://google.com/search?q="+query , query)
+            s.set(urls=len(result))
         return result
 
-    async def _page_content(self, query):
+    async def _page_content(self, query, state:"_SearchState"):
         logger.info("page content handling ... ")
-        if not self.url_list:
+        if not state.url_list:
             return None # no url
         urls =[]
-        for element in self.url_list:
+        for element in state.url_list:
             urls.append(element.get('url' , ""))
-        summary_list = await self.crawl.get_summary(urls , query)
+        deadline = state.ctx.deadline
+        if deadline.bounded:
+            # pages are read together , keep the ones that fit in the time left
+            limit = max(1, int(state.ctx.work_remaining() // self.page_seconds) * 2)
+            urls = urls[:limit]
+        with span("searcher.page_content", urls=len(urls)):
+            summary_list = await self.crawl.get_summary(
+                urls , query , timeout=state.ctx.work_timeout()
+            )
 
         for summary in summary_list:
-            summary['url'] = summary.get('url', "")
-            summary['title'] = summary.get('title', "")
-            summary['summary'] = summary.get('summary', "")
-            summary['brief_summary'] = summary.get('brief_summary', "")
-            summary['keywords'] = summary.get('keywords', [])
-            self.db.append(
-                {
-                    "title": summary['title'],
-                    "brief_summary" : summary['brief_summary'],
-                    "summary":summary['summary'],
-                    "keywords":summary["keywords"],
-                    "url": summary["url"],
-                }
-            )
+            # the crawler answers "error" for pages that are not relevant
+            if not isinstance(summary, dict) or summary.get('title') == "error":
+                continue
+            state.db.append(state.ctx.evidence.add_dict(summary))
         return summary_list
         
+
+
+class _SearchState:
+    """
+    state of one search task: its model fork, run context, to do list, urls waiting
+    for page_content and the evidence found so far
+    """
+
+    def __init__(self, model: Model, ctx: RunContext):
+        self.model = model
+        self.ctx = ctx
+        self.todo = deque()
+        self.url_list = []
+        self.db = []
@@ -52,7 +52,7 @@ class Vision(Agent):
             raise ValueError("Invalid image source path or URL.")
         return img.convert("RGB")
 
-    async def run(self, task: str, data: list[dict]):
+    async def run(self, task: str, data: list[dict], ctx=None):
         """
         Process a list of image items. Each image is saved locally, then a textual
         prompt describing the task and image path is passed to model.completion().
@@ -1,4 +1,5 @@
 import asyncio
+import json
 from typing import Dict, Any, Optional
 from ..core.config import read_config
 
@@ -7,6 +8,10 @@ _model_cache: Dict[str, Any] = {}
 _config_cache: Optional[Dict[str, Any]] = None
 _cache_lock = asyncio.Lock()
 
+# Warm planner + agents per config, shared by every report request
+_agent_cache: Dict[str, Any] = {}
+_agent_lock = asyncio.Lock()
+
 async def get_or_create_model():
     """Get cached model or create new one. Eliminates 7+ second model loading delay."""
     global _model_cache, _config_cache, _cache_lock
@@ -31,14 +36,48 @@ async def get_or_create_model():
         return model
 
 async def get_user_model():
-    """Create a dedicated model instance for user session"""
-    model = await get_or_create_model()
+    """Create a dedicated model instance for user session.
+    The session gets a fork of the cached model for the current config: its own
+    history over the pooled clients, so no new connections are opened"""
     try:
-        # Create a fresh model instance
         config = await asyncio.to_thread(read_config)
-        from ...factory import Factory
-        user_model = await asyncio.to_thread(Factory.get_model, config["provider"], config["model"])
-        return user_model
+        cache_key = f"{config['provider']}_{config['model']}"
+        async with _cache_lock:
+            model = _model_cache.get(cache_key)
+            if model is None:
+                from ...factory import Factory
+                model = await asyncio.to_thread(Factory.get_model, config["provider"], config["model"])
+                _model_cache[cache_key] = model
+        return model.fork()
     except:
         # Fallback: use the cached model
-        return model
+        return (await get_or_create_model()).fork()
+
+def build_agents(config: Dict[str, Any]):
+    """Create the planner and the configured agents"""
+    from ...factory import Factory
+    from ...agent import Planner
+
+    m = Factory.get_model(config["provider"], config["model"])
+    planner = Planner(
+        m,
+        plan_cache_size=config.get("plan_cache_size", 128),
+        plan_cache_ttl=config.get("plan_cache_ttl", 3600),
+        stream_plan=config.get("stream_plan", True),
+    )
+    agents = []
+    for agent in config["agents"]:
+        m = Factory.get_model(config["provider"], config["model"])
+        agents.append(Factory.get_agent(agent, m))
+    return planner, agents
+
+async def get_or_create_agents(config: Dict[str, Any]):
+    """Get the warm planner and agents for this config, build them on first use.
+    Agents keep per-run state in the RunContext so one set serves concurrent requests."""
+    cache_key = json.dumps(
+        [config["provider"], config["model"], config["agents"], config.get("db", "")]
+    )
+    async with _agent_lock:
+        if cache_key not in _agent_cache:
+            _agent_cache[cache_key] = await asyncio.to_thread(build_agents, config)
+        return _agent_cache[cache_key]
@@ -0,0 +1,142 @@
+from fastapi import APIRouter, Form, HTTPException
+from fastapi.responses import JSONResponse
+from typing import Optional
+import json
+import logging
+from ..models.schemas import Message
+from ..core.config import read_config
+from ..core.model_cache import get_or_create_agents
+from ..services.job_service import Job, JobQueue, QueueFull, DONE, FAILED
+from .misc import get_checkpoint_store
+
+from ...generate_report import generate_report, resume_report
+from ...router.checkpoint import CheckpointStore
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+_job_queue: Optional[JobQueue] = None
+
+def get_job_queue() -> JobQueue:
+    """Job queue shared by every request, report jobs run on the "report" queue"""
+    global _job_queue
+    if _job_queue is None:
+        config = read_config()
+        _job_queue = JobQueue(
+            CheckpointStore(
+                config.get("job_dir", "./jobs"),
+                ttl=config.get("job_ttl", 86400),
+            ),
+            workers=config.get("job_workers", 4),
+            limits=config.get("job_queues", {"report": 2}),
+            max_queued=config.get("job_max_queued", 100),
+        )
+        _job_queue.register("report", run_report_job)
+    return _job_queue
+
+async def run_report_job(job: Job):
+    """Run a report job , a job that was interrupted by a restart continues from its checkpoint"""
+    config = read_config()
+    planner, agents = await get_or_create_agents(config)
+    checkpoint = get_checkpoint_store()
+    deadline = job.params.get("deadline")
+    if deadline is None:
+        deadline = config.get("report_deadline")
+
+    # the job id is the run id of its checkpoint
+    if job.attempts > 1:
+        try:
+            return await resume_report(
+                job.id,
+                agents,
+                checkpoint,
+                max_concurrency=config.get("max_concurrency", 4),
+                deadline=deadline,
+                reporter_reserve=config.get("reporter_reserve", 30),
+                planner=planner,
+            )
+        except KeyError:
+            logger.info(f"no checkpoint for job {job.id} , starting again")
+
+    return await generate_report(
+        job.params["query"],
+        planner,
+        agents,
+        max_concurrency=config.get("max_concurrency", 4),
+        run_id=job.id,
+        checkpoint=checkpoint,
+        deadline=deadline,
+        speculative=config.get("speculative_search", False),
+        reporter_reserve=config.get("reporter_reserve", 30),
+    )
+
+def _get_job(job_id: str) -> Job:
+    try:
+        job = get_job_queue().get(job_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid job id")
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
+def _job_status(job: Job) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "queue": job.queue,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "progress": {
+            "tasks": job.progress.get("tasks", 0),
+            "finished": job.progress.get("finished", 0),
+            "sections": len(job.progress.get("sections", {})),
+        },
+        "error": job.error,
+    }
+
+@router.post("/jobs/report/{query}")
+async def submit_report_job(
+    query: str,
+    messages: str = Form(...),
+    deadline: Optional[float] = Form(None),
+    queue: str = Form("report"),
+):
+    """Queue a report and return its job id at once"""
+    try:
+        [Message(**msg) for msg in json.loads(messages)]
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON in messages field")
+
+    jobs = get_job_queue()
+    if queue not in jobs.limits:
+        raise HTTPException(status_code=400, detail=f"Unknown queue '{queue}'")
+    try:
+        job = jobs.submit("report", {"query": query, "deadline": deadline}, queue=queue)
+    except QueueFull:
+        raise HTTPException(status_code=429, detail="Too many queued jobs")
+    return {"job_id": job.id, "status": job.status}
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Status and progress of a job"""
+    return _job_status(_get_job(job_id))
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Report of a finished job , 202 with the sections written so far while it runs"""
+    job = _get_job(job_id)
+    if job.status == DONE:
+        return {"job_id": job.id, "status": job.status, "report": job.result}
+    if job.status == FAILED:
+        raise HTTPException(status_code=500, detail=job.error or "Job failed")
+    response = _job_status(job)
+    response["partial_report"] = job.partial_result()
+    return JSONResponse(status_code=202, content=response)
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    _get_job(job_id)
+    job = get_job_queue().cancel(job_id)
+    return _job_status(job)
@@ -1,14 +1,19 @@
 from fastapi import APIRouter, Form, File, UploadFile, HTTPException
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 import json
 import logging
+import uuid
 from ..models.schemas import Message
 from ..core.config import read_config
+from ..core.model_cache import get_or_create_agents
+from ..services.semantic_cache import get_semantic_cache
 
 from ...factory import Factory
-from ...generate_report import generate_report
+from ...generate_report import generate_report, stream_report, resume_report
+from ...router.checkpoint import CheckpointStore
 from ...model import Model
-from ...agent import Planner , Agent
+from ...utils import start_trace
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -46,9 +51,23 @@ async def report(
     query: str,
     messages: str = Form(...),
     files: Optional[List[UploadFile]] = File(None),
+    debug: bool = Form(False),
+    deadline: Optional[float] = Form(None),
+    run_id: Optional[str] = Form(None),
 ):
-    """Generate report - SAME ENDPOINT"""
+    """Generate report - SAME ENDPOINT
+    debug: attach the span timeline of the run to the response
+    deadline: seconds the report may take, a partial report is returned when it runs out
+    run_id: id of the run chosen by the client, so it can resume a run that failed
+            before any response came back, a new id by default"""
     logging.info("start generating report")
+    if run_id:
+        try:
+            exists = get_checkpoint_store().load(run_id) is not None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid run id")
+        if exists:
+            raise HTTPException(status_code=409, detail=f"Run '{run_id}' already exists")
     try:
         messages_list = json.loads(messages)
         validated_messages = [Message(**msg) for msg in messages_list]
@@ -60,21 +79,82 @@ async def report(
                 file_details.append({"filename": file.filename, "size": len(content)})
         
         logging.info("loading main ... ")
-        r = await main(query, validated_messages)
-        return {
+        run_id = run_id or uuid.uuid4().hex
+        with start_trace("report", query=query, run_id=run_id) as trace:
+            r = await main(query, validated_messages, run_id=run_id, deadline=deadline)
+
+        trace_dir = read_config().get("trace_dir", "")
+        if trace_dir:
+            trace.export(trace_dir)
+
+        response = {
             "report": r,
+            "run_id": run_id,
             "files_received": file_details,
             "messages_received": [msg.dict() for msg in validated_messages],
         }
+        if debug:
+            response["trace"] = trace.to_dict()
+        return response
     except json.JSONDecodeError:
         logging.error("invalid JSON in messages field")
         return {"error": "Invalid JSON in messages field"}
 
+@router.post("/report/resume/{run_id}")
+async def report_resume(run_id: str, deadline: Optional[float] = Form(None)):
+    """Resume a report run from its last checkpoint"""
+    config = read_config()
+    planner, agents = await get_or_create_agents(config)
+    try:
+        r = await resume_report(
+            run_id,
+            agents,
+            get_checkpoint_store(),
+            max_concurrency=config.get("max_concurrency", 4),
+            deadline=deadline if deadline is not None else config.get("report_deadline"),
+            reporter_reserve=config.get("reporter_reserve", 30),
+            planner=planner,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid run id")
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Run '{run_id}' not found")
+    return {"report": r, "run_id": run_id}
+
+@router.post("/report_stream/{query}")
+async def report_stream(
+    query: str,
+    messages: str = Form(...),
+    files: Optional[List[UploadFile]] = File(None),
+    deadline: Optional[float] = Form(None),
+):
+    """Generate report and stream its progress as newline delimited JSON events"""
+    try:
+        messages_list = json.loads(messages)
+        [Message(**msg) for msg in messages_list]
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON in messages field")
+
+    async def event_stream():
+        config = read_config()
+        planner, agents = await get_or_create_agents(config)
+        async for event in stream_report(
+            query,
+            planner,
+            agents,
+            max_concurrency=config.get("max_concurrency", 4),
+            deadline=deadline if deadline is not None else config.get("report_deadline"),
+            speculative=config.get("speculative_search", False),
+            reporter_reserve=config.get("reporter_reserve", 30),
+        ):
+            yield event.model_dump_json() + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
 @router.get("/news/{category}")
 def get_news(category: str):
     """Get news - SAME ENDPOINT"""
-    from ...browser.googlesearch import GoogleSearch as DuckSearch
-    res = DuckSearch().today_new(category)
+    res = get_news_search().today_new(category)
     return {"news": res}
 
 @router.get("/messags_record")
@@ -91,6 +171,15 @@ async def quick_response_logic(
 ):
     """Quick response logic - original function"""
     config = read_config()
+
+    # a follow up question depends on the conversation , only first questions are shared
+    cache = get_semantic_cache() if len(messages) <= 1 and not files else None
+    namespace = f"quick:{config['provider']}:{config['model']}"
+    if cache is not None:
+        res = await cache.get(query, namespace)
+        if res is not None:
+            logger.info(f"semantic cache hit for {query}")
+            return res
     
     quick_model: Model = Factory.get_model(config["provider"], config["model"])
     quick_model.messages = messages[::-1]
@@ -101,30 +190,61 @@ async def quick_response_logic(
     from ...browser.googlesearch import GoogleSearch as DuckSearch
     from ...prompt.quick_search import quick_search_prompt
     
-    search_result = DuckSearch().search_result(query)
+    search_result = await DuckSearch().asearch_result(query)
     prompt = quick_search_prompt(query, search_result)
-    res = quick_model.completion(prompt)
+    res = await quick_model.acompletion(prompt)
+    if cache is not None:
+        await cache.set(query, res, namespace)
     return res
 
-async def main(query, api: str = None):
-    """Main function - original logic"""
+_news_search = None
+
+def get_news_search():
+    """Search backend shared by every /news request"""
+    global _news_search
+    if _news_search is None:
+        from ...browser.googlesearch import GoogleSearch as DuckSearch
+        _news_search = DuckSearch()
+    return _news_search
+
+_checkpoint_store: Optional[CheckpointStore] = None
+
+def get_checkpoint_store() -> CheckpointStore:
+    """Checkpoint store shared by every report run"""
+    global _checkpoint_store
+    if _checkpoint_store is None:
+        config = read_config()
+        _checkpoint_store = CheckpointStore(
+            config.get("checkpoint_dir", "./checkpoints"),
+            ttl=config.get("checkpoint_ttl", 86400),
+        )
+    return _checkpoint_store
+
+async def main(query, api: str = None, run_id: str = "", deadline: float = None):
+    """Main function - original logic
+    run_id: checkpoint the run under this id so it can be resumed
+    deadline: time budget of the run in seconds , report_deadline of the config by default"""
     config = read_config()
     logging.info("finish reading config ...")
     
-    
-    m = Factory.get_model(config["provider"], config["model"])
-    planner = Planner(m)
-    logging.info("creating agents ... ")
-    agents = []
-    
-    for agent in config["agents"]:
-        m = Factory.get_model(config["provider"], config["model"])
-        agents.append(Factory.get_agent(agent, m))
-    
-    logging.info(f"finish creating {agents}")
+    planner, agents = await get_or_create_agents(config)
     logging.info("generating report ... ")
     
-    r = await generate_report(query, planner, agents)
+    checkpoint = None
+    if run_id:
+        checkpoint = get_checkpoint_store()
+        checkpoint.prune()
+    r = await generate_report(
+        query,
+        planner,
+        agents,
+        max_concurrency=config.get("max_concurrency", 4),
+        run_id=run_id,
+        checkpoint=checkpoint,
+        deadline=deadline if deadline is not None else config.get("report_deadline"),
+        speculative=config.get("speculative_search", False),
+        reporter_reserve=config.get("reporter_reserve", 30),
+    )
     
     logging.info("finish generating report")
     return r
\ No newline at end of file
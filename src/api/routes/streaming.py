@@ -7,6 +7,7 @@ import logging
 from ..models.schemas import Message
 from ..core.model_cache import get_user_model
 from ..core.config import read_config
+from ..services.semantic_cache import get_semantic_cache, stream_answer
 from ...prompt.quick_search import quick_search_prompt
 
 router = APIRouter()
@@ -28,6 +29,18 @@ async def stream_data(
 
         needs_search = "search:" in query
 
+        # a follow up question depends on the conversation , only first questions are shared
+        cache = get_semantic_cache() if len(validated_messages) <= 1 and not files else None
+        config = read_config()
+        namespace = f"stream:{'search' if needs_search else 'chat'}:{config.get('provider')}:{config.get('model')}"
+        if cache is not None:
+            answer = await cache.get(query, namespace)
+            if answer is not None:
+                logger.info(f"[{session_id}] semantic cache hit")
+                for chunk in stream_answer(answer):
+                    yield chunk
+                return
+
         # Get user model
         model_task = asyncio.create_task(get_user_model())
 
@@ -36,7 +49,7 @@ async def stream_data(
             async def search_pipeline():
                 from ...browser.googlesearch import GoogleSearch as DuckSearch
                 search_instance = DuckSearch()
-                return await asyncio.to_thread(search_instance.search_result, query)
+                return await search_instance.asearch_result(query)
 
             search_task = asyncio.create_task(search_pipeline())
             model, search_result = await asyncio.gather(model_task, search_task)
@@ -54,22 +67,25 @@ async def stream_data(
         logger.info(f"[{session_id}] Finished Prompt preparation, starting completion stream")
 
         # Stream completion
-        completion_stream = model.completion_stream(prompt)
+        completion_stream = model.acompletion_stream(prompt)
         chunk_count = 0
         seen_content = set()
+        chunks = []
 
-        for chunk in completion_stream:
+        async for chunk in completion_stream:
             if chunk and chunk.strip():
                 chunk_hash = hash(chunk.strip())
                 if chunk_hash not in seen_content:
                     seen_content.add(chunk_hash)
                     chunk_count += 1
+                    chunks.append(chunk)
                     yield chunk
-                    await asyncio.sleep(0)
 
         if chunk_count == 0:
             logger.warning(f"[{session_id}] No chunks received from model")
             yield "No response generated"
+        elif cache is not None:
+            await cache.set(query, "".join(chunks), namespace)
 
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON in messages field")
@@ -109,12 +125,11 @@ async def stream_academic_data(
         from ...browser.googlesearch import GoogleSearch as DuckSearch
         from ...prompt.quick_search import quick_search_prompt
 
-        search_result = DuckSearch().search_result("site:arxiv.org " + query)
+        search_result = await DuckSearch().asearch_result("site:arxiv.org " + query)
         prompt = quick_search_prompt(query, search_result)
 
-        for chunk in model.completion_stream(prompt):
+        async for chunk in model.acompletion_stream(prompt):
             yield chunk
-            await asyncio.sleep(0)
 
     except Exception as e:
         yield f"Error: {str(e)}"
@@ -0,0 +1,321 @@
+"""
+Background jobs
+
+submit() stores the job and returns its id at once, a pool of workers runs
+the jobs outside the HTTP request. Every named queue has its own concurrency
+limit and all queues share the size of the pool, so many reports can be
+queued while only a predictable number runs at the same time.
+
+Jobs are saved as JSON files, queued and running jobs are put back
+in their queue when the process starts again. Only unfinished jobs are kept
+in memory, a finished one is read back from its file.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from uuid import uuid4
+
+from ...router import events
+from ...router.checkpoint import CheckpointStore
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(
+        self,
+        kind: str,
+        params: Dict[str, Any],
+        queue: str = "default",
+        id: str = "",
+    ):
+        self.id = id or uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.queue = queue
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.attempts = 0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        # what the run has done so far, filled from its events
+        self.progress: Dict[str, Any] = {"tasks": 0, "finished": 0, "sections": {}}
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def partial_result(self) -> str:
+        """
+        the sections written so far in report order
+        """
+        sections = self.progress.get("sections", {})
+        return "".join(
+            "\n" + sections[i] for i in sorted(sections, key=lambda i: int(i))
+        )
+
+    def on_event(self, event):
+        if isinstance(event, events.PlanEvent):
+            self.progress["tasks"] = len(event.tasks)
+        elif isinstance(event, events.AgentFinishEvent):
+            self.progress["finished"] += 1
+        elif isinstance(event, events.SectionEvent):
+            self.progress["sections"][str(event.index)] = event.content
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "queue": self.queue,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "attempts": self.attempts,
+            "result": self.result,
+            "error": self.error,
+            "progress": self.progress,
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "Job":
+        job = cls(
+            state["kind"],
+            state.get("params", {}),
+            queue=state.get("queue", "default"),
+            id=state["id"],
+        )
+        for key in (
+            "status",
+            "created_at",
+            "started_at",
+            "finished_at",
+            "attempts",
+            "result",
+            "error",
+            "progress",
+        ):
+            if key in state:
+                setattr(job, key, state[key])
+        return job
+
+
+Handler = Callable[[Job], Awaitable[Any]]
+
+
+class JobQueue:
+    def __init__(
+        self,
+        store: CheckpointStore,
+        workers: int = 4,
+        limits: Dict[str, int] = None,
+        max_queued: int = 100,
+    ):
+        """
+        store: where jobs are saved
+        workers: how many jobs may run at the same time over all queues
+        limits: {queue name: how many of its jobs may run at the same time} , 1 for other queues
+        max_queued: submit raises QueueFull when this many jobs are waiting
+        """
+        self.store = store
+        self.limits = dict(limits or {})
+        self.max_queued = max_queued
+        # the jobs that are queued or running
+        self.jobs: Dict[str, Job] = {}
+        self._handlers: Dict[str, Handler] = {}
+        self._pool = asyncio.Semaphore(max(1, workers))
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: list[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._started = False
+        self._stopping = False
+
+    def register(self, kind: str, handler: Handler):
+        """
+        handler(job) runs a job of this kind and returns its result
+        """
+        self._handlers[kind] = handler
+
+    def start(self):
+        """
+        start the workers and put back the jobs that were waiting or running
+        before a restart. Needs a running event loop
+        """
+        if self._started:
+            return
+        self._started = True
+        self.store.prune()
+        for job_id in self.store.ids():
+            state = self.store.load(job_id)
+            if state is None:
+                continue
+            try:
+                job = Job.from_dict(state)
+            except KeyError:
+                logger.error(f"invalid job file {job_id}")
+                continue
+            if job.finished:
+                continue
+            logger.info(f"requeue job {job.id} ({job.status})")
+            job.status = QUEUED
+            self.jobs[job.id] = job
+            self._queue(job.queue).put_nowait(job.id)
+
+    async def stop(self):
+        """
+        stop the workers , the running jobs stay queued for the next start
+        """
+        self._stopping = True
+        for task in list(self._running.values()) + self._workers:
+            task.cancel()
+        await asyncio.gather(
+            *self._running.values(), *self._workers, return_exceptions=True
+        )
+        self._workers.clear()
+        self._queues.clear()
+        self._started = self._stopping = False
+
+    def submit(
+        self, kind: str, params: Dict[str, Any], queue: str = "default"
+    ) -> Job:
+        if kind not in self._handlers:
+            raise ValueError(f"unknown job kind {kind}")
+        waiting = sum(q.qsize() for q in self._queues.values())
+        if waiting >= self.max_queued:
+            raise QueueFull(f"{waiting} jobs waiting")
+
+        self.start()
+        job = Job(kind, params, queue)
+        self.jobs[job.id] = job
+        self._save(job)
+        self._queue(queue).put_nowait(job.id)
+        logger.info(f"job {job.id} queued on {queue}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            state = self.store.load(job_id)
+            if state is not None:
+                job = Job.from_dict(state)
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        # a queued job is skipped by the worker that takes it
+        job.status = CANCELLED
+        job.finished_at = time.time()
+        self._save(job)
+        self.jobs.pop(job.id, None)
+        return job
+
+    def _queue(self, name: str) -> asyncio.Queue:
+        queue = self._queues.get(name)
+        if queue is None:
+            queue = self._queues[name] = asyncio.Queue()
+            for _ in range(max(1, self.limits.get(name, 1))):
+                self._workers.append(asyncio.create_task(self._worker(queue)))
+        return queue
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            job_id = await queue.get()
+            try:
+                job = self.jobs.get(job_id)
+                if job is None or job.status != QUEUED:
+                    continue
+                async with self._pool:
+                    if job.status != QUEUED:
+                        continue
+                    task = asyncio.create_task(self._run(job))
+                    self._running[job.id] = task
+                    try:
+                        # wait() doesn't raise when only the job was cancelled
+                        await asyncio.wait({task})
+                    except asyncio.CancelledError:
+                        # the worker itself is stopping
+                        task.cancel()
+                        raise
+                    finally:
+                        self._running.pop(job.id, None)
+            finally:
+                queue.task_done()
+
+    async def _run(self, job: Job):
+        job.status = RUNNING
+        job.started_at = time.time()
+        job.attempts += 1
+        self._save(job)
+
+        sink = asyncio.Queue()
+        token = events.set_sink(sink)
+        try:
+            work = asyncio.create_task(self._handlers[job.kind](job))
+        finally:
+            events.reset_sink(token)
+
+        getter = None
+        try:
+            while True:
+                getter = asyncio.create_task(sink.get())
+                done, _ = await asyncio.wait(
+                    {getter, work}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if getter not in done:
+                    getter.cancel()
+                    break
+                event = getter.result()
+                job.on_event(event)
+                if isinstance(event, (events.PlanEvent, events.SectionEvent)):
+                    self._save(job)
+            while not sink.empty():
+                job.on_event(sink.get_nowait())
+
+            job.result = work.result()
+            job.status = DONE
+        except asyncio.CancelledError:
+            work.cancel()
+            if self._stopping:
+                job.status = QUEUED
+            else:
+                job.status = CANCELLED
+                logger.info(f"job {job.id} cancelled")
+        except Exception as e:
+            logger.error(f"job {job.id} failed: {e}")
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            if getter is not None and not getter.done():
+                getter.cancel()
+            if job.finished:
+                job.finished_at = time.time()
+            self._save(job)
+            if job.finished:
+                self.jobs.pop(job.id, None)
+
+    def _save(self, job: Job):
+        try:
+            self.store.save(job.id, job.to_dict())
+        except Exception as e:
+            # the job keeps running even if it can't be saved
+            logger.error(f"saving job {job.id} failed: {e}")
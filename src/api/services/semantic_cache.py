@@ -0,0 +1,200 @@
+"""
+Semantic cache of quick answers
+
+The quick and stream endpoints ask the same questions with other words all
+the time. The normalized question is embedded on the CPU with the MiniLM model
+of controller/extraction.py and kept in a fixed size float32 matrix, a lookup
+is one matrix vector product. A previous answer is served when its question is
+close enough (cosine similarity above threshold) and younger than ttl.
+
+Answers are kept per namespace (endpoint , provider and model), and only for
+questions asked without a conversation before them.
+Turned on with "semantic_cache" in config.json, see get_semantic_cache().
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+import unicodedata
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from ..core.config import read_config
+from ...utils import LRUCache, span
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """
+    case , spacing , the "search:" marker and final punctuation don't change the question
+    """
+    query = unicodedata.normalize("NFKC", query or "").casefold()
+    query = query.replace("search:", " ")
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!.。？！ ")
+
+
+def _embed(texts: List[str]) -> np.ndarray:
+    # sentence_transformers is heavy , load it with the first question
+    from ..controller.extraction import get_model
+
+    return get_model().encode(
+        texts, show_progress_bar=False, normalize_embeddings=True
+    )
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        ttl: float = 900,
+        max_entries: int = 4096,
+        embed: Optional[Callable[[List[str]], np.ndarray]] = None,
+    ):
+        """
+        threshold: smallest cosine similarity between two questions with the same answer
+        ttl: seconds an answer is served , answers about the news get old fast
+        max_entries: size of the index , the oldest answer is replaced when it is full
+        embed: texts -> normalized vectors , MiniLM by default
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embed = embed or _embed
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # the matrix is allocated with the first vector , its size is known then
+        self._vectors: Optional[np.ndarray] = None
+        self._created = np.full(max_entries, -np.inf)
+        self._namespace = np.full(max_entries, -1, dtype=np.int32)
+        self._answers: List[Optional[str]] = [None] * max_entries
+        self._namespaces: Dict[str, int] = {}
+        self._next = 0
+        # get() then set() of a miss embeds the question once
+        self._embeddings = LRUCache(maxsize=256)
+
+    async def get(self, query: str, namespace: str = "") -> Optional[str]:
+        """
+        the answer of the closest fresh question , None on a miss
+        """
+        vector = await self._vector(query)
+        if vector is None:
+            return None
+        with span("semantic_cache.get", namespace=namespace) as s:
+            answer, score = self.lookup(vector, namespace)
+            s.set(hit=answer is not None, score=round(score, 4))
+        return answer
+
+    async def set(self, query: str, answer: str, namespace: str = ""):
+        if not answer:
+            return
+        vector = await self._vector(query)
+        if vector is not None:
+            self.add(vector, answer, namespace)
+
+    def lookup(self, vector: np.ndarray, namespace: str = "") -> tuple:
+        """
+        (answer , score) of the closest fresh vector , answer is None below the threshold
+        """
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if self._vectors is None or ns is None:
+                self.misses += 1
+                return None, 0.0
+            scores = self._vectors @ vector
+            valid = (self._namespace == ns) & (
+                self._created > time.monotonic() - self.ttl
+            )
+            if not valid.any():
+                self.misses += 1
+                return None, 0.0
+            scores = np.where(valid, scores, -np.inf)
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score < self.threshold:
+                self.misses += 1
+                return None, score
+            self.hits += 1
+            return self._answers[best], score
+
+    def add(self, vector: np.ndarray, answer: str, namespace: str = ""):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros(
+                    (self.max_entries, vector.shape[0]), dtype=np.float32
+                )
+            ns = self._namespaces.setdefault(namespace, len(self._namespaces))
+            # slots are filled in order , so the next one holds the oldest answer
+            slot = self._next
+            self._next = (slot + 1) % self.max_entries
+            self._vectors[slot] = vector
+            self._created[slot] = time.monotonic()
+            self._namespace[slot] = ns
+            self._answers[slot] = answer
+
+    def clear(self):
+        with self._lock:
+            self._created[:] = -np.inf
+            self._namespace[:] = -1
+            self._answers = [None] * self.max_entries
+            self._next = 0
+
+    def __len__(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            return int((self._created > now - self.ttl).sum())
+
+    async def _vector(self, query: str) -> Optional[np.ndarray]:
+        text = normalize_query(query)
+        if not text:
+            return None
+        vector = self._embeddings.get(text)
+        if vector is None:
+            try:
+                vectors = await asyncio.to_thread(self.embed, [text])
+            except Exception as e:
+                # no embedding model , every question is a miss
+                logger.warning(f"semantic cache can't embed the query: {e}")
+                return None
+            vector = np.asarray(vectors[0], dtype=np.float32)
+            self._embeddings.set(text, vector)
+        return vector
+
+
+def stream_answer(answer: str, size: int = 64):
+    """
+    a cached answer in chunks the size of what a model streams , cut at spaces
+    """
+    start = 0
+    while start < len(answer):
+        end = min(start + size, len(answer))
+        if end < len(answer):
+            space = answer.rfind(" ", start, end)
+            if space > start:
+                end = space + 1
+        yield answer[start:end]
+        start = end
+
+
+_semantic_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Semantic cache shared by the quick and stream endpoints , None when it is turned off"""
+    global _semantic_cache
+    config = read_config().get("semantic_cache", {})
+    if not config.get("enabled", False):
+        return None
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(
+            threshold=config.get("threshold", 0.92),
+            ttl=config.get("ttl", 900),
+            max_entries=config.get("max_entries", 4096),
+        )
+    return _semantic_cache
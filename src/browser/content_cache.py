@@ -0,0 +1,278 @@
+"""
+Process wide cache of page contents
+
+DuckSearch and GoogleSearch kept the text of the pages they fetched in a dict
+of their own , and as a new instance serves every request the same pages
+(wikipedia , the big news sites) were downloaded and parsed for almost every
+query. One ContentCache serves every backend and Crawl:
+    - least recently used eviction once the contents pass max_bytes
+    - an entry is fresh for ttl seconds , an expired entry with an ETag or a
+      Last-Modified is kept and the next fetch asks the site whether the
+      page changed (If-None-Match / If-Modified-Since) , a 304 makes it
+      fresh again without downloading or parsing the page
+    - optionally written through to a DiskCache , so a restart starts warm
+
+Every backend extracts other text from a page , entries are keyed on a kind
+("duckduckgo" , "google" , "pdf" ...) and the url.
+
+config.json:
+    "content_cache": {"max_mb": 32, "ttl": 3600, "persist": false,
+                      "path": "./cache/content.sqlite", "disk_max_mb": 256}
+"""
+
+from collections import OrderedDict
+from typing import Optional
+
+from ..utils import DiskCache, read_config
+
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# an expired entry that can be revalidated stays on disk this long
+STALE_SECONDS = 7 * 86400
+# bookkeeping of an entry besides its text
+_OVERHEAD = 200
+
+
+class ContentEntry:
+    def __init__(
+        self,
+        content: str,
+        expires_at: float,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        self.content = content
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def to_dict(self) -> dict:
+        return {
+            "content": self.content,
+            "expires_at": self.expires_at,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+        }
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires_at > time.time()
+
+    @property
+    def revalidatable(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+    @property
+    def size(self) -> int:
+        return (
+            len(self.content.encode("utf-8"))
+            + len(self.etag or "")
+            + len(self.last_modified or "")
+            + _OVERHEAD
+        )
+
+    def validators(self) -> dict:
+        """
+        headers of a conditional request for this page
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ContentCache:
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl: float = 3600,
+        store: Optional[DiskCache] = None,
+    ):
+        """
+        max_bytes: size of the contents in memory above which the least recently used are dropped
+        ttl: seconds a page is served without asking the site
+        store: where entries are written through , None keeps them in memory only
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.store = store
+        # key -> (entry , its size in bytes)
+        self._data: OrderedDict[str, tuple[ContentEntry, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    # --- lookups -----------------------------------------------------------
+
+    def get(self, kind: str, url: str) -> Optional[ContentEntry]:
+        """
+        the entry of url , fresh or not , None when there is none
+        """
+        key = _key(kind, url)
+        with self._lock:
+            item = self._data.get(key)
+            entry = None if item is None else item[0]
+            if item is not None:
+                self._data.move_to_end(key)
+        if entry is None and self.store is not None:
+            data = self.store.get(key)
+            if data is not None:
+                entry = ContentEntry(**data)
+                self._put(key, entry)
+        self._count(entry)
+        return entry
+
+    async def aget(self, kind: str, url: str) -> Optional[ContentEntry]:
+        """
+        get() , the disk is read in a thread
+        """
+        with self._lock:
+            in_memory = _key(kind, url) in self._data
+        if in_memory or self.store is None:
+            return self.get(kind, url)
+        return await asyncio.to_thread(self.get, kind, url)
+
+    # --- updates -----------------------------------------------------------
+
+    def set(
+        self,
+        kind: str,
+        url: str,
+        content: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        ttl: Optional[float] = None,
+    ) -> ContentEntry:
+        entry = ContentEntry(
+            content=content,
+            expires_at=time.time() + (self.ttl if ttl is None else ttl),
+            etag=etag,
+            last_modified=last_modified,
+        )
+        key = _key(kind, url)
+        self._put(key, entry)
+        self._persist(key, entry)
+        return entry
+
+    async def aset(self, kind: str, url: str, content: str, **kwargs) -> ContentEntry:
+        if self.store is None:
+            return self.set(kind, url, content, **kwargs)
+        return await asyncio.to_thread(self.set, kind, url, content, **kwargs)
+
+    def refresh(self, kind: str, url: str, entry: ContentEntry, ttl: Optional[float] = None):
+        """
+        the site answered 304 , the entry is fresh again
+        """
+        entry.expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        key = _key(kind, url)
+        self._put(key, entry)
+        self._persist(key, entry)
+        with self._lock:
+            self.revalidated += 1
+
+    async def arefresh(self, kind: str, url: str, entry: ContentEntry, ttl: Optional[float] = None):
+        if self.store is None:
+            return self.refresh(kind, url, entry, ttl)
+        await asyncio.to_thread(self.refresh, kind, url, entry, ttl)
+
+    def clear(self, kind: Optional[str] = None):
+        """
+        kind: only drop the pages of this kind , every page by default
+        """
+        with self._lock:
+            if kind is None:
+                self._data.clear()
+                self._bytes = 0
+            else:
+                prefix = _key(kind, "")
+                for key in [k for k in self._data if k.startswith(prefix)]:
+                    self._bytes -= self._data.pop(key)[1]
+        if self.store is not None:
+            self.store.clear(None if kind is None else _key(kind, ""))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+            }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    # --- internals ---------------------------------------------------------
+
+    def _put(self, key: str, entry: ContentEntry):
+        size = entry.size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (entry, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, dropped) = self._data.popitem(last=False)
+                self._bytes -= dropped
+
+    def _persist(self, key: str, entry: ContentEntry):
+        if self.store is None:
+            return
+        # an entry that can't be revalidated is useless once expired
+        ttl = entry.expires_at - time.time()
+        if entry.revalidatable:
+            ttl += STALE_SECONDS
+        try:
+            self.store.set(key, entry.to_dict(), ttl=ttl)
+        except Exception as e:
+            logger.warning(f"writing {key} to the content cache failed: {e}")
+
+    def _count(self, entry: Optional[ContentEntry]):
+        with self._lock:
+            if entry is not None and entry.fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+def _key(kind: str, url: str) -> str:
+    return f"{kind}:{url}"
+
+
+_lock = threading.Lock()
+_cache: Optional[ContentCache] = None
+
+
+def get_content_cache() -> ContentCache:
+    """
+    the cache shared by every search backend and Crawl , see "content_cache" in config.json
+    """
+    global _cache
+    with _lock:
+        if _cache is None:
+            config = read_config().get("content_cache") or {}
+            store = None
+            if config.get("persist", False):
+                store = DiskCache(
+                    config.get("path", "./cache/content.sqlite"),
+                    max_bytes=int(config.get("disk_max_mb", 256) * 1024 * 1024),
+                )
+            _cache = ContentCache(
+                max_bytes=int(config.get("max_mb", 32) * 1024 * 1024),
+                ttl=config.get("ttl", 3600),
+                store=store,
+            )
+        return _cache
@@ -10,13 +10,18 @@ from crawl4ai.extraction_strategy import LLMExtractionStrategy
 from pydantic import BaseModel, Field
 from markitdown import MarkItDown
 
+import asyncio
 import json
 import requests
 import os
+import logging
 
 from ..model import Model
 from ..RAG.summary import Summary
+from ..utils import span
+from .content_cache import get_content_cache
 
+logger = logging.getLogger(__name__)
 
 class Crawl:
     """
@@ -64,8 +69,9 @@ class Crawl:
         Get url from a website with the help of llm
         TODO: Replace Do Do Duck
         """
-        self.broswer_conf = BrowserConfig(headless=True)
-        self.run_conf = CrawlerRunConfig(
+        # crawler and configs are local, the same Crawl serves concurrent runs
+        browser_conf = BrowserConfig(headless=True)
+        run_conf = CrawlerRunConfig(
             cache_mode=CacheMode.BYPASS,
             word_count_threshold=1,
             extraction_strategy=LLMExtractionStrategy(
@@ -93,14 +99,14 @@ class Crawl:
                     """,
             ),
         )
-        self.crawler = AsyncWebCrawler(config=self.broswer_conf)
-        await self.start_crawler()
+        crawler = AsyncWebCrawler(config=browser_conf)
+        await crawler.start()
 
-        result = await self.crawler.arun(url=url, config=self.run_conf)
-        await self.close_crawler()
-        self.url_list = json.loads(result.extracted_content)
+        result = await crawler.arun(url=url, config=run_conf)
+        await crawler.close()
+        url_list = json.loads(result.extracted_content)
 
-        return self.url_list
+        return url_list
 
     async def get_pdf_summary(self, url):
         """
@@ -108,30 +114,100 @@ class Crawl:
         user markitdown to convert to markdown
         generate summary with LLM --> we need a specific method to handle this
         """
-        p = self._download_pdf(url)
-        md = MarkItDown()
-        result = md.convert(p)
+        cache = get_content_cache()
+        cached = await cache.aget("pdf", url)
+        if cached is not None and cached.fresh:
+            markdown = cached.content
+        else:
+            markdown = await asyncio.to_thread(self._pdf_markdown, url, cached)
         s = Summary(self.model)
-        r = s.summary(result.markdown)
+        r = await s.asummary(markdown)
         del s
         return r
 
-    async def get_summary(self, url: list, query):
+    def _pdf_markdown(self, url, cached=None):
+        """
+        the markdown of the pdf , shared with every run through the content cache
+        an expired copy is only downloaded and converted again when the site says it changed
+        """
+        cache = get_content_cache()
+        headers = cached.validators() if cached is not None else {}
+        p, response = self._download_pdf(url, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            cache.refresh("pdf", url, cached)
+            return cached.content
+        if p is None:
+            # a 304 without a copy to serve , ask for the whole file
+            p, response = self._download_pdf(url, headers={"Cache-Control": "no-cache"})
+            if p is None:
+                raise ValueError(f"{url} answered {response.status_code} without the pdf")
+        md = MarkItDown()
+        result = md.convert(p)
+        cache.set(
+            "pdf",
+            url,
+            result.markdown,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+        return result.markdown
+
+    async def get_summary(self, url: list, query, timeout: float = None):
+        """
+        timeout: stop after timeout seconds , the pdf checks and summaries included ,
+                 and keep the pages finished so far
+        """
+        loop = asyncio.get_running_loop()
+        end = None if timeout is None else loop.time() + timeout
+
+        def left():
+            return None if end is None else max(0.0, end - loop.time())
+
+        # every url is checked at once , a pdf is read as soon as its check is done
+        # and while the pages are crawled
+        checks = {asyncio.create_task(self._is_pdf(u)): u for u in url}
+        reads = {}
+
+        def read(check: asyncio.Task):
+            if not check.cancelled() and check.exception() is None and check.result():
+                reads[asyncio.create_task(self.get_pdf_summary(checks[check]))] = checks[check]
+
+        for check in checks:
+            check.add_done_callback(read)
+        done, pending = await _wait(checks, left())
+        for check in pending:
+            # a url whose check didn't finish in time is dropped
+            check.cancel()
+        is_pdf = {checks[c]: c.exception() is None and c.result() for c in done}
+        pages = [u for u in url if is_pdf.get(u) is False]
+
+        summary = []
+        if pages and left() != 0:
+            summary = await self._crawl_pages(pages, query, left())
+
+        pdf_summary = []
+        with span("crawl.pdf", pdfs=len(reads)) as s:
+            done, pending = await _wait(reads, left())
+            for task in pending:
+                task.cancel()
+            for task, u in reads.items():
+                if task not in done:
+                    continue
+                if task.exception() is not None:
+                    logger.warning(f"pdf {u} failed: {task.exception()}")
+                else:
+                    pdf_summary.append(task.result())
+            s.set(timeout=bool(pending))
+        return pdf_summary + summary
+
+    async def _crawl_pages(self, url: list, query, timeout: float = None) -> list:
+        """
+        summaries of the web pages , the ones finished within timeout seconds
+        """
         summary = []
-        for u in url:
-            is_pdf = await self._is_pdf(u)
-            if is_pdf:
-                try:
-                    content = await self.get_pdf_summary(u)
-                    response = await summary.append(content)
-                    summary.append(response)
-                except Exception as e:
-                    print("Handling pdf error: ", e)
-                # current not support pdf first
-                url.remove(u)
 
-        self.broswer_conf = BrowserConfig()
-        self.run_conf = CrawlerRunConfig(
+        browser_conf = BrowserConfig()
+        run_conf = CrawlerRunConfig(
             word_count_threshold=1,
             extraction_strategy=LLMExtractionStrategy(
                 llm_config=self.model.get_llm_config(),
@@ -172,19 +248,29 @@ class Crawl:
                 """,
             ),
             cache_mode=CacheMode.BYPASS,
+            # stream so the pages finished before a timeout are kept
+            stream=True,
         )
-        self.crawler = AsyncWebCrawler(config=self.broswer_conf)
-        await self.start_crawler()
+        crawler = AsyncWebCrawler(config=browser_conf)
+        await crawler.start()
 
-        result = await self.crawler.arun_many(
-            urls=url,
-            config=self.run_conf,
-        )
-        await self.close_crawler()
+        result = []
+        with span("crawl.summary", urls=len(url)) as s:
+            try:
+                async def collect():
+                    async for ele in await crawler.arun_many(urls=url, config=run_conf):
+                        result.append(ele)
+
+                await asyncio.wait_for(collect(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"crawl timeout , {len(result)} of {len(url)} pages done")
+                s.set(timeout=True)
+            finally:
+                await crawler.close()
 
         for ele in result:
-            page_summary = json.loads(ele.extracted_content)
             try:
+                page_summary = json.loads(ele.extracted_content)
                 summary.append(page_summary[0])
             except:
                 pass
@@ -260,23 +346,29 @@ class Crawl:
         await self.close_crawler()
 
     async def _is_pdf(self, url):
+        if await get_content_cache().aget("pdf", url) is not None:
+            return True
+        # requests blocks , the loop keeps serving the other runs
+        return await asyncio.to_thread(self._sniff_pdf, url)
+
+    def _sniff_pdf(self, url) -> bool:
         try:
             # Use GET request with stream=True to avoid downloading the entire file
-            response = requests.get(url, stream=True, allow_redirects=True, timeout=10)
-            response.raise_for_status()
+            with requests.get(url, stream=True, allow_redirects=True, timeout=10) as response:
+                response.raise_for_status()
 
-            content_type = response.headers.get("Content-Type", "").lower()
-            # Check if content-type indicates PDF
-            if "application/pdf" in content_type:
-                return True
+                content_type = response.headers.get("Content-Type", "").lower()
+                # Check if content-type indicates PDF
+                if "application/pdf" in content_type:
+                    return True
 
-            # Sometimes content-type is not set correctly,
-            # so check the first 5 bytes for '%PDF-'
-            start = response.raw.read(5)
-            return start == b"%PDF-"
+                # Sometimes content-type is not set correctly,
+                # so check the first 5 bytes for '%PDF-'
+                start = response.raw.read(5)
+                return start == b"%PDF-"
 
         except requests.RequestException as e:
-            print(f"Request failed: {e}")
+            logger.warning(f"pdf check of {url} failed: {e}")
             return False
 
     def search_content(self):
@@ -285,9 +377,11 @@ class Crawl:
     def run(self):
         pass
 
-    def _download_pdf(self, url, save_path="./tmp"):
+    def _download_pdf(self, url, save_path="./tmp", headers=None):
         """
         Download every file ?
+        headers: of a conditional request , nothing is saved when the answer is 304
+        returns the path and the response
         """
         filename = url.rstrip("/").split("/")[-1]
         filename = filename.split("?")[0]
@@ -296,12 +390,20 @@ class Crawl:
             filename += ".pdf"
         save_path = os.path.join(save_path, filename)
 
-        response = requests.get(url)
+        response = requests.get(url, headers=headers)
+        if response.status_code == 304:
+            return None, response
         response.raise_for_status()
 
         with open(save_path, "wb") as f:
             f.write(response.content)
-        return save_path
+        return save_path, response
+
+
+async def _wait(tasks, timeout):
+    if not tasks:
+        return set(), set()
+    return await asyncio.wait(tasks, timeout=timeout)
 
 
 class Url_result(BaseModel):
@@ -11,6 +11,11 @@ from urllib.parse import urlparse
 from selectolax.parser import HTMLParser
 import os
 
+from .content_cache import get_content_cache
+from .search_cache import Incomplete, cached_search
+from .session import get_session, run_sync
+from ..utils import span
+
 logger = logging.getLogger(__name__)
 
 class DuckSearch:
@@ -29,19 +34,10 @@ class DuckSearch:
             sock_read=0.3   # 300ms to read
         )
         
-        # Optimized connector settings
-        self._connector_config = {
-            'limit': 50,
-            'limit_per_host': 20,
-            'ttl_dns_cache': 300,
-            'use_dns_cache': True,
-            'keepalive_timeout': 30,
-            'enable_cleanup_closed': True,
-        }
-        
         # Simple caches
         self._failed_urls = set()
-        self._content_cache = {}
+        # page contents are shared by every instance , see content_cache.py
+        self._content_cache = get_content_cache()
         
         # Regex patterns
         self._text_cleanup = re.compile(r'\s+')
@@ -61,11 +57,17 @@ class DuckSearch:
         if not url or url in self._failed_urls or not self._is_valid_url(url):
             return ""
         
-        if url in self._content_cache:
-            return self._content_cache[url]
+        cached = await self._content_cache.aget("duckduckgo", url)
+        if cached is not None and cached.fresh:
+            return cached.content
+        # an expired page is only downloaded again when the site says it changed
+        headers = cached.validators() if cached is not None else {}
         
         try:
-            async with session.get(url, allow_redirects=True, max_redirects=2) as response:
+            async with session.get(url, allow_redirects=True, max_redirects=2, timeout=self._timeout, headers=headers) as response:
+                if response.status == 304 and cached is not None:
+                    await self._content_cache.arefresh("duckduckgo", url, cached)
+                    return cached.content
                 if response.status != 200:
                     self._failed_urls.add(url)
                     return ""
@@ -104,14 +106,13 @@ class DuckSearch:
                 
                 final_text = self._text_cleanup.sub(' ', unescape(' '.join(texts))).strip()[:300]
                 
-                # Simple cache management
-                if len(self._content_cache) > 100:
-                    # Remove oldest 20 entries
-                    old_keys = list(self._content_cache.keys())[:20]
-                    for key in old_keys:
-                        del self._content_cache[key]
-                
-                self._content_cache[url] = final_text
+                await self._content_cache.aset(
+                    "duckduckgo",
+                    url,
+                    final_text,
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                )
                 return final_text
                 
         except Exception as e:
@@ -124,71 +125,76 @@ class DuckSearch:
         if not results:
             return []
         
-        connector = aiohttp.TCPConnector(**self._connector_config)
-        
+        # the shared session of this loop , its connections and DNS cache stay warm
+        session = get_session()
+
+        # Limit concurrent requests for speed
+        semaphore = asyncio.Semaphore(min(k * 2, 20))
+
+        async def process_single(result):
+            async with semaphore:
+                url = result.get("link", "")
+                with span("search.fetch", url=url) as s:
+                    content = await self._extract_content_fast(session, url)
+                    s.set(content_chars=len(content))
+                result["full_content"] = content
+                return result
+
+        # Process only the URLs we need
+        tasks = [process_single(result) for result in results[:k]]
+
+        # Race against time - 1.2s max for content extraction
         try:
-            async with aiohttp.ClientSession(
-                connector=connector,
-                timeout=self._timeout,
-                headers={
-                    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36",
-                    "Accept": "text/html,*/*;q=0.8",
-                },
-            ) as session:
-                
-                # Limit concurrent requests for speed
-                semaphore = asyncio.Semaphore(min(k * 2, 20))
-                
-                async def process_single(result):
-                    async with semaphore:
-                        url = result.get("link", "")
-                        content = await self._extract_content_fast(session, url)
-                        result["full_content"] = content
-                        return result
-                
-                # Process only the URLs we need
-                tasks = [process_single(result) for result in results[:k]]
-                
-                # Race against time - 1.2s max for content extraction
-                try:
-                    completed_results = await asyncio.wait_for(
-                        asyncio.gather(*tasks, return_exceptions=True),
-                        timeout=1.2
-                    )
-                    
-                    final_results = []
-                    for i, result_or_exc in enumerate(completed_results):
-                        if isinstance(result_or_exc, Exception):
-                            # On any error, set empty content but keep the result
-                            results[i]["full_content"] = ""
-                            final_results.append(results[i])
-                        else:
-                            final_results.append(result_or_exc)
-                    
-                    return final_results
-                    
-                except asyncio.TimeoutError:
-                    logger.debug("Content extraction timed out - returning results without content")
-                    # If we timeout, return results with empty content
-                    for result in results[:k]:
-                        result["full_content"] = ""
-                    return results[:k]
-                    
-        except Exception as e:
-            logger.error(f"Session creation failed: {e}")
-            # Return empty list on session creation failure
-            return []
-        finally:
-            await connector.close()
+            completed_results = await asyncio.wait_for(
+                asyncio.gather(*tasks, return_exceptions=True),
+                timeout=1.2
+            )
+
+            final_results = []
+            for i, result_or_exc in enumerate(completed_results):
+                if isinstance(result_or_exc, Exception):
+                    # On any error, set empty content but keep the result
+                    results[i]["full_content"] = ""
+                    final_results.append(results[i])
+                else:
+                    final_results.append(result_or_exc)
+
+            return final_results
+
+        except asyncio.TimeoutError:
+            logger.debug("Content extraction timed out - returning results without content")
+            # If we timeout, return results with empty content
+            for result in results[:k]:
+                result["full_content"] = ""
+            # served but not cached , the pages may be read next time
+            return Incomplete(results[:k])
 
     def search_result(self, query: str, k: int = 6, backend: str = "text", deep_search: bool = True) -> List[Dict]:
         """Super efficient search - 1.5s max total time or return empty list."""
+        # sync callers share the background loop of the browser session
+        return run_sync(self.asearch_result(query, k, backend, deep_search))
+
+    async def asearch_result(self, query: str, k: int = 6, backend: str = "text", deep_search: bool = True) -> List[Dict]:
+        """search_result on the loop of the caller."""
+        with span("search.duckduckgo", query=query, k=k) as s:
+            results = await cached_search(
+                "duckduckgo",
+                query,
+                lambda: self._search_result(query, k, backend, deep_search),
+                k=k,
+                backend=backend,
+                deep_search=deep_search,
+            )
+            s.set(results=len(results))
+        return results
+
+    async def _search_result(self, query: str, k: int, backend: str, deep_search: bool) -> List[Dict]:
         start_time = time.time()
         logger.info(f"Starting efficient search for: '{query}'")
         
         try:
-            # Get initial results - should be fast
-            results = self.search_engine.invoke(query, max_results=k)
+            # Get initial results - the duckduckgo client is sync
+            results = await asyncio.to_thread(self.search_engine.invoke, query, max_results=k)
             
             if not results:
                 logger.info(f"No results found for: '{query}'")
@@ -200,7 +206,7 @@ class DuckSearch:
                 logger.warning(f"Basic search took {elapsed:.3f}s - skipping deep search")
                 for result in results:
                     result["full_content"] = ""
-                return results[:k]
+                return Incomplete(results[:k]) if deep_search else results[:k]
             
             if not deep_search:
                 for result in results:
@@ -209,26 +215,17 @@ class DuckSearch:
             
             # Deep search with remaining time budget
             try:
-                # Run async content extraction
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    final_results = loop.run_until_complete(
-                        self._process_results_fast(results, k)
-                    )
-                    
-                    total_time = time.time() - start_time
-                    logger.info(f"Search completed in {total_time:.3f}s")
-                    
-                    # Final time check - if we exceeded 1.5s, we failed
-                    if total_time > 1.5:
-                        logger.warning(f"Search exceeded 1.5s limit ({total_time:.3f}s) - returning empty")
-                        return []
-                    
-                    return final_results if final_results else []
-                    
-                finally:
-                    loop.close()
+                final_results = await self._process_results_fast(results, k)
+
+                total_time = time.time() - start_time
+                logger.info(f"Search completed in {total_time:.3f}s")
+
+                # Final time check - if we exceeded 1.5s, we failed
+                if total_time > 1.5:
+                    logger.warning(f"Search exceeded 1.5s limit ({total_time:.3f}s) - returning empty")
+                    return []
+
+                return final_results if final_results else []
                     
             except Exception as e:
                 logger.error(f"Deep search failed: {e}")
@@ -251,13 +248,22 @@ class DuckSearch:
         
         query = category_queries.get(category, "latest news")
         try:
-            return self.news_engine.invoke(query)
+            return run_sync(
+                cached_search(
+                    "duckduckgo",
+                    query,
+                    lambda: asyncio.to_thread(self.news_engine.invoke, query),
+                    "news",
+                    news=True,
+                )
+            )
         except Exception as e:
             logger.error(f"News search failed for '{category}': {e}")
             return []
 
     def clear_cache(self):
         """Clear caches."""
-        self._content_cache.clear()
+        # the content cache is shared , only the pages of this backend go
+        self._content_cache.clear("duckduckgo")
         self._failed_urls.clear()
         self._is_valid_url.cache_clear()
\ No newline at end of file
@@ -1,5 +1,4 @@
 import asyncio
-import concurrent.futures
 import aiohttp
 from html import unescape
 import logging
@@ -9,11 +8,15 @@ from functools import lru_cache
 import re
 from urllib.parse import urlparse, quote_plus
 import os
-import requests
 from bs4 import BeautifulSoup
 from selectolax.parser import HTMLParser
 import json
 
+from .content_cache import get_content_cache
+from .search_cache import Incomplete, cached_search, same_kind
+from .session import get_session, run_sync
+from ..utils import span
+
 logger = logging.getLogger(__name__)
 
 class GoogleSearch:
@@ -32,73 +35,95 @@ class GoogleSearch:
             connect=0.1,    # 100ms to connect
             sock_read=0.3   # 300ms to read
         )
-        
-        # Optimized connector settings
-        self._connector_config = {
-            'limit': 50,
-            'limit_per_host': 20,
-            'ttl_dns_cache': 300,
-            'use_dns_cache': True,
-            'keepalive_timeout': 30,
-            'enable_cleanup_closed': True,
-        }
+        self._cse_timeout = aiohttp.ClientTimeout(total=10)
         
         # Simple caches
         self._failed_urls = set()
-        self._content_cache = {}
+        # page contents are shared by every instance , see content_cache.py
+        self._content_cache = get_content_cache()
         
         # Regex patterns
         self._text_cleanup = re.compile(r'\s+')
         self._html_tags = re.compile(r'<[^>]+>')
         
-    def _search_google_cse(self, query: str, max_results: int = 20) -> List[Dict]:
+    async def _search_google_cse(self, query: str, max_results: int = 20) -> List[Dict]:
         """
         Search using Google Custom Search Engine
         """
+        # Google CSE max is 10 per request and 100 results total , every page is
+        # requested at once and the pages are merged in rank order
+        pages = [
+            (start_index, min(10, max_results - start_index + 1))
+            for start_index in range(1, min(max_results, 100) + 1, 10)
+        ]
+        if not pages:
+            return []
+        tasks = {
+            asyncio.create_task(self._search_google_cse_page(query, start_index, num)): i
+            for i, (start_index, num) in enumerate(pages)
+        }
+        fetched = {}
+        all_results = []
+        merged = 0
+        failed = False
+        pending = set(tasks)
         try:
-            # Google CSE max is 10 per request, so we need multiple requests for more results
-            all_results = []
-            start_index = 1
-            
-            while len(all_results) < max_results and start_index <= 91:  # Google CSE max is 100 results total
-                # Calculate how many results to request in this batch
-                batch_size = min(10, max_results - len(all_results))
-                
-                params = {
-                    'key': self.api_key,
-                    'cx': self.cse_id,
-                    'q': query,
-                    'num': batch_size,
-                    'start': start_index,
-                    'safe': 'off'
-                }
-                
-                logger.info(f"Searching Google CSE for: {query} (batch starting at {start_index})")
-                
-                response = requests.get(self.base_url, params=params, timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    batch_results = self._parse_google_results(data, batch_size)
+            while pending and merged < len(pages):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    fetched[tasks[task]] = task.result()
+                # take the pages that follow the merged ones , a later page waits for the earlier
+                while merged in fetched:
+                    batch_results = fetched.pop(merged)
+                    if batch_results is None:
+                        # failed page , the ranks after it are unknown
+                        failed = True
+                        merged = len(pages)
+                        break
                     all_results.extend(batch_results)
-                    
+                    merged += 1
                     # If we got fewer results than requested, we've reached the end
-                    if len(batch_results) < batch_size:
+                    if len(batch_results) < pages[merged - 1][1]:
+                        merged = len(pages)
                         break
-                        
-                    start_index += 10
-                else:
-                    logger.error(f"Google CSE search failed with status code: {response.status_code}")
-                    logger.error(f"Response: {response.text}")
-                    break
-            
-            logger.info(f"Found {len(all_results)} results from Google CSE")
-            return all_results[:max_results]
-                
+        finally:
+            # k results are in hand (or there are no more) , the pages still on the way aren't needed
+            for task in pending:
+                task.cancel()
+
+        logger.info(f"Found {len(all_results)} results from Google CSE")
+        if failed:
+            # served but not cached , the next search may get every page
+            return Incomplete(all_results[:max_results])
+        return all_results[:max_results]
+
+    async def _search_google_cse_page(self, query: str, start_index: int, num: int) -> Optional[List[Dict]]:
+        """
+        One page of Google CSE results , None when the request failed
+        """
+        params = {
+            'key': self.api_key,
+            'cx': self.cse_id,
+            'q': query,
+            'num': num,
+            'start': start_index,
+            'safe': 'off'
+        }
+        logger.info(f"Searching Google CSE for: {query} (batch starting at {start_index})")
+        try:
+            with span("search.cse_page", start=start_index) as s:
+                async with get_session().get(self.base_url, params=params, timeout=self._cse_timeout) as response:
+                    s.set(status=response.status)
+                    if response.status != 200:
+                        logger.error(f"Google CSE search failed with status code: {response.status}")
+                        logger.error(f"Response: {await response.text()}")
+                        return None
+                    data = await response.json()
+            return self._parse_google_results(data, num)
         except Exception as e:
             logger.error(f"Google CSE search error: {e}")
-            return []
-    
+            return None
+
     def _parse_google_results(self, data: dict, max_results: int) -> List[Dict]:
         """
         Parse Google CSE API results
@@ -145,13 +170,19 @@ class GoogleSearch:
         if not url or url in self._failed_urls or not self._is_valid_url(url):
             return ""
         
-        if url in self._content_cache:
-            return self._content_cache[url]
+        cached = await self._content_cache.aget("google", url)
+        if cached is not None and cached.fresh:
+            return cached.content
+        # an expired page is only downloaded again when the site says it changed
+        headers = cached.validators() if cached is not None else {}
         
         try:
             # Add more generous request timeout for content extraction
             timeout = aiohttp.ClientTimeout(total=30, connect=10, sock_read=20)
-            async with session.get(url, allow_redirects=True, max_redirects=2, timeout=timeout) as response:
+            async with session.get(url, allow_redirects=True, max_redirects=2, timeout=timeout, headers=headers) as response:
+                if response.status == 304 and cached is not None:
+                    await self._content_cache.arefresh("google", url, cached)
+                    return cached.content
                 if response.status != 200:
                     self._failed_urls.add(url)
                     return ""
@@ -216,14 +247,13 @@ class GoogleSearch:
                 
                 final_text = self._text_cleanup.sub(' ', unescape(' '.join(texts))).strip()[:10000]
                 
-                # Simple cache management
-                if len(self._content_cache) > 100:
-                    # Remove oldest 20 entries
-                    old_keys = list(self._content_cache.keys())[:20]
-                    for key in old_keys:
-                        del self._content_cache[key]
-                
-                self._content_cache[url] = final_text
+                await self._content_cache.aset(
+                    "google",
+                    url,
+                    final_text,
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                )
                 return final_text
                 
         except asyncio.TimeoutError:
@@ -240,71 +270,76 @@ class GoogleSearch:
         if not results:
             return []
         
-        connector = aiohttp.TCPConnector(**self._connector_config)
-        
+        # the shared session of this loop , its connections and DNS cache stay warm
+        session = get_session()
+
+        # Limit concurrent requests to avoid overwhelming sites
+        semaphore = asyncio.Semaphore(min(k, 5))
+
+        async def process_single(result):
+            async with semaphore:
+                url = result.get("link", "")
+                with span("search.fetch", url=url) as s:
+                    content = await self._extract_content_fast(session, url)
+                    s.set(content_chars=len(content))
+                result["full_content"] = content
+                return result
+
+        # Process only the URLs we need
+        tasks = [process_single(result) for result in results[:k]]
+
+        # Race against time - 45s max for content extraction
         try:
-            async with aiohttp.ClientSession(
-                connector=connector,
-                timeout=self._timeout,
-                headers={
-                    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36",
-                    "Accept": "text/html,*/*;q=0.8",
-                },
-            ) as session:
-                
-                # Limit concurrent requests to avoid overwhelming sites
-                semaphore = asyncio.Semaphore(min(k, 5))
-                
-                async def process_single(result):
-                    async with semaphore:
-                        url = result.get("link", "")
-                        content = await self._extract_content_fast(session, url)
-                        result["full_content"] = content
-                        return result
-                
-                # Process only the URLs we need
-                tasks = [process_single(result) for result in results[:k]]
-                
-                # Race against time - 45s max for content extraction
-                try:
-                    completed_results = await asyncio.wait_for(
-                        asyncio.gather(*tasks, return_exceptions=True),
-                        timeout=45.0
-                    )
-                    
-                    final_results = []
-                    for i, result_or_exc in enumerate(completed_results):
-                        if isinstance(result_or_exc, Exception):
-                            # On any error, set empty content but keep the result
-                            results[i]["full_content"] = ""
-                            final_results.append(results[i])
-                        else:
-                            final_results.append(result_or_exc)
-                    
-                    return final_results
-                    
-                except asyncio.TimeoutError:
-                    logger.debug("Content extraction timed out - returning results without content")
-                    # If we timeout, return results with empty content
-                    for result in results[:k]:
-                        result["full_content"] = ""
-                    return results[:k]
-                    
-        except Exception as e:
-            logger.error(f"Session creation failed: {e}")
-            # Return empty list on session creation failure
-            return []
-        finally:
-            await connector.close()
+            completed_results = await asyncio.wait_for(
+                asyncio.gather(*tasks, return_exceptions=True),
+                timeout=45.0
+            )
+
+            final_results = []
+            for i, result_or_exc in enumerate(completed_results):
+                if isinstance(result_or_exc, Exception):
+                    # On any error, set empty content but keep the result
+                    results[i]["full_content"] = ""
+                    final_results.append(results[i])
+                else:
+                    final_results.append(result_or_exc)
+
+            return final_results
+
+        except asyncio.TimeoutError:
+            logger.debug("Content extraction timed out - returning results without content")
+            # If we timeout, return results with empty content
+            for result in results[:k]:
+                result["full_content"] = ""
+            # served but not cached , the pages may be read next time
+            return Incomplete(results[:k])
 
     def search_result(self, query: str, k: int = 20, backend: str = "text", deep_search: bool = True) -> List[Dict]:
         """Super efficient search using Google CSE."""
+        # sync callers share the background loop of the browser session
+        return run_sync(self.asearch_result(query, k, backend, deep_search))
+
+    async def asearch_result(self, query: str, k: int = 20, backend: str = "text", deep_search: bool = True) -> List[Dict]:
+        """search_result on the loop of the caller."""
+        with span("search.google", query=query, k=k) as s:
+            results = await cached_search(
+                "google",
+                query,
+                lambda: self._search_result(query, k, backend, deep_search),
+                k=k,
+                backend=backend,
+                deep_search=deep_search,
+            )
+            s.set(results=len(results))
+        return results
+
+    async def _search_result(self, query: str, k: int, backend: str, deep_search: bool) -> List[Dict]:
         start_time = time.time()
         logger.info(f"Starting efficient search for: '{query}'")
         
         try:
             # Use Google CSE search
-            results = self._search_google_cse(query, k)
+            results = await self._search_google_cse(query, k)
             
             if not results:
                 logger.info(f"No results found for: '{query}'")
@@ -316,55 +351,35 @@ class GoogleSearch:
                 logger.warning(f"Basic search took {elapsed:.3f}s - skipping deep search")
                 for result in results:
                     result["full_content"] = ""
-                return results[:k]
+                return Incomplete(results[:k]) if deep_search else results[:k]
             
             if not deep_search:
                 for result in results:
                     result["full_content"] = ""
-                return results[:k]
+                return same_kind(results, results[:k])
             
             # Deep search with remaining time budget
             try:
-                # Run async content extraction
-                try:
-                    # Check if there's already an event loop running
-                    try:
-                        loop = asyncio.get_running_loop()
-                        # If we're in an async context (and likely on the event-loop thread),
-                        # offload deep search to a worker thread with its own event loop to avoid deadlocks.
-                        logger.info("Already in async context - offloading deep search to worker thread")
-                        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
-                            future = pool.submit(lambda: asyncio.run(self._process_results_fast(results, k)))
-                            final_results = future.result(timeout=60.0)
-                    except RuntimeError:
-                        # No event loop running, safe to create one
-                        final_results = asyncio.run(self._process_results_fast(results, k))
-                    
-                    total_time = time.time() - start_time
-                    logger.info(f"Search completed in {total_time:.3f}s")
-                    
-                    # Final time check - if we exceeded 1.5s, we failed
-                    if total_time > 60.0:
-                        logger.warning(f"Search exceeded 60s limit ({total_time:.3f}s) - returning empty")
-                        return []
-                    
-                    return final_results if final_results else []
-                    
-                except concurrent.futures.TimeoutError:
-                    logger.warning("Deep search worker timed out - returning results without content")
-                    for result in results:
-                        result["full_content"] = ""
-                    return results[:k]
-                except Exception as e:
-                    logger.error(f"Async processing failed: {e}")
-                    # Return results without content on async failure
-                    for result in results:
-                        result["full_content"] = ""
-                    return results[:k]
-                    
+                final_results = await asyncio.wait_for(
+                    self._process_results_fast(results, k), timeout=60.0
+                )
+
+                total_time = time.time() - start_time
+                logger.info(f"Search completed in {total_time:.3f}s")
+
+                return same_kind(results, final_results) if final_results else []
+
+            except asyncio.TimeoutError:
+                logger.warning("Deep search timed out - returning results without content")
+                for result in results:
+                    result["full_content"] = ""
+                return Incomplete(results[:k])
             except Exception as e:
-                logger.error(f"Deep search failed: {e}")
-                return []  # Return empty on any deep search failure
+                logger.error(f"Async processing failed: {e}")
+                # Return results without content on async failure
+                for result in results:
+                    result["full_content"] = ""
+                return Incomplete(results[:k])
                 
         except Exception as e:
             logger.error(f"Search failed for '{query}': {e}")
@@ -386,13 +401,18 @@ class GoogleSearch:
         try:
             logger.info(f"Searching news for category: {category}")
             # Use Google CSE search for news
-            return self._search_google_cse(query, 8)
+            return run_sync(
+                cached_search(
+                    "google", query, lambda: self._search_google_cse(query, 8), "news", news=True
+                )
+            )
         except Exception as e:
             logger.error(f"News search failed for '{category}': {e}")
             return []
 
     def clear_cache(self):
         """Clear caches."""
-        self._content_cache.clear()
+        # the content cache is shared , only the pages of this backend go
+        self._content_cache.clear("google")
         self._failed_urls.clear()
         self._is_valid_url.cache_clear()
@@ -0,0 +1,193 @@
+"""
+Persistent cache of search results
+
+Every quick , streaming , academic and news search used to call the search
+API again , the same questions spent the daily CSE quota and a network round
+trip each time. Results are kept in a DiskCache keyed on the engine , the
+normalized query and the search parameters, with a time to live per category:
+    news     today_new() , the headlines change within the hour
+    recent   queries about the latest / today / prices / this year
+    default  everything else , the answer of "what is a transformer" keeps
+A search that is already running for the same key is awaited instead of
+being sent again (singleflight), so a burst of the same query makes one call.
+Empty results (failed or timed out searches) are not kept , neither are the
+results of a deep search whose pages could not be read , or of a search that
+lost one of its result pages: a backend returns them as Incomplete , and a deep
+search without any page content is taken as one.
+
+config.json:
+    "search_cache": {"enabled": true, "path": "./cache/search.sqlite", "max_mb": 64,
+                     "ttl": {"news": 900, "recent": 3600, "default": 86400}}
+"""
+
+from typing import Awaitable, Callable, Optional
+
+from ..utils import DiskCache, read_config, span
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTLS = {"news": 900, "recent": 3600, "default": 86400}
+_RECENT = re.compile(
+    r"\b(latest|today|tonight|yesterday|now|current|currently|news|breaking|live|"
+    r"price|prices|stock|stocks|weather|score|scores|this (week|month|year)|20\d\d)\b"
+)
+
+
+class Incomplete(list):
+    """
+    results that are served but not cached , e.g. the deep search timed out
+    and full_content is empty
+    """
+
+
+def same_kind(source: list, results: list) -> list:
+    """
+    results made from source , Incomplete when source is
+    """
+    return Incomplete(results) if isinstance(source, Incomplete) else results
+
+
+def normalize_query(query: str) -> str:
+    """
+    case and spacing don't change the results
+    """
+    query = unicodedata.normalize("NFKC", query or "").casefold()
+    return re.sub(r"\s+", " ", query).strip()
+
+
+class SearchCache:
+    def __init__(self, store: DiskCache, ttls: Optional[dict] = None):
+        """
+        store: where the results are kept , shared by every engine
+        ttls: seconds the results of a category are served , see DEFAULT_TTLS
+        """
+        self.store = store
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self._lock = threading.Lock()
+        # (loop , key) -> the running search , a task can only be awaited on its loop
+        self._inflight: dict[tuple, asyncio.Task] = {}
+
+    def key(self, engine: str, query: str, **params) -> str:
+        data = json.dumps(
+            [engine, normalize_query(query), params], sort_keys=True, ensure_ascii=False
+        )
+        return "search:" + hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def category(self, query: str) -> str:
+        return "recent" if _RECENT.search(normalize_query(query)) else "default"
+
+    async def get_or_fetch(
+        self,
+        engine: str,
+        query: str,
+        fetch: Callable[[], Awaitable[list]],
+        category: Optional[str] = None,
+        **params,
+    ) -> list:
+        """
+        the cached results of the search , fetch() when there are none
+        params: everything else that changes the results (k , deep_search ...)
+        """
+        key = self.key(engine, query, **params)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._inflight.get((loop, key))
+            coalesced = task is not None
+            if task is None:
+                task = loop.create_task(
+                    self._load(
+                        key,
+                        fetch,
+                        category or self.category(query),
+                        params.get("deep_search", False),
+                    )
+                )
+                self._inflight[(loop, key)] = task
+                task.add_done_callback(lambda _: self._forget(loop, key))
+        if coalesced:
+            logger.info(f"waiting for the running {engine} search of '{query}'")
+        # a caller that gives up doesn't cancel the search of the others
+        results = await asyncio.shield(task)
+        # every caller gets its own dicts , they are edited downstream
+        return [dict(r) if isinstance(r, dict) else r for r in results]
+
+    async def _load(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[list]],
+        category: str,
+        deep_search: bool = False,
+    ) -> list:
+        with span("search.cache", category=category) as s:
+            results = await asyncio.to_thread(self.store.get, key)
+            s.set(hit=results is not None)
+            if results is not None:
+                return results
+        results = await fetch()
+        if _complete(results, deep_search):
+            await asyncio.to_thread(self.store.set, key, list(results), self.ttls.get(category))
+        return results
+
+    def _forget(self, loop: asyncio.AbstractEventLoop, key: str):
+        with self._lock:
+            self._inflight.pop((loop, key), None)
+
+    def clear(self):
+        self.store.clear()
+
+
+def _complete(results: list, deep_search: bool) -> bool:
+    if not results or isinstance(results, Incomplete):
+        return False
+    if deep_search:
+        return any(isinstance(r, dict) and r.get("full_content") for r in results)
+    return True
+
+
+_lock = threading.Lock()
+_cache: Optional[SearchCache] = None
+_loaded = False
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """
+    the cache of the process , None unless "search_cache": {"enabled": true} in config.json
+    """
+    global _cache, _loaded
+    with _lock:
+        if not _loaded:
+            config = read_config().get("search_cache") or {}
+            if config.get("enabled", False):
+                _cache = SearchCache(
+                    DiskCache(
+                        config.get("path", "./cache/search.sqlite"),
+                        max_bytes=int(config.get("max_mb", 64) * 1024 * 1024),
+                    ),
+                    ttls=config.get("ttl"),
+                )
+            _loaded = True
+        return _cache
+
+
+async def cached_search(
+    engine: str,
+    query: str,
+    fetch: Callable[[], Awaitable[list]],
+    category: Optional[str] = None,
+    **params,
+) -> list:
+    """
+    fetch() through the search cache when it is on
+    """
+    cache = get_search_cache()
+    if cache is None:
+        return await fetch()
+    return await cache.get_or_fetch(engine, query, fetch, category, **params)
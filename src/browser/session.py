@@ -0,0 +1,111 @@
+"""
+Shared aiohttp session of the search backends
+
+DuckSearch and GoogleSearch used to build a connector and a session for every
+search , and the sync search_result() even built a new event loop , so every
+search paid a DNS lookup and a TCP / TLS handshake per result host. Here one
+keep-alive session with a DNS cache is kept per event loop (a session can't
+move between loops) and the sync wrappers run on one background loop of the
+process , so their session stays warm too.
+"""
+
+from functools import partial
+from weakref import WeakKeyDictionary
+
+import aiohttp
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36",
+    "Accept": "text/html,*/*;q=0.8",
+}
+# every request passes its own timeout , this one is only the upper bound
+TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10, sock_read=20)
+_CONNECTOR = {
+    "limit": 50,
+    "limit_per_host": 20,
+    "ttl_dns_cache": 300,
+    "use_dns_cache": True,
+    "keepalive_timeout": 30,
+    "enable_cleanup_closed": True,
+}
+
+_lock = threading.Lock()
+_sessions: "WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = (
+    WeakKeyDictionary()
+)
+_loop: asyncio.AbstractEventLoop | None = None
+_thread: threading.Thread | None = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    the session of the running event loop
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        session = _sessions.get(loop)
+        if session is None or session.closed:
+            session = _sessions[loop] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(**_CONNECTOR),
+                timeout=TIMEOUT,
+                headers=HEADERS,
+            )
+        return session
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _thread
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(
+                target=_loop.run_forever, name="browser-session", daemon=True
+            )
+            _thread.start()
+        return _loop
+
+
+def run_sync(coro):
+    """
+    run coro on the background loop and wait for its result , for the sync
+    wrappers , works from any thread , also one that runs its own loop
+    """
+    loop = _background_loop()
+    if threading.current_thread() is _thread:
+        coro.close()
+        raise RuntimeError("run_sync called from the background loop , await the coroutine")
+    future = concurrent.futures.Future()
+
+    def start():
+        task = loop.create_task(coro)
+        task.add_done_callback(partial(_copy_result, future))
+
+    # the task starts in the context of the caller so trace spans stay attached
+    loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+    return future.result()
+
+
+def _copy_result(future: concurrent.futures.Future, task: asyncio.Task):
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
+
+
+async def aclose():
+    """
+    close the session of the running loop , on shutdown
+    """
+    with _lock:
+        session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
@@ -4,7 +4,24 @@ Factory
 
 from ..agent import Planner, Search_agent, Reporter, RAG_agent, Quick_searcher
 
-from ..model import Gemini, Ollama, Deepseek, Model, Gork, OpenAI
+from ..model import Gemini, Ollama, Deepseek, Model, Gork, OpenAI, CachedModel, HedgedModel
+from ..utils import read_config, DiskCache
+
+_llm_cache: DiskCache = None
+
+
+def _get_llm_cache(config: dict) -> DiskCache:
+    """
+    one cache file for the process , opened on first use
+    """
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = DiskCache(
+            config.get("path", "./cache/llm.sqlite"),
+            max_bytes=int(config.get("max_mb", 256) * 1024 * 1024),
+            ttl=config.get("ttl", 7 * 86400),
+        )
+    return _llm_cache
 
 
 class Factory:
@@ -19,6 +36,36 @@ class Factory:
             return RAG_agent(model)
 
     def get_model(provider: str, model: str) -> Model:
+        config = read_config()
+        m = Factory._get_provider_model(provider, model)
+        # second provider raced against slow requests , off unless "hedge": {"enabled": true}
+        hedge_config = config.get("hedge") or {}
+        if m is not None and hedge_config.get("enabled", False):
+            m = Factory._hedge(m, provider, model, hedge_config)
+        # exact match answer cache , off unless "llm_cache": {"enabled": true} in config
+        cache_config = config.get("llm_cache") or {}
+        if m is not None and cache_config.get("enabled", False):
+            return CachedModel(m, _get_llm_cache(cache_config))
+        return m
+
+    def _hedge(m: Model, provider: str, model: str, config: dict) -> Model:
+        secondary_provider = config.get("provider", "ollama")
+        secondary_model = config.get("model", "")
+        if (secondary_provider, secondary_model) == (provider, model):
+            return m
+        secondary = Factory._get_provider_model(secondary_provider, secondary_model)
+        if secondary is None:
+            return m
+        return HedgedModel(
+            m,
+            secondary,
+            percentile=config.get("percentile", 0.95),
+            min_delay=config.get("min_delay", 1.0),
+            max_delay=config.get("max_delay", 10.0),
+            default_delay=config.get("default_delay", 3.0),
+        )
+
+    def _get_provider_model(provider: str, model: str) -> Model:
         if provider == "deepseek":
             return Deepseek(model)
         if provider == "google" or provider == "gemini":
@@ -1,16 +1,57 @@
-from .agent import Planner, Agent
+from .agent import Planner, Agent, RunContext, Deadline
 from .router import Server, Router
+from .router import events
+from .router.checkpoint import CheckpointStore
 
+import asyncio
 import logging 
 
 logger = logging.getLogger(__name__)
 
-async def generate_report(query, planner: Planner, agents: list[Agent]):
+
+def _reserve(deadline: float, reporter_reserve: float) -> float:
+    """
+    seconds kept for the reporter , never more than half of the run
+    """
+    if deadline is None:
+        return 0.0
+    return min(reporter_reserve, deadline / 2)
+
+
+async def generate_report(
+    query,
+    planner: Planner,
+    agents: list[Agent],
+    max_concurrency: int = 4,
+    run_id: str = "",
+    checkpoint: CheckpointStore = None,
+    deadline: float = None,
+    speculative: bool = False,
+    reporter_reserve: float = 30,
+):
     """
     TODO : refactor 
+    max_concurrency: how many planned tasks may run at the same time
+    run_id , checkpoint: save the progress of the run so resume_report can continue it
+    deadline: seconds the whole run may take, agents do less work as it gets close
+              and whatever was gathered in time is reported. None means no limit
+    speculative: let the agents start on the raw query while the planner plans
+    reporter_reserve: seconds before the deadline kept for writing the report
     """
-    planner.query = query
-    server = Server()
+    # the planner and agents are shared between requests, the query
+    # reaches them through the run context of the server
+    ctx = RunContext(
+        run_id=run_id,
+        deadline=Deadline(deadline),
+        reserve=_reserve(deadline, reporter_reserve),
+    )
+    server = Server(
+        max_concurrency=max_concurrency,
+        checkpoint=checkpoint,
+        run_id=run_id,
+        ctx=ctx,
+        speculative=speculative,
+    )
 
     planner_router = Router(server, planner)
     server.add_router(planner.name, planner_router)
@@ -26,6 +67,102 @@ async def generate_report(query, planner: Planner, agents: list[Agent]):
     server.set_initial_router(planner.name, query)
 
     report = await server.start(query=query)
-    report = report["data"]
+    report = server.export(report)["data"]
+
+    return report
+
+
+async def resume_report(
+    run_id: str,
+    agents: list[Agent],
+    checkpoint: CheckpointStore,
+    max_concurrency: int = 4,
+    deadline: float = None,
+    reporter_reserve: float = 30,
+    planner: Planner = None,
+):
+    """
+    Continue a checkpointed run from its last finished task.
+    The plan is taken from the checkpoint so the planner is not called again ,
+    unless the planner stopped before the end of the plan
+    planner: plans such a run again , the tasks it had finished are kept
+    """
+    state = checkpoint.load(run_id)
+    if state is None:
+        raise KeyError(f"no checkpoint for run {run_id}")
+
+    ctx = RunContext(
+        query=state.get("query", ""),
+        run_id=run_id,
+        deadline=Deadline(deadline),
+        reserve=_reserve(deadline, reporter_reserve),
+    )
+    server = Server(
+        max_concurrency=max_concurrency, checkpoint=checkpoint, run_id=run_id, ctx=ctx
+    )
+    if planner is not None:
+        server.add_router(planner.name, Router(server, planner))
+    for agent in agents:
+        server.add_router(agent.name, Router(server, agent))
+        if planner is not None:
+            planner.add_model(agent.name, agent.description)
+    if planner is not None:
+        server.set_initial_router(planner.name, ctx.query)
+
+    report = await server.resume(state)
+    return server.export(report)["data"]
+
+
+async def stream_report(
+    query,
+    planner: Planner,
+    agents: list[Agent],
+    max_concurrency: int = 4,
+    deadline: float = None,
+    speculative: bool = False,
+    reporter_reserve: float = 30,
+):
+    """
+    Same pipeline as generate_report but yields the events of the run
+    (plan, agent start / finish, sections) as they happen and the final report last
+    """
+    queue = asyncio.Queue()
+    token = events.set_sink(queue)
+    try:
+        job = asyncio.create_task(
+            generate_report(
+                query,
+                planner,
+                agents,
+                max_concurrency=max_concurrency,
+                deadline=deadline,
+                speculative=speculative,
+                reporter_reserve=reporter_reserve,
+            )
+        )
+    finally:
+        events.reset_sink(token)
+
+    try:
+        while True:
+            getter = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait(
+                {getter, job}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter in done:
+                yield getter.result()
+                continue
+            getter.cancel()
+            break
+
+        while not queue.empty():
+            yield queue.get_nowait()
 
-    return report
\ No newline at end of file
+        try:
+            yield events.ReportEvent(report=job.result())
+        except Exception as e:
+            logger.error(f"report generation failed: {e}")
+            yield events.ErrorEvent(detail=str(e))
+    finally:
+        if not job.done():
+            job.cancel()
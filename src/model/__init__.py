@@ -4,3 +4,5 @@ from .gemini import Gemini
 from .ollama import Ollama
 from .openai import OpenAI
 from .gork import Gork
+from .cached import CachedModel
+from .hedge import HedgedModel, hedge_stats
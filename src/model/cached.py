@@ -0,0 +1,175 @@
+"""
+Exact match cache of LLM answers
+
+CachedModel wraps any Model. An answer is reused when the provider, the model,
+the whole conversation, the new prompt and the generation parameters are
+exactly the same. Streaming callers get a cached answer replayed chunk by chunk.
+Turned on with "llm_cache" in config.json, see Factory.get_model.
+"""
+
+from .model import Model
+from ..utils import span
+from ..utils.disk_cache import DiskCache
+
+from crawl4ai import LLMConfig
+
+import asyncio
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CachedModel(Model):
+    def __init__(self, model: Model, cache: DiskCache):
+        self.inner = model
+        self.cache = cache
+
+    # --- cache -----------------------------------------------------------
+
+    def completion(self, query: str) -> str:
+        key = self._key(query, "completion")
+        hit = self.cache.get(key)
+        if hit is not None:
+            return self._replay(query, hit, "completion")
+        content = self.inner.completion(query)
+        self._store(key, content)
+        return content
+
+    async def acompletion(self, query: str) -> str:
+        key = self._key(query, "completion")
+        hit = await asyncio.to_thread(self.cache.get, key)
+        if hit is not None:
+            return self._replay(query, hit, "completion")
+        content = await self.inner.acompletion(query)
+        await asyncio.to_thread(self._store, key, content)
+        return content
+
+    def completion_stream(self, message):
+        key = self._key(message, "stream")
+        hit = self.cache.get(key)
+        if hit is not None:
+            yield from self._replay(message, hit, "stream")
+            return
+        chunks = []
+        for chunk in self.inner.completion_stream(message):
+            chunks.append(chunk)
+            yield chunk
+        # only a stream that ran to the end is cached
+        self._store(key, chunks)
+
+    async def acompletion_stream(self, message):
+        key = self._key(message, "stream")
+        hit = await asyncio.to_thread(self.cache.get, key)
+        if hit is not None:
+            for chunk in self._replay(message, hit, "stream"):
+                yield chunk
+            return
+        chunks = []
+        async for chunk in self.inner.acompletion_stream(message):
+            chunks.append(chunk)
+            yield chunk
+        await asyncio.to_thread(self._store, key, chunks)
+
+    def _key(self, query: str, kind: str) -> str:
+        """
+        kind is part of the parameters , some providers stream with other settings
+        """
+        inner = self.inner
+        key = {
+            "provider": type(inner).__name__,
+            "base_url": getattr(inner, "base_url", None),
+            "model": inner.get_model(),
+            "messages": _history(inner),
+            "query": query,
+            "kind": kind,
+            "params": {
+                name: getattr(inner, name)
+                for name in ("temperature", "top_p", "max_tokens")
+                if hasattr(inner, name)
+            },
+        }
+        data = json.dumps(key, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _store(self, key: str, value):
+        if not value:
+            return
+        try:
+            self.cache.set(key, value)
+        except Exception as e:
+            # a broken cache never breaks the completion
+            logger.warning(f"llm cache write failed: {e}")
+
+    def _replay(self, query: str, hit, kind: str):
+        """
+        the conversation goes on as if the provider had been called
+        """
+        messages = getattr(self.inner, "messages", None)
+        if isinstance(messages, list):
+            messages.append({"role": "user", "content": query})
+            # a stream only ever adds the prompt
+            if kind == "completion" and self.inner.keeps_replies:
+                messages.append({"role": "assistant", "content": hit})
+        with span("llm.cache_hit", model=self.inner.get_model(), kind=kind):
+            return hit
+
+    # --- everything else is the wrapped model -----------------------------
+
+    @property
+    def messages(self):
+        return self.inner.messages
+
+    @messages.setter
+    def messages(self, messages):
+        self.inner.messages = messages
+
+    def __getattr__(self, name):
+        # only called for attributes CachedModel doesn't have (vision , api_key ...)
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    async def abatch_completion(self, prompts, *args, offline=False, **kwargs):
+        if offline:
+            # the batch endpoint belongs to the provider
+            return await self.inner.abatch_completion(prompts, *args, offline=True, **kwargs)
+        return await super().abatch_completion(prompts, *args, **kwargs)
+
+    def fork(self) -> "CachedModel":
+        return CachedModel(self.inner.fork(), self.cache)
+
+    def get_client(self):
+        return self.inner.get_client()
+
+    def get_model(self):
+        return self.inner.get_model()
+
+    def get_llm_config(self) -> LLMConfig:
+        return self.inner.get_llm_config()
+
+    def set_api(self, api: str) -> None:
+        self.inner.set_api(api)
+
+    def clear_message(self):
+        self.inner.clear_message()
+
+
+def _history(model: Model) -> list:
+    history = []
+    # gemini keeps a second chat session for the async api
+    for name in ("messages", "achat"):
+        messages = getattr(model, name, None)
+        if isinstance(messages, list):
+            history.append(
+                [m.model_dump() if hasattr(m, "model_dump") else m for m in messages]
+            )
+        elif hasattr(messages, "get_history"):
+            history.append(
+                [
+                    [content.role, [part.text for part in content.parts or []]]
+                    for content in messages.get_history()
+                ]
+            )
+    return history
@@ -1,6 +1,9 @@
 from .model import Model
+from .transport import openai_client, async_openai_client
+from .history import context_budget, fit_history
+from .limiter import limited, alimited
+from ..utils import span
 
-from openai import OpenAI
 from dotenv import load_dotenv
 
 from crawl4ai import LLMConfig
@@ -13,18 +16,48 @@ class Deepseek(Model):
         load_dotenv(override=True)
         self.api_key = os.getenv("DEEPSEEK_API") if api_key == "" else api_key
         self.model = model
-        self.client = OpenAI(api_key=self.api_key, base_url="https://api.deepseek.com")
+        self.base_url = "https://api.deepseek.com"
         self.messages = []
+        self.context_budget = context_budget(model, "deepseek")
+
+    @property
+    def client(self):
+        return openai_client(self.api_key, self.base_url)
+
+    @property
+    def aclient(self):
+        return async_openai_client(self.api_key, self.base_url)
 
     def set_api(self, api_key: str):
         self.api_key = api_key
 
     def completion(self, query):
         self._add_message(query)
-        response = self.client.chat.completions.create(
-            model=self.model, messages=self.messages, stream=False
-        )
-        return response.choices[0].message.content
+        with span(
+            "llm.completion", provider="deepseek", model=self.model, prompt_chars=len(query)
+        ) as s:
+            with limited("deepseek", self.messages) as usage:
+                response = self.client.chat.completions.create(
+                    model=self.model, messages=self.messages, stream=False
+                )
+                usage.record(response)
+            content = response.choices[0].message.content
+            s.set(response_chars=len(content or ""))
+        return content
+
+    async def acompletion(self, query):
+        self._add_message(query)
+        with span(
+            "llm.completion", provider="deepseek", model=self.model, prompt_chars=len(query)
+        ) as s:
+            async with alimited("deepseek", self.messages) as usage:
+                response = await self.aclient.chat.completions.create(
+                    model=self.model, messages=self.messages, stream=False
+                )
+                usage.record(response)
+            content = response.choices[0].message.content
+            s.set(response_chars=len(content or ""))
+        return content
 
     def add_system_instructuion(self, instruction: str):
         pass
@@ -43,13 +76,26 @@ class Deepseek(Model):
 
     def _add_message(self, message, role="use"):
         self.messages.append({"role": "user", "content": message})
+        self.messages = fit_history(self.messages, self.context_budget)
 
     def completion_stream(self, message):
         self._add_message(message=message, role="user")
-        stream = self.client.chat.completions.create(
-            model=self.model, messages=self.messages, stream=True
-        )
-        for event in stream:
-            text_chunk = getattr(event.choices[0].delta, "content", None)
-            if text_chunk:
-                yield text_chunk
+        with limited("deepseek", self.messages):
+            stream = self.client.chat.completions.create(
+                model=self.model, messages=self.messages, stream=True
+            )
+            for event in stream:
+                text_chunk = getattr(event.choices[0].delta, "content", None)
+                if text_chunk:
+                    yield text_chunk
+
+    async def acompletion_stream(self, message):
+        self._add_message(message=message, role="user")
+        async with alimited("deepseek", self.messages):
+            stream = await self.aclient.chat.completions.create(
+                model=self.model, messages=self.messages, stream=True
+            )
+            async for event in stream:
+                text_chunk = getattr(event.choices[0].delta, "content", None)
+                if text_chunk:
+                    yield text_chunk
@@ -1,6 +1,5 @@
 from google import genai
 from google.genai import types
-from openai import OpenAI
 
 from crawl4ai import LLMConfig
 
@@ -8,6 +7,10 @@ import os
 from dotenv import load_dotenv
 
 from .model import Model
+from .transport import openai_client
+from .history import context_budget, fit_history
+from .limiter import limited, alimited
+from ..utils import span
 
 
 """
@@ -21,35 +24,79 @@ class Gemini(Model):
         self.api_key = os.getenv("GEMINI_API")
         self.model = model
         self.client = genai.Client(api_key=self.api_key)
+        self.context_budget = context_budget(model, "gemini")
+        # the sync and the async api keep their own chat session
         self.messages = self.client.chats.create(model=model)
+        self.achat = self.client.aio.chats.create(model=model)
 
     def clear_message(self):
         self.messages = self.client.chats.create(model=self.model)
+        self.achat = self.client.aio.chats.create(model=self.model)
 
     def set_api(self, api):
         self.api = api
 
     def completion(self, query: str):
-        res = self.message.send_message(query)
+        with span(
+            "llm.completion", provider="gemini", model=self.model, prompt_chars=len(query)
+        ) as s:
+            self.messages = self._fit_chat(self.messages, self.client.chats)
+            with limited("gemini", query) as usage:
+                res = self.messages.send_message(query)
+                usage.record(res)
+            s.set(response_chars=len(res.text or ""))
         return res.text
 
+    async def acompletion(self, query: str):
+        with span(
+            "llm.completion", provider="gemini", model=self.model, prompt_chars=len(query)
+        ) as s:
+            self.achat = self._fit_chat(self.achat, self.client.aio.chats)
+            async with alimited("gemini", query) as usage:
+                res = await self.achat.send_message(query)
+                usage.record(res)
+            s.set(response_chars=len(res.text or ""))
+        return res.text
+
+    def completion_stream(self, message):
+        self.messages = self._fit_chat(self.messages, self.client.chats)
+        with limited("gemini", message):
+            for chunk in self.messages.send_message_stream(message):
+                if chunk.text:
+                    yield chunk.text
+
+    async def acompletion_stream(self, message):
+        self.achat = self._fit_chat(self.achat, self.client.aio.chats)
+        async with alimited("gemini", message):
+            async for chunk in await self.achat.send_message_stream(message):
+                if chunk.text:
+                    yield chunk.text
+
+    def _fit_chat(self, chat, chats):
+        """
+        the chat keeps its history , a new one is started with the part that fits the budget
+        """
+        history = chat.get_history(curated=True)
+        fitted = fit_history(history, self.context_budget)
+        if fitted is history:
+            return chat
+        return chats.create(model=self.model, history=fitted)
+
     def reset(self):
         """
         Reset chat message
         """
-        self.message = self.client.chats.create(model=Model)
+        self.clear_message()
 
     def add_system_instruction(self, instruction: str):
-        self.message.send_message(
+        self.messages.send_message(
             config=types.GenerateContentConfig(system_instruction=instruction)
         )
 
     def get_client(self):
-        client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+        return openai_client(
+            self.api_key, "https://generativelanguage.googleapis.com/v1beta/openai/"
         )
-        return client
 
     def get_llm_config(self) -> LLMConfig:
         return LLMConfig(provider="gemini/" + self.model, api_token=self.api_key)
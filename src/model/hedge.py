@@ -0,0 +1,379 @@
+"""
+Hedged requests
+
+A stalled request of one provider keeps the user waiting while other providers
+are idle. HedgedModel sends the request to the primary model and , when no
+first token arrived within the usual latency of that model (a percentile of
+its recent first token latencies), sends the same request to a secondary
+model , often a local Ollama. The first one to answer is used and the other
+one is cancelled. A primary that fails is replaced by the secondary at once.
+Completions are streamed and joined , the whole answer of a long generation
+is late from every provider and says nothing about a stalled request.
+Both calls run on forks , only the winning answer goes to the history of the primary.
+
+Latencies and win rates are kept per primary / secondary pair for the whole
+process , see hedge_stats().
+Turned on with "hedge" in config.json, see Factory.get_model.
+"""
+
+from .history import fit_history
+from .model import Model
+from ..utils import span
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from crawl4ai import LLMConfig
+from typing import Optional
+
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_latencies: dict[str, "LatencyStats"] = {}
+_counters: dict[str, dict] = {}
+# sync calls race in threads , a lost call can't be stopped and finishes here
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+# first chunk of a stream that ended without any
+_END = object()
+
+
+class LatencyStats:
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        with _lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float, min_samples: int = 20) -> Optional[float]:
+        """
+        None until min_samples latencies are known
+        """
+        with _lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(int(p * len(samples)), len(samples) - 1)]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+def _name(model: Model) -> str:
+    return f"{type(model).__name__}:{model.get_model()}"
+
+
+def _latency(name: str) -> LatencyStats:
+    with _lock:
+        return _latencies.setdefault(name, LatencyStats())
+
+
+def _count(pair: str, *names: str):
+    with _lock:
+        counter = _counters.setdefault(
+            pair, {"calls": 0, "hedged": 0, "primary_wins": 0, "secondary_wins": 0, "failed": 0}
+        )
+        for name in names:
+            counter[name] += 1
+
+
+def hedge_stats() -> dict:
+    """
+    win rates of every pair and the first token latencies of every model
+    """
+    with _lock:
+        pairs = {pair: dict(counter) for pair, counter in _counters.items()}
+        latencies = {name: sorted(stats._samples) for name, stats in _latencies.items()}
+    for counter in pairs.values():
+        hedged = counter["hedged"] or 1
+        counter["secondary_win_rate"] = counter["secondary_wins"] / hedged
+    return {
+        "pairs": pairs,
+        "latencies": {
+            name: {
+                "samples": len(samples),
+                "p50": samples[len(samples) // 2] if samples else None,
+                "p95": samples[min(int(0.95 * len(samples)), len(samples) - 1)]
+                if samples
+                else None,
+            }
+            for name, samples in latencies.items()
+        },
+    }
+
+
+class HedgedModel(Model):
+    def __init__(
+        self,
+        primary: Model,
+        secondary: Model,
+        percentile: float = 0.95,
+        min_delay: float = 1.0,
+        max_delay: float = 10.0,
+        default_delay: float = 3.0,
+    ):
+        """
+        percentile: the secondary starts when the primary is slower than this share of its calls
+        min_delay / max_delay: bounds of that wait in seconds
+        default_delay: wait until enough latencies of the primary are known
+        """
+        self.primary = primary
+        self.secondary = secondary
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+
+    def delay(self, kind: str) -> float:
+        """
+        seconds to wait for the first token of the primary before hedging
+        """
+        delay = _latency(f"{_name(self.primary)}:{kind}").percentile(self.percentile)
+        if delay is None:
+            delay = self.default_delay
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    # --- async -------------------------------------------------------------
+
+    async def acompletion(self, query: str) -> str:
+        # the whole answer of a long generation comes late from any provider , only
+        # the first chunk tells a stalled request apart , so the answer is streamed
+        history = self._history()
+        chunks = [chunk async for chunk in self._astream(query, history)]
+        reply = "".join(chunks)
+        self._commit(history, query, reply)
+        return reply
+
+    async def acompletion_stream(self, message):
+        history = self._history()
+        async for chunk in self._astream(message, history):
+            yield chunk
+        self._commit(history, message)
+
+    async def _astream(self, message, history: Optional[list]):
+        kind = "stream"
+        start = time.monotonic()
+        primary, secondary = self._contenders(history)
+        streams = {"primary": primary.acompletion_stream(message)}
+        first = asyncio.ensure_future(_anext(streams["primary"]))
+        tasks = {first: "primary"}
+        winner = None
+        done, _ = await asyncio.wait({first}, timeout=self.delay(kind))
+        try:
+            if done and first.exception() is None:
+                self._record(kind, start, "primary")
+                winner = first
+            else:
+                streams["secondary"] = secondary.acompletion_stream(message)
+                tasks[asyncio.ensure_future(_anext(streams["secondary"]))] = "secondary"
+                with span("llm.hedge", model=self.get_model(), kind=kind) as s:
+                    winner = await self._race(tasks, start, kind)
+                    s.set(winner=tasks[winner])
+        finally:
+            for task, name in tasks.items():
+                if task is not winner:
+                    task.cancel()
+                    # the stream is closed once its pending __anext__ is over
+                    await asyncio.wait({task})
+                    await _aclose(streams[name])
+
+        chunk = winner.result()
+        if chunk is _END:
+            return
+        yield chunk
+        async for chunk in streams[tasks[winner]]:
+            yield chunk
+
+    async def _race(self, tasks: dict, start: float, kind: str) -> asyncio.Future:
+        """
+        the first task that succeeds , the error of the primary when both fail
+        """
+        _count(self._pair(), "hedged")
+        pending = set(tasks)
+        errors = {}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    self._record(kind, start, tasks[task], "primary" in errors)
+                    return task
+                errors[tasks[task]] = error
+                logger.warning(f"hedged {tasks[task]} {kind} failed: {error}")
+        _count(self._pair(), "calls", "failed")
+        raise errors.get("primary") or errors["secondary"]
+
+    # --- sync --------------------------------------------------------------
+
+    def completion(self, query: str) -> str:
+        history = self._history()
+        reply = "".join(self._stream(query, history))
+        self._commit(history, query, reply)
+        return reply
+
+    def completion_stream(self, message):
+        history = self._history()
+        yield from self._stream(message, history)
+        self._commit(history, message)
+
+    def _stream(self, message, history: Optional[list]):
+        kind = "stream"
+        start = time.monotonic()
+        primary, secondary = self._contenders(history)
+        streams = {"primary": primary.completion_stream(message)}
+        first = _executor.submit(next, streams["primary"], _END)
+        futures = {first: "primary"}
+        done, _ = wait_futures({first}, timeout=self.delay(kind))
+        if done and first.exception() is None:
+            self._record(kind, start, "primary")
+            winner = first
+        else:
+            streams["secondary"] = secondary.completion_stream(message)
+            futures[_executor.submit(next, streams["secondary"], _END)] = "secondary"
+            with span("llm.hedge", model=self.get_model(), kind=kind) as s:
+                winner = self._race_sync(futures, start, kind)
+                s.set(winner=futures[winner])
+        for future, name in futures.items():
+            if future is not winner:
+                # a generator can only be closed once its next() returned
+                future.add_done_callback(lambda _, stream=streams[name]: stream.close())
+
+        chunk = winner.result()
+        if chunk is _END:
+            return
+        yield chunk
+        yield from streams[futures[winner]]
+
+    def _race_sync(self, futures: dict, start: float, kind: str):
+        _count(self._pair(), "hedged")
+        pending = set(futures)
+        errors = {}
+        while pending:
+            done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    self._record(kind, start, futures[future], "primary" in errors)
+                    return future
+                errors[futures[future]] = error
+                logger.warning(f"hedged {futures[future]} {kind} failed: {error}")
+        _count(self._pair(), "calls", "failed")
+        raise errors.get("primary") or errors["secondary"]
+
+    # --- bookkeeping -------------------------------------------------------
+
+    def _pair(self) -> str:
+        return f"{_name(self.primary)} -> {_name(self.secondary)}"
+
+    def _record(self, kind: str, start: float, winner: str, primary_failed: bool = False):
+        elapsed = time.monotonic() - start
+        model = self.primary if winner == "primary" else self.secondary
+        _latency(f"{_name(model)}:{kind}").add(elapsed)
+        if winner == "secondary" and not primary_failed:
+            # the primary is cancelled , it was at least this slow. Keeping only the
+            # winners would leave its slow calls out and the hedge delay would shrink
+            _latency(f"{_name(self.primary)}:{kind}").add(elapsed)
+        _count(self._pair(), "calls", f"{winner}_wins")
+
+    def _history(self) -> Optional[list]:
+        messages = getattr(self.primary, "messages", None)
+        return list(messages) if isinstance(messages, list) else None
+
+    def _contenders(self, history: Optional[list]) -> tuple[Model, Model]:
+        """
+        forks of both models with the conversation of the primary , the call that
+        loses keeps running on its fork and never touches the real history
+        """
+        secondary = self.secondary.fork()
+        if history is None:
+            # the history isn't a list (gemini chats) , the primary answers on itself
+            return self.primary, secondary
+        primary = self.primary.fork()
+        primary.messages = list(history)
+        if isinstance(getattr(secondary, "messages", None), list):
+            secondary.messages = list(history)
+        return primary, secondary
+
+    def _commit(self, history: Optional[list], message: str, reply: Optional[str] = None):
+        """
+        the history of the primary goes on with the winning answer only , like the
+        primary would have done it: the prompt , and the answer of a completion when
+        the primary keeps its replies
+        """
+        if history is None:
+            return
+        messages = history + [{"role": "user", "content": message}]
+        if reply is not None and self.primary.keeps_replies:
+            messages.append({"role": "assistant", "content": reply})
+        budget = getattr(self.primary, "context_budget", None)
+        self.primary.messages = fit_history(messages, budget) if budget else messages
+
+    # --- everything else is the primary model ------------------------------
+
+    @property
+    def keeps_replies(self) -> bool:
+        return self.primary.keeps_replies
+
+    @property
+    def messages(self):
+        return self.primary.messages
+
+    @messages.setter
+    def messages(self, messages):
+        self.primary.messages = messages
+
+    def __getattr__(self, name):
+        if name in ("primary", "secondary"):
+            raise AttributeError(name)
+        return getattr(self.primary, name)
+
+    async def abatch_completion(self, prompts, *args, offline=False, **kwargs):
+        if offline:
+            # the batch endpoint belongs to the provider
+            return await self.primary.abatch_completion(prompts, *args, offline=True, **kwargs)
+        return await super().abatch_completion(prompts, *args, **kwargs)
+
+    def fork(self) -> "HedgedModel":
+        return HedgedModel(
+            self.primary.fork(),
+            self.secondary.fork(),
+            percentile=self.percentile,
+            min_delay=self.min_delay,
+            max_delay=self.max_delay,
+            default_delay=self.default_delay,
+        )
+
+    def get_client(self):
+        return self.primary.get_client()
+
+    def get_model(self):
+        return self.primary.get_model()
+
+    def get_llm_config(self) -> LLMConfig:
+        return self.primary.get_llm_config()
+
+    def set_api(self, api: str) -> None:
+        self.primary.set_api(api)
+
+    def clear_message(self):
+        self.primary.clear_message()
+        self.secondary.clear_message()
+
+
+async def _anext(stream):
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return _END
+
+
+async def _aclose(stream):
+    try:
+        await stream.aclose()
+    except Exception:
+        pass
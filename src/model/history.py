@@ -0,0 +1,204 @@
+"""
+Token budget of a conversation
+
+Providers resend the whole history with every completion, a long chat gets
+slower and more expensive with every turn until the context window overflows.
+fit_history() keeps the history under a token budget:
+    - system messages and the newest message are always kept
+    - old messages above compact_tokens are cut to their head and tail first ,
+      they are mostly pasted search results and documents
+    - then the oldest turns are dropped
+
+Token counts come from tiktoken when it is installed and are cached per
+message text. The budget is the context window of the model minus room for
+the answer , capped by "history_tokens" in config.json.
+"""
+
+from typing import Optional
+
+from ..utils import LRUCache, read_config
+
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # not installed or no encoding files offline
+    _encoding = None
+
+# tokens of the role and separators around every message
+MESSAGE_OVERHEAD = 4
+
+# context windows by model name prefix , the first match wins
+CONTEXT_WINDOWS = [
+    ("gpt-4.1", 1_000_000),
+    ("gpt-4o", 128_000),
+    ("gpt-4-turbo", 128_000),
+    ("gpt-4", 8_192),
+    ("gpt-3.5", 16_385),
+    ("o1", 200_000),
+    ("o3", 200_000),
+    ("o4", 200_000),
+    ("deepseek", 64_000),
+    ("grok", 131_072),
+    ("gemini", 1_000_000),
+    ("claude", 200_000),
+    ("meta-llama/llama-3", 128_000),
+    ("llama3", 128_000),
+    ("qwen", 32_768),
+    ("mistral", 32_768),
+]
+
+# ollama runs every model with a small context unless num_ctx is raised
+PROVIDER_WINDOWS = {"ollama": 4_096}
+
+DEFAULT_WINDOW = 8_192
+# room left for the answer
+ANSWER_TOKENS = 4_096
+
+
+# keyed on a digest of the text , the prompts themselves (all the sources of a
+# report section) would stay in memory as keys
+_counts = LRUCache(maxsize=4096)
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    count = _counts.get(key)
+    if count is None:
+        count = _count_tokens(text)
+        _counts.set(key, count)
+    return count
+
+
+def _count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # about 4 ascii characters per token , other scripts about one per character
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def message_tokens(message) -> int:
+    return count_tokens(_text(message)) + MESSAGE_OVERHEAD
+
+
+def context_budget(model: str, provider: str = "") -> int:
+    """
+    tokens the history of model may use
+    config.json: "context_windows" {model: tokens} , "history_tokens" cap
+    """
+    config = read_config()
+    window = config.get("context_windows", {}).get(model)
+    if window is None:
+        window = PROVIDER_WINDOWS.get(provider)
+    if window is None:
+        name = (model or "").lower()
+        # "openai/gpt-4o" (openrouter) is matched on the full name , then on "gpt-4o"
+        names = [name, name.rsplit("/", 1)[-1]]
+        window = next(
+            (
+                size
+                for candidate in names
+                for prefix, size in CONTEXT_WINDOWS
+                if candidate.startswith(prefix)
+            ),
+            DEFAULT_WINDOW,
+        )
+    budget = max(window - min(ANSWER_TOKENS, window // 4), 256)
+    cap = config.get("history_tokens")
+    return min(budget, cap) if cap else budget
+
+
+def fit_history(
+    messages: list, budget: int, keep_last: int = 1, compact_tokens: int = 1024
+) -> list:
+    """
+    messages: dicts , pydantic messages or gemini contents
+    keep_last: newest messages that are never touched
+    compact_tokens: old messages longer than this are cut before anything is dropped
+    returns messages itself when it already fits
+    """
+    tokens = [message_tokens(m) for m in messages]
+    total = sum(tokens)
+    if total <= budget:
+        return messages
+
+    messages = list(messages)
+    last = len(messages) - keep_last
+    old = [i for i in range(last) if _role(messages[i]) != "system"]
+
+    for i in old:
+        if total <= budget:
+            break
+        if tokens[i] > compact_tokens:
+            compacted = _compact(messages[i], compact_tokens)
+            if compacted is not None:
+                messages[i] = compacted
+                size = message_tokens(compacted)
+                total -= tokens[i] - size
+                tokens[i] = size
+
+    dropped = set()
+    for i in old:
+        if total <= budget:
+            break
+        dropped.add(i)
+        total -= tokens[i]
+    # a conversation starts with the user , drop the answers left without a question
+    for i in old:
+        if i in dropped:
+            continue
+        if _role(messages[i]) == "user":
+            break
+        dropped.add(i)
+        total -= tokens[i]
+
+    if total > budget:
+        logger.warning(f"history of {total} tokens is still above the budget of {budget}")
+    logger.debug(f"history fitted to {total} tokens , {len(dropped)} messages dropped")
+    return [m for i, m in enumerate(messages) if i not in dropped]
+
+
+def _text(message) -> str:
+    if isinstance(message, dict):
+        content = message.get("content")
+    else:
+        content = getattr(message, "content", None)
+        parts = getattr(message, "parts", None)
+        if content is None and parts is not None:
+            content = "".join(getattr(part, "text", None) or "" for part in parts)
+    if isinstance(content, list):
+        # multimodal content , only the text counts
+        content = "".join(
+            part.get("text", "") for part in content if isinstance(part, dict)
+        )
+    return content or ""
+
+
+def _role(message) -> Optional[str]:
+    if isinstance(message, dict):
+        return message.get("role")
+    return getattr(message, "role", None)
+
+
+def _compact(message, max_tokens: int) -> Optional[dict]:
+    content = _text(message)
+    # gemini contents can't be rebuilt as text , they can only be dropped
+    if not content or not (isinstance(message, dict) or hasattr(message, "content")):
+        return None
+    chars = max_tokens * 4
+    if len(content) <= chars:
+        return None
+    head = chars * 2 // 3
+    tail = chars - head
+    return {
+        "role": _role(message),
+        "content": content[:head] + "\n[...]\n" + content[-tail:],
+    }
@@ -0,0 +1,293 @@
+"""
+Rate limits of the providers
+
+Overlapping report runs used to send as many completions as they liked, went
+past the RPM / TPM limits of the provider and collapsed into 429 retries.
+Every provider has one RateLimiter for the whole process:
+    - max_concurrency requests in flight , the others wait in a FIFO queue
+    - a request bucket (rpm) and a token bucket (tpm) , a request reserves its
+      estimated tokens when it leaves the queue and sleeps until the buckets
+      can pay for it , the estimate is corrected with the usage of the answer
+    - a 429 pauses the whole provider for its retry-after instead of every
+      caller retrying on its own
+
+config.json:
+    "rate_limits": {"openai": {"rpm": 500, "tpm": 200000, "max_concurrency": 8}}
+A provider without an entry is not limited.
+"""
+
+from contextlib import asynccontextmanager, contextmanager
+from collections import deque
+from typing import Optional
+
+from .history import message_tokens
+from ..utils import read_config, span
+
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# pause after a 429 without a retry-after header
+DEFAULT_PAUSE = 5.0
+
+
+class _Bucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        takes amount at once , the seconds until the bucket is out of debt
+        """
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # one request larger than the bucket waits for a full bucket , not forever
+        self.level -= min(amount, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def refund(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Waiter:
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+
+    def wake(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(_set_result, self.future)
+        else:
+            self.event.set()
+
+
+def _set_result(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Usage:
+    """
+    handed to the caller of limit() , the tokens the answer really used
+    """
+
+    def __init__(self, estimate: int):
+        self.estimate = estimate
+        self.tokens: Optional[int] = None
+
+    def record(self, response):
+        usage = getattr(response, "usage", None)
+        total = getattr(usage, "total_tokens", None)
+        if total is None:
+            # gemini
+            total = getattr(getattr(response, "usage_metadata", None), "total_token_count", None)
+        if total is None and isinstance(response, dict):
+            # ollama
+            total = (response.get("prompt_eval_count") or 0) + (response.get("eval_count") or 0)
+        if total:
+            self.tokens = total
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        name: str = "",
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self._requests = _Bucket(rpm) if rpm else None
+        self._tokens = _Bucket(tpm) if tpm else None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters: deque[_Waiter] = deque()
+        self._paused_until = 0.0
+
+    # --- public ------------------------------------------------------------
+
+    @contextmanager
+    def limit(self, tokens: int = 0):
+        self._acquire_slot()
+        try:
+            waited = self._reserve(tokens)
+            if waited:
+                with span("llm.rate_limit", provider=self.name, waited=round(waited, 3)):
+                    time.sleep(waited)
+            usage = Usage(tokens)
+            try:
+                yield usage
+            except Exception as e:
+                self._on_error(e)
+                raise
+            self._settle(usage)
+        finally:
+            self._release_slot()
+
+    @asynccontextmanager
+    async def alimit(self, tokens: int = 0):
+        await self._aacquire_slot()
+        try:
+            waited = self._reserve(tokens)
+            if waited:
+                with span("llm.rate_limit", provider=self.name, waited=round(waited, 3)):
+                    await asyncio.sleep(waited)
+            usage = Usage(tokens)
+            try:
+                yield usage
+            except Exception as e:
+                self._on_error(e)
+                raise
+            self._settle(usage)
+        finally:
+            self._release_slot()
+
+    def pause(self, seconds: float):
+        """
+        no request starts for seconds , after the provider answered 429
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logger.warning(f"{self.name} is rate limited , pausing {seconds:.1f}s")
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    # --- concurrency -------------------------------------------------------
+
+    def _try_slot(self, waiter: _Waiter) -> bool:
+        with self._lock:
+            if self.max_concurrency is None or (
+                self._in_flight < self.max_concurrency and not self._waiters
+            ):
+                self._in_flight += 1
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def _acquire_slot(self):
+        waiter = _Waiter()
+        if not self._try_slot(waiter):
+            waiter.event.wait()
+
+    async def _aacquire_slot(self):
+        waiter = _Waiter(asyncio.get_running_loop())
+        if self._try_slot(waiter):
+            return
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter not in self._waiters
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        with self._lock:
+            if self._waiters:
+                # the slot goes straight to the oldest waiter , nobody can jump the queue
+                self._waiters.popleft().wake()
+            else:
+                self._in_flight -= 1
+
+    # --- buckets -----------------------------------------------------------
+
+    def _reserve(self, tokens: int) -> float:
+        now = time.monotonic()
+        with self._lock:
+            wait = max(0.0, self._paused_until - now)
+            if self._requests:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens and tokens:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+        return wait
+
+    def _settle(self, usage: Usage):
+        if self._tokens is None or usage.tokens is None:
+            return
+        with self._lock:
+            self._tokens.refund(usage.estimate - usage.tokens)
+
+    def _on_error(self, error: Exception):
+        status = getattr(error, "status_code", None) or getattr(
+            getattr(error, "response", None), "status_code", None
+        )
+        if status == 429 or type(error).__name__ == "RateLimitError":
+            self.pause(_retry_after(error))
+
+
+def _retry_after(error: Exception) -> float:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", DEFAULT_PAUSE))
+    except (TypeError, ValueError):
+        return DEFAULT_PAUSE
+
+
+_lock = threading.Lock()
+_limiters: dict[str, Optional[RateLimiter]] = {}
+
+
+def get_limiter(provider: str) -> Optional[RateLimiter]:
+    """
+    the limiter of provider , None when config.json doesn't limit it
+    """
+    with _lock:
+        if provider not in _limiters:
+            config = (read_config().get("rate_limits") or {}).get(provider)
+            _limiters[provider] = (
+                RateLimiter(
+                    provider,
+                    rpm=config.get("rpm"),
+                    tpm=config.get("tpm"),
+                    max_concurrency=config.get("max_concurrency"),
+                )
+                if config
+                else None
+            )
+        return _limiters[provider]
+
+
+def estimate_tokens(messages) -> int:
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    return sum(message_tokens(m) for m in messages)
+
+
+@contextmanager
+def limited(provider: str, messages):
+    """
+    with limited("openai", messages) as usage: ... usage.record(response)
+    """
+    limiter = get_limiter(provider)
+    if limiter is None:
+        yield Usage(0)
+        return
+    with limiter.limit(estimate_tokens(messages)) as usage:
+        yield usage
+
+
+@asynccontextmanager
+async def alimited(provider: str, messages):
+    limiter = get_limiter(provider)
+    if limiter is None:
+        yield Usage(0)
+        return
+    async with limiter.alimit(estimate_tokens(messages)) as usage:
+        yield usage
@@ -1,7 +1,18 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Optional
+
+import asyncio
+import copy
+import logging
+import time
 
 from crawl4ai import LLMConfig
 
+from ..utils import span
+
+logger = logging.getLogger(__name__)
+
 
 class Model(ABC):
     """
@@ -11,6 +22,9 @@ class Model(ABC):
     TODO: should we have one api that support
     """
 
+    # completion() also appends the reply of the model to messages
+    keeps_replies = False
+
     @abstractmethod
     def __init__(self):
         pass
@@ -50,3 +64,138 @@ class Model(ABC):
     @abstractmethod
     def completion_stream(self, message):
         pass
+
+    """
+        acompletion / acompletion_stream are the async versions used inside
+        the event loop. Providers override them with their async clients,
+        the defaults run the blocking calls in a worker thread
+    """
+
+    async def acompletion(self, query: str) -> str:
+        return await asyncio.to_thread(self.completion, query)
+
+    async def acompletion_stream(self, message) -> AsyncIterator[str]:
+        stream = self.completion_stream(message)
+        while True:
+            chunk = await asyncio.to_thread(next, stream, None)
+            if chunk is None:
+                break
+            yield chunk
+
+    """
+        batch_completion / abatch_completion run many independent prompts at
+        the same time , every prompt on its own fork so no history is shared.
+        The answers come back in the order of the prompts and a prompt that
+        failed after its retries holds its exception instead of an answer.
+        Rate limits of the provider apply to every request (see limiter.py)
+    """
+
+    async def abatch_completion(
+        self,
+        prompts: list[str],
+        max_concurrency: int = 4,
+        retries: int = 0,
+        parse: Optional[Callable[[str], Any]] = None,
+        timeout: Optional[float] = None,
+        on_result: Optional[Callable[[int, Any], None]] = None,
+        offline: bool = False,
+    ) -> list:
+        """
+        parse: applied to every answer , an error in it is retried like a failed request
+        timeout: seconds for the whole batch , unfinished prompts get asyncio.TimeoutError
+        on_result: called with (index , answer) as soon as a prompt succeeds
+        offline: use the cheaper batch endpoint of the provider if it has one ,
+            only for work that can wait (hours) , ignored by the other providers
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run(index: int, prompt: str):
+            for attempt in range(retries + 1):
+                if attempt:
+                    # the slot is free for other prompts while this one backs off
+                    await asyncio.sleep(_backoff(attempt))
+                try:
+                    async with semaphore:
+                        res = await self.fork().acompletion(prompt)
+                    if parse is not None:
+                        res = parse(res)
+                except Exception as e:
+                    error = e
+                    logger.warning(f"batch prompt {index} attempt {attempt + 1} failed: {e}")
+                    continue
+                if on_result is not None:
+                    on_result(index, res)
+                return res
+            raise error
+
+        if not prompts:
+            return []
+        with span(
+            "llm.batch",
+            model=self.get_model(),
+            prompts=len(prompts),
+            max_concurrency=max_concurrency,
+        ) as s:
+            tasks = [asyncio.create_task(run(i, p)) for i, p in enumerate(prompts)]
+            try:
+                _, pending = await asyncio.wait(tasks, timeout=timeout)
+            finally:
+                for task in tasks:
+                    task.cancel()
+            results = [
+                asyncio.TimeoutError(f"batch prompt {i} timed out")
+                if task in pending
+                else task.exception() or task.result()
+                for i, task in enumerate(tasks)
+            ]
+            s.set(failed=sum(isinstance(r, Exception) for r in results))
+        return results
+
+    def batch_completion(
+        self,
+        prompts: list[str],
+        max_concurrency: int = 4,
+        retries: int = 0,
+        parse: Optional[Callable[[str], Any]] = None,
+    ) -> list:
+        """
+        abatch_completion for code outside the event loop , the prompts run in threads
+        """
+
+        def run(index: int, prompt: str):
+            for attempt in range(retries + 1):
+                if attempt:
+                    time.sleep(_backoff(attempt))
+                try:
+                    res = self.fork().completion(prompt)
+                    return parse(res) if parse is not None else res
+                except Exception as e:
+                    error = e
+                    logger.warning(f"batch prompt {index} attempt {attempt + 1} failed: {e}")
+            return error
+
+        if not prompts:
+            return []
+        with span(
+            "llm.batch",
+            model=self.get_model(),
+            prompts=len(prompts),
+            max_concurrency=max_concurrency,
+        ) as s:
+            with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+                results = list(pool.map(run, range(len(prompts)), prompts))
+            s.set(failed=sum(isinstance(r, Exception) for r in results))
+        return results
+
+    def fork(self) -> "Model":
+        """
+        Copy of this model that shares the client but has its own empty history.
+        Shared agents use one fork per run so concurrent runs never mix messages
+        """
+        clone = copy.copy(self)
+        clone.clear_message()
+        return clone
+
+
+def _backoff(attempt: int) -> float:
+    return min(0.5 * 2 ** (attempt - 1), 8.0)
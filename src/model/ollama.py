@@ -1,14 +1,21 @@
 from .model import Model
-from openai import OpenAI
+from .transport import openai_client
+from .history import context_budget, fit_history
+from .limiter import limited, alimited
+from ..utils import span
 
-from ollama import chat
+from ollama import chat, AsyncClient
 from crawl4ai import LLMConfig
 
 
 class Ollama(Model):
+    keeps_replies = True
+
     def __init__(self, model: str):
         self.model = model
         self.messages = []
+        self.context_budget = context_budget(model, "ollama")
+        self.aclient = AsyncClient()
 
     def set_api(self, api):
         """
@@ -20,7 +27,16 @@ class Ollama(Model):
         self._append_message(message=message, role="user")
         msg_cache = ""
         if stream == False:
-            res = chat(model=self.model, messages=self.messages, stream=False)
+            with span(
+                "llm.completion",
+                provider="ollama",
+                model=self.model,
+                prompt_chars=len(message),
+            ) as s:
+                with limited("ollama", self.messages) as usage:
+                    res = chat(model=self.model, messages=self.messages, stream=False)
+                    usage.record(res)
+                s.set(response_chars=len(res["message"]["content"] or ""))
             self._append_message(role="assistant", message=res["message"]["content"])
         else:
             """
@@ -34,17 +50,42 @@ class Ollama(Model):
 
     def completion_stream(self, message: str):
         self._append_message(message=message, role="user")
-        res = chat(model=self.model, messages=self.messages, stream=True)
-        for chunk in res:
-            if chunk["message"]["content"]:
-                yield chunk["message"]["content"]
+        with limited("ollama", self.messages):
+            res = chat(model=self.model, messages=self.messages, stream=True)
+            for chunk in res:
+                if chunk["message"]["content"]:
+                    yield chunk["message"]["content"]
+
+    async def acompletion(self, message: str):
+        self._append_message(message=message, role="user")
+        with span(
+            "llm.completion",
+            provider="ollama",
+            model=self.model,
+            prompt_chars=len(message),
+        ) as s:
+            async with alimited("ollama", self.messages) as usage:
+                res = await self.aclient.chat(
+                    model=self.model, messages=self.messages, stream=False
+                )
+                usage.record(res)
+            s.set(response_chars=len(res["message"]["content"] or ""))
+        self._append_message(role="assistant", message=res["message"]["content"])
+        return res["message"]["content"]
+
+    async def acompletion_stream(self, message: str):
+        self._append_message(message=message, role="user")
+        async with alimited("ollama", self.messages):
+            res = await self.aclient.chat(
+                model=self.model, messages=self.messages, stream=True
+            )
+            async for chunk in res:
+                if chunk["message"]["content"]:
+                    yield chunk["message"]["content"]
 
     def get_client(self):
-        client = OpenAI(
-            base_url="http://localhost:11434/v1",
-            api_key="ollama",  # required, but unused
-        )
-        return client
+        # api key is required, but unused
+        return openai_client("ollama", "http://localhost:11434/v1")
 
     def get_model(self):
         return self.model
@@ -57,3 +98,4 @@ class Ollama(Model):
 
     def _append_message(self, role: str, message: str):
         self.messages.append({"role": role, "content": message})
+        self.messages = fit_history(self.messages, self.context_budget)
@@ -1,17 +1,27 @@
 from .model import Model
-from ..utils import read_config
+from .transport import openai_client, async_openai_client, OPENAI_BASE_URL
+from .history import context_budget, fit_history
+from .limiter import limited, alimited
+from ..utils import read_config, span
 
-from openai import OpenAI as openai
 from dotenv import load_dotenv
 
 from crawl4ai import LLMConfig
 
+import asyncio
+import json
 import os
+import time
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+# openrouter answers without choices when the upstream provider failed
+EMPTY_RETRIES = 3
+# how often an offline batch is polled , they take minutes to hours
+BATCH_POLL_SECONDS = 30
+
 
 class OpenAI(Model):
     def __init__(self, model: str = "", api_key: str = ""):
@@ -19,78 +29,242 @@ class OpenAI(Model):
         self.api_key = os.getenv("OPENAI_API_KEY")
 
         config = read_config()
-        if config.get("base_url", "") == "":
-            self.client = openai(
-                api_key=self.api_key,
-            )
-        else:
-            self.client = openai(
-                api_key=self.api_key, base_url=config.get("base_url", "")
-            )
+        # None is the default openai endpoint
+        self.base_url = config.get("base_url", "") or None
 
         self.model = model
         self.messages = []
+        self.context_budget = context_budget(model, "openai")
+
+    @property
+    def client(self):
+        # pooled clients , every model with the same endpoint shares the connections
+        return openai_client(self.api_key, self.base_url)
+
+    @property
+    def aclient(self):
+        return async_openai_client(self.api_key, self.base_url)
 
     def set_api(self, api_key: str):
         self.api_key = api_key
 
     def completion(self, query):
         self._add_message(query)
-        response = self.client.chat.completions.create(
-            model=self.model, messages=self.messages, stream=False
-        )
-        while not response.choices:
-            response = self.client.chat.completions.create(
-                model=self.model, messages=self.messages, stream=False
-            )
-        return response.choices[0].message.content
+        with span(
+            "llm.completion", provider="openai", model=self.model, prompt_chars=len(query)
+        ) as s:
+            response = self._create()
+            content = response.choices[0].message.content
+            s.set(response_chars=len(content or ""))
+        return content
+
+    async def acompletion(self, query):
+        self._add_message(query)
+        with span(
+            "llm.completion", provider="openai", model=self.model, prompt_chars=len(query)
+        ) as s:
+            response = await self._acreate()
+            content = response.choices[0].message.content
+            s.set(response_chars=len(content or ""))
+        return content
 
     def completion_stream(self, message):
         self._add_message(message=message, role="user")
 
         try:
-            stream = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                stream=True,
-                temperature=0.7,
-                extra_body={
-                    "provider": {
-                        "order": ["cerebras","groq"], 
-                        "allow_fallbacks": True
-                    }
-                }
-            )
+            with limited("openai", self.messages):
+                stream = self.client.chat.completions.create(
+                    **self._stream_args()
+                )
 
-            buffer = []
-            buffer_size = 3  # smaller buffer for faster yield
+                buffer = []
+                buffer_size = 3  # smaller buffer for faster yield
 
-            for event in stream:
-                if not event.choices:
-                    continue
+                for event in stream:
+                    if not event.choices:
+                        continue
 
-                choice = event.choices[0]
+                    choice = event.choices[0]
 
-                if hasattr(choice, "finish_reason") and choice.finish_reason:
-                    if buffer:
-                        yield "".join(buffer)
-                    break
+                    if hasattr(choice, "finish_reason") and choice.finish_reason:
+                        if buffer:
+                            yield "".join(buffer)
+                        break
+
+                    content = getattr(choice.delta, "content", None)
+                    if content:
+                        buffer.append(content)
+
+                        if len(buffer) >= buffer_size:
+                            yield "".join(buffer)
+                            buffer = []
+
+                if buffer:
+                    yield "".join(buffer)
+
+        except Exception as e:
+            logger.error(f"Stream error: {e}")
+            raise
+
+    async def acompletion_stream(self, message):
+        self._add_message(message=message, role="user")
+
+        try:
+            async with alimited("openai", self.messages):
+                stream = await self.aclient.chat.completions.create(
+                    **self._stream_args()
+                )
+
+                buffer = []
+                buffer_size = 3  # smaller buffer for faster yield
+
+                async for event in stream:
+                    if not event.choices:
+                        continue
 
-                content = getattr(choice.delta, "content", None)
-                if content:
-                    buffer.append(content)
+                    choice = event.choices[0]
 
-                    if len(buffer) >= buffer_size:
-                        yield "".join(buffer)
-                        buffer = []
+                    if hasattr(choice, "finish_reason") and choice.finish_reason:
+                        if buffer:
+                            yield "".join(buffer)
+                        break
 
-            if buffer:
-                yield "".join(buffer)
+                    content = getattr(choice.delta, "content", None)
+                    if content:
+                        buffer.append(content)
+
+                        if len(buffer) >= buffer_size:
+                            yield "".join(buffer)
+                            buffer = []
+
+                if buffer:
+                    yield "".join(buffer)
 
         except Exception as e:
             logger.error(f"Stream error: {e}")
             raise
 
+    def _create(self):
+        for attempt in range(EMPTY_RETRIES):
+            with limited("openai", self.messages) as usage:
+                response = self.client.chat.completions.create(
+                    model=self.model, messages=self.messages, stream=False
+                )
+                usage.record(response)
+            if response.choices:
+                return response
+            logger.warning(f"no choices from {self.model}: {getattr(response, 'error', None)}")
+            time.sleep(0.5 * 2**attempt)
+        raise RuntimeError(f"{self.model} answered without choices {EMPTY_RETRIES} times")
+
+    async def _acreate(self):
+        for attempt in range(EMPTY_RETRIES):
+            async with alimited("openai", self.messages) as usage:
+                response = await self.aclient.chat.completions.create(
+                    model=self.model, messages=self.messages, stream=False
+                )
+                usage.record(response)
+            if response.choices:
+                return response
+            logger.warning(f"no choices from {self.model}: {getattr(response, 'error', None)}")
+            await asyncio.sleep(0.5 * 2**attempt)
+        raise RuntimeError(f"{self.model} answered without choices {EMPTY_RETRIES} times")
+
+    async def abatch_completion(
+        self,
+        prompts,
+        max_concurrency=4,
+        retries=0,
+        parse=None,
+        timeout=None,
+        on_result=None,
+        offline=False,
+    ):
+        """
+        offline: send the prompts as one job of the batch api (half the price ,
+        done within 24h) instead of one request each , only on api.openai.com
+        """
+        if offline and prompts and (self.base_url or OPENAI_BASE_URL).rstrip("/") == OPENAI_BASE_URL:
+            return await self._offline_batch(prompts, parse, timeout, on_result)
+        if offline:
+            logger.info(f"no batch api at {self.base_url} , sending the prompts one by one")
+        return await super().abatch_completion(
+            prompts, max_concurrency, retries, parse, timeout, on_result
+        )
+
+    async def _offline_batch(self, prompts, parse=None, timeout=None, on_result=None):
+        lines = [
+            json.dumps(
+                {
+                    "custom_id": str(i),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": self.model,
+                        "messages": [{"role": "user", "content": prompt}],
+                    },
+                },
+                ensure_ascii=False,
+            )
+            for i, prompt in enumerate(prompts)
+        ]
+        start = time.monotonic()
+        with span("llm.batch", model=self.model, prompts=len(prompts), offline=True) as s:
+            file = await self.aclient.files.create(
+                file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+            )
+            batch = await self.aclient.batches.create(
+                input_file_id=file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+            )
+            logger.info(f"offline batch {batch.id} with {len(prompts)} prompts")
+            error = None
+            while batch.status not in ("completed", "failed", "expired", "cancelled"):
+                if timeout is not None and time.monotonic() - start > timeout:
+                    await self.aclient.batches.cancel(batch.id)
+                    error = asyncio.TimeoutError(f"batch {batch.id} timed out")
+                    break
+                await asyncio.sleep(BATCH_POLL_SECONDS)
+                batch = await self.aclient.batches.retrieve(batch.id)
+
+            error = error or RuntimeError(f"batch {batch.id} ended {batch.status}")
+            results = [error] * len(prompts)
+            if batch.output_file_id:
+                output = await self.aclient.files.content(batch.output_file_id)
+                for line in output.text.splitlines():
+                    item = json.loads(line)
+                    index = int(item["custom_id"])
+                    body = (item.get("response") or {}).get("body") or {}
+                    if item.get("error") or not body.get("choices"):
+                        results[index] = RuntimeError(str(item.get("error") or body))
+                        continue
+                    res = body["choices"][0]["message"]["content"]
+                    try:
+                        res = parse(res) if parse is not None else res
+                    except Exception as e:
+                        results[index] = e
+                        continue
+                    results[index] = res
+                    if on_result is not None:
+                        on_result(index, res)
+            s.set(status=batch.status, failed=sum(isinstance(r, Exception) for r in results))
+        return results
+
+    def _stream_args(self) -> dict:
+        return dict(
+            model=self.model,
+            messages=self.messages,
+            stream=True,
+            temperature=0.7,
+            extra_body={
+                "provider": {
+                    "order": ["cerebras","groq"], 
+                    "allow_fallbacks": True
+                }
+            }
+        )
+
     def add_system_instructuion(self, instruction: str):
         pass
 
@@ -107,7 +281,5 @@ class OpenAI(Model):
         self.messages = []
 
     def _add_message(self, message, role="user"):
-        max_history = 20
         self.messages.append({"role": role, "content": message})
-        if len(self.messages) > max_history:
-            self.messages = self.messages[-max_history:]
+        self.messages = fit_history(self.messages, self.context_budget)
@@ -0,0 +1,129 @@
+"""
+Process wide pool of HTTP clients for the providers
+
+Every model used to build its own SDK client, and each new client opened
+fresh TCP / TLS connections. Here one keep-alive httpx client is kept per
+base url (the async ones per event loop, an httpx.AsyncClient can't move
+between loops) and the SDK clients are built on top of them, so a model is
+just a handle and a new session reuses warm connections.
+
+Limits come from config.json:
+    http_max_connections , http_max_keepalive , http_keepalive_expiry , http2
+HTTP/2 needs the optional h2 package, without it HTTP/1.1 is used.
+"""
+
+from openai import OpenAI, AsyncOpenAI
+from weakref import WeakKeyDictionary
+
+from ..utils import read_config
+
+import asyncio
+import httpx
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+_lock = threading.Lock()
+_http: dict[str, httpx.Client] = {}
+_ahttp: "WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]]" = (
+    WeakKeyDictionary()
+)
+_sdk: dict[tuple, OpenAI] = {}
+_asdk: "WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple, AsyncOpenAI]]" = (
+    WeakKeyDictionary()
+)
+
+
+def _options() -> dict:
+    config = read_config()
+    http2 = bool(config.get("http2", False))
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("http2 needs the h2 package , using HTTP/1.1")
+            http2 = False
+    return {
+        "limits": httpx.Limits(
+            max_connections=config.get("http_max_connections", 100),
+            max_keepalive_connections=config.get("http_max_keepalive", 20),
+            keepalive_expiry=config.get("http_keepalive_expiry", 60),
+        ),
+        # the SDKs pass their own timeout with every request
+        "timeout": httpx.Timeout(600, connect=10),
+        "http2": http2,
+    }
+
+
+def _key(base_url: str | None) -> str:
+    return (base_url or OPENAI_BASE_URL).rstrip("/")
+
+
+def http_client(base_url: str | None = None) -> httpx.Client:
+    key = _key(base_url)
+    with _lock:
+        client = _http.get(key)
+        if client is None or client.is_closed:
+            client = _http[key] = httpx.Client(**_options())
+        return client
+
+
+def async_http_client(base_url: str | None = None) -> httpx.AsyncClient:
+    """
+    the client of the running event loop
+    """
+    loop = asyncio.get_running_loop()
+    key = _key(base_url)
+    with _lock:
+        clients = _ahttp.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None or client.is_closed:
+            client = clients[key] = httpx.AsyncClient(**_options())
+        return client
+
+
+def openai_client(api_key: str, base_url: str | None = None) -> OpenAI:
+    key = (_key(base_url), api_key)
+    with _lock:
+        client = _sdk.get(key)
+    if client is None:
+        client = OpenAI(
+            api_key=api_key, base_url=key[0], http_client=http_client(base_url)
+        )
+        with _lock:
+            client = _sdk.setdefault(key, client)
+    return client
+
+
+def async_openai_client(api_key: str, base_url: str | None = None) -> AsyncOpenAI:
+    loop = asyncio.get_running_loop()
+    key = (_key(base_url), api_key)
+    with _lock:
+        client = _asdk.setdefault(loop, {}).get(key)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=api_key, base_url=key[0], http_client=async_http_client(base_url)
+        )
+        with _lock:
+            client = _asdk[loop].setdefault(key, client)
+    return client
+
+
+async def aclose():
+    """
+    close the clients of the running loop and the sync ones , on shutdown
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        aclients = list(_ahttp.pop(loop, {}).values())
+        _asdk.pop(loop, None)
+        clients = list(_http.values())
+        _http.clear()
+        _sdk.clear()
+    for client in aclients:
+        await client.aclose()
+    for client in clients:
+        client.close()
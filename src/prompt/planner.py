@@ -29,12 +29,16 @@ def planner_agent_prompt(
     - Ensure each subtask is specific and well-defined.
     - Your response must be strictly in the following JSON format, including the triple backticks and the "json" language tag exactly as shown. This is critical for proper parsing:
     - You should only call one time reporter to generate a full report ! 
+    - Give every subtask a unique integer "id", starting from 1, in the order you list them.
+    - List in "depends_on" the ids of earlier subtasks whose results this subtask needs. Subtasks that do not need each other (e.g. independent searches) should not depend on each other so they can run at the same time. The reporter should depend on every subtask it summarizes.
 
     ```json
     [
         {{
+            "id": 1,
             "task": "<specific subtask>",
-            "agent": "<assigned agent>"
+            "agent": "<assigned agent>",
+            "depends_on": []
         }},
         ...
     ]
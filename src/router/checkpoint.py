@@ -0,0 +1,76 @@
+"""
+Checkpoints of report workflows
+
+The server saves the state of a run (plan, finished tasks and their data)
+after every router hop so a run that died halfway can be resumed
+without paying again for the work that was already done.
+One JSON file per run id.
+"""
+
+import json
+import os
+import re
+import time
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore:
+    def __init__(self, path: str = "./checkpoints", ttl: float = 86400):
+        """
+        path: folder of the checkpoint files
+        ttl: checkpoints older than ttl seconds are removed by prune()
+        """
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, run_id: str) -> str:
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", run_id or ""):
+            raise ValueError(f"invalid run id {run_id!r}")
+        return os.path.join(self.path, f"{run_id}.json")
+
+    def save(self, run_id: str, state: dict) -> None:
+        """
+        write to a temp file first so a crash never leaves half a checkpoint
+        """
+        path = self._file(run_id)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, default=str)
+        os.replace(tmp, path)
+
+    def load(self, run_id: str) -> dict | None:
+        path = self._file(run_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            logger.error(f"corrupted checkpoint {path}")
+            return None
+
+    def delete(self, run_id: str) -> None:
+        path = self._file(run_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def ids(self) -> list[str]:
+        return [
+            name[: -len(".json")]
+            for name in sorted(os.listdir(self.path))
+            if name.endswith(".json")
+        ]
+
+    def prune(self) -> None:
+        now = time.time()
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError:
+                continue
@@ -0,0 +1,89 @@
+"""
+Events emitted while a report is being generated.
+
+The server and the agents call emit() without knowing who is listening.
+stream_report sets a queue as the sink for the run, everything else is a no-op.
+"""
+
+from contextvars import ContextVar
+from typing import Any, Literal, Optional
+
+from pydantic import BaseModel
+
+import asyncio
+import threading
+
+
+class PlanEvent(BaseModel):
+    type: Literal["plan"] = "plan"
+    tasks: list[dict]
+
+
+class AgentStartEvent(BaseModel):
+    type: Literal["agent_start"] = "agent_start"
+    task_id: str = ""
+    agent: str
+    task: str = ""
+
+
+class AgentFinishEvent(BaseModel):
+    type: Literal["agent_finish"] = "agent_finish"
+    task_id: str = ""
+    agent: str
+    error: Optional[str] = None
+
+
+class SectionEvent(BaseModel):
+    type: Literal["section"] = "section"
+    index: int
+    task: str = ""
+    content: str
+
+
+class ReportEvent(BaseModel):
+    type: Literal["report"] = "report"
+    report: Any
+
+
+class ErrorEvent(BaseModel):
+    type: Literal["error"] = "error"
+    detail: str
+
+
+_sink: ContextVar[Optional["_Sink"]] = ContextVar("report_event_sink", default=None)
+
+
+class _Sink:
+    """
+    Queue bound to the loop that reads it, so agents running
+    in a worker thread (asyncio.to_thread) can still emit
+    """
+
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+        self.loop = asyncio.get_running_loop()
+        self.thread = threading.get_ident()
+
+    def put(self, event: BaseModel):
+        if threading.get_ident() == self.thread:
+            self.queue.put_nowait(event)
+        else:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+
+def set_sink(queue: asyncio.Queue):
+    """
+    Send every event emitted in the current context to queue.
+    Returns a token for reset_sink
+    """
+    return _sink.set(_Sink(queue))
+
+
+def reset_sink(token):
+    _sink.reset(token)
+
+
+def emit(event: BaseModel):
+    sink = _sink.get()
+    if sink is not None:
+        sink.put(event)
@@ -8,6 +8,7 @@ Agent<-->Router<--> Server <--> Router <--> Agent
 
 from .server import Server
 from ..agent.agent import Agent
+from ..utils import span
 
 from pydantic import BaseModel
 
@@ -33,12 +34,17 @@ class Router(object):
     def send_response(self, response):
         return response
 
-    async def recv_response(self, message, data=None):
+    async def recv_response(self, message, data=None, ctx=None):
         """
         An agent receive the message from other agent
         use the run function and send it back to server
+        ctx: the RunContext of the current run
         """
-        res = await self.agent.run(message, data)
+        with span(
+            "router", agent=getattr(self.agent, "name", ""), message=str(message)[:200]
+        ) as s:
+            res = await self.agent.run(message, data, ctx)
+            s.set(next=res.get("agent", "") if isinstance(res, dict) else "")
         return self.send_response(res)
 
     def set_send_format(self, s: BaseModel):
@@ -1,10 +1,45 @@
 from __future__ import annotations
 
+from .events import emit, PlanEvent, AgentStartEvent, AgentFinishEvent
+from .checkpoint import CheckpointStore
+from ..agent.context import RunContext
+from ..agent.evidence import Evidence
 
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+# the agents stop on their own when their time is up , the server only
+# stops the ones that are still running this much later
+_GRACE = 1.0
+
+
+def _assign_id(task: dict, default: int, taken: set):
+    """
+    give the task a string id no other task has , the planner may write the
+    same id twice and a later task would replace the earlier one. A repeated
+    id gets a suffix , depends_on keeps pointing at the first task of that id
+    """
+    base = str(task.get("id") or default)
+    task_id, n = base, 1
+    while task_id in taken:
+        n += 1
+        task_id = f"{base}-{n}"
+    if task_id != base:
+        logger.warning(f"task id {base} is used twice , renamed to {task_id}")
+    task["id"] = task_id
+    taken.add(task_id)
+    depends_on = task.get("depends_on")
+    if isinstance(depends_on, (str, int)):
+        # one id without a list , "12" is task 12 and not tasks 1 and 2
+        task["depends_on"] = [str(depends_on)]
+    elif isinstance(depends_on, list):
+        task["depends_on"] = [str(d) for d in depends_on]
+    elif depends_on is not None:
+        logger.warning(f"ignoring depends_on {depends_on!r} of task {task_id}")
+        task["depends_on"] = None
+
 
 class Server:
     """
@@ -25,14 +60,60 @@ class Server:
             state 1: no more searching step action terminate
             state 2: not enough content --> action: summary with local top k selected document [TODO: maybe save in sqlite3 ?]
             state 3: enough content --> action return summary
+
+        plan:
+            when the planner answers with a whole plan ("agent": "PLAN") the tasks are run as a DAG.
+            tasks that don't depend on each other run at the same time (at most max_concurrency)
+
+        checkpoint:
+            with a checkpoint store the plan and every finished task are saved under run_id,
+            resume() continues a run from its last finished task
+
+        data:
+            agents pass records of the evidence store of the run, the lists
+            only hold references so merging them never copies an item
+
+        streamed plan:
+            the planner may hand over the tasks one by one while it writes them
+            ("stream" in the plan) , each task starts as soon as it arrives. A plan cut
+            short by a failed planner or the deadline is checkpointed as incomplete and
+            resume() plans again
+
+        deadline:
+            the agents gathering evidence stop ctx.reserve seconds before the deadline
+            so the reporter always gets to write , a report that still doesn't finish
+            is replaced by a short report of the sources gathered so far
+
+        speculative:
+            while the planner plans, the other agents may already start the work they
+            expect (agent.speculate) , the work no planned task asked for is cancelled
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        checkpoint: CheckpointStore = None,
+        run_id: str = "",
+        ctx: RunContext = None,
+        speculative: bool = False,
+        report_agent: str = "reporter",
+    ):
+        """
+        report_agent: the agent writing the report , the only one that may use the reserve of the deadline
+        """
         self.routers: dict = {}
         self.router_list: list = []
         self.initial_router: str = ""
         self.next_router = None
         self.data = []
+        self.max_concurrency = max(1, max_concurrency)
+        self.checkpoint = checkpoint
+        self.run_id = run_id
+        self.ctx = ctx if ctx is not None else RunContext(run_id=run_id)
+        self.speculative = speculative
+        self.report_agent = report_agent
+        # (agent , task) -> the finished task of a resumed run that is planned again
+        self._carried: dict[tuple, dict] = {}
 
     def recv_message(self):
         pass
@@ -42,16 +123,336 @@ class Server:
         start the workflow
         """
         self.next_router = self.routers[self.initial_router]
+        self.ctx.query = query
         logger.info("server start ... ")
+        if self.speculative:
+            self._speculate(query)
+        try:
+            return await self._loop(query)
+        finally:
+            self.ctx.cancel_speculation()
 
+    def _speculate(self, query: str):
+        for name in self.router_list:
+            if name == self.initial_router:
+                continue
+            agent = getattr(self.routers[name], "agent", None)
+            if agent is None:
+                continue
+            try:
+                agent.speculate(query, self.ctx)
+            except Exception as e:
+                logger.warning(f"speculation of {name} failed: {e}")
+
+    async def _loop(self, query):
         while True:
-            query = await self.next_router.recv_response(query, self.data)
+            try:
+                query = await asyncio.wait_for(
+                    self.next_router.recv_response(query, self.data, self.ctx),
+                    timeout=self.ctx.deadline.timeout(),
+                )
+            except asyncio.TimeoutError:
+                logger.warning("deadline reached , returning what we have")
+                return self._degraded_report()
             logger.info(f"handling new task {self.next_router} , {query}")
             if self.check_response(query):
                 return query
 
+            if self.check_plan(query):
+                return await self.run_plan(query)
+
             self.next_router, query, self.data = self.query_handler(query)
 
+    async def resume(self, state: dict):
+        """
+        continue a checkpointed run, finished tasks are not run again
+        """
+        if state.get("status") == "done":
+            return state["result"]
+        self.ctx.query = state.get("query", "")
+        self.ctx.evidence.load(state.get("evidence", []))
+        logger.info(f"resuming run {self.run_id} , {len(state['completed'])} tasks done")
+        if not state.get("plan_complete", True):
+            if self.initial_router:
+                # the planner stopped before the end of its plan , the tasks it does
+                # plan again are not run again
+                logger.info(f"the plan of run {self.run_id} is incomplete , planning again")
+                for task in state["plan"].get("tasks", []):
+                    done = state["completed"].get(task.get("id"))
+                    if done is not None:
+                        self._carried[(task.get("agent"), task.get("task"))] = done
+                return await self.start(self.ctx.query)
+            logger.warning(f"the plan of run {self.run_id} is incomplete and there is no planner")
+        return await self.run_plan(state["plan"], state["completed"])
+
+    async def run_plan(self, plan: dict, completed: dict = None):
+        """
+        Run every task of the plan as soon as the tasks it depends on are done.
+        Each task receives the data of its dependencies; the new data of all
+        tasks is merged in plan order once everything has finished.
+        When the deadline of the run is reached the unfinished tasks are cancelled
+        and the result is built from the tasks that did finish.
+        completed: {task id: {"result": , "new": }} of a resumed run
+        """
+        base = self._deref(plan.get("data") or [])
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        nodes: dict[str, asyncio.Task] = {}
+        completed = {} if completed is None else completed
+
+        async def run_node(task: dict, deps: list[asyncio.Task]):
+            parents = await asyncio.gather(*deps)
+            inputs = self._merge_data(base, *(p["view"] for p in parents))
+
+            done = completed.get(task["id"])
+            if done is None:
+                done = self._carried.pop((task["agent"], task["task"]), None)
+                if done is not None:
+                    completed[task["id"]] = done
+            if done is not None:
+                new = self._deref(done["new"])
+                return {"result": done["result"], "new": new, "view": inputs + new}
+
+            router = self.routers.get(task["agent"])
+            if router is None:
+                logger.warning(f"no router for agent {task['agent']} , skip task")
+                completed[task["id"]] = {"result": None, "new": []}
+                return {"result": None, "new": [], "view": inputs}
+
+            async with semaphore:
+                logger.info(f"running task {task['id']} with {task['agent']}")
+                emit(
+                    AgentStartEvent(
+                        task_id=task["id"], agent=task["agent"], task=task["task"]
+                    )
+                )
+                work = router.recv_response(task["task"], list(inputs), self.ctx)
+                if task["agent"] != self.report_agent and self.ctx.deadline.bounded:
+                    # the time before the deadline is kept for the report
+                    work = asyncio.wait_for(
+                        work,
+                        timeout=self.ctx.deadline.timeout(
+                            margin=max(0.0, self.ctx.reserve - _GRACE)
+                        ),
+                    )
+                try:
+                    result = await work
+                except asyncio.TimeoutError:
+                    logger.warning(f"task {task['id']} ran out of time")
+                    emit(
+                        AgentFinishEvent(
+                            task_id=task["id"], agent=task["agent"], error="timeout"
+                        )
+                    )
+                    return {"result": None, "new": [], "view": inputs}
+                except Exception as e:
+                    logger.error(f"task {task['id']} failed: {e}")
+                    emit(
+                        AgentFinishEvent(
+                            task_id=task["id"], agent=task["agent"], error=str(e)
+                        )
+                    )
+                    return {"result": None, "new": [], "view": inputs}
+                emit(AgentFinishEvent(task_id=task["id"], agent=task["agent"]))
+
+            data = result.get("data")
+            new = []
+            if isinstance(data, list):
+                # the same record may come back more than once , keep it once
+                seen = {id(d) for d in inputs}
+                for d in data:
+                    if id(d) not in seen:
+                        seen.add(id(d))
+                        new.append(d)
+
+            completed[task["id"]] = {
+                "result": {
+                    "agent": result.get("agent", ""),
+                    "task": result.get("task", ""),
+                    "data": [] if isinstance(data, list) else data,
+                },
+                "new": self._ref(new),
+            }
+            self._save_checkpoint(plan, completed)
+            return {"result": result, "new": new, "view": inputs + new}
+
+        def schedule(task: dict):
+            depends_on = task.get("depends_on")
+            if depends_on is None:
+                deps = list(nodes.values())
+            else:
+                # only earlier tasks can be waited on, this keeps the plan acyclic
+                deps = [nodes[d] for d in depends_on if d in nodes]
+            nodes[task["id"]] = asyncio.create_task(run_node(task, deps))
+
+        tasks = plan.setdefault("tasks", [])
+        # a streamed plan is scheduled task by task while the planner is still writing it
+        stream = plan.pop("stream", None)
+        taken = set()
+        for i, task in enumerate(tasks):
+            _assign_id(task, i + 1, taken)
+        if stream is None:
+            emit(PlanEvent(tasks=tasks))
+            self._save_checkpoint(plan, completed)
+            for task in tasks:
+                schedule(task)
+        else:
+            # the checkpoints written while the plan streams in mark it incomplete
+            plan["complete"] = False
+            plan["complete"] = await self._feed_plan(stream, plan, completed, schedule)
+        # agents the plan doesn't use won't need their early start
+        self.ctx.cancel_speculation(keep={task["agent"] for task in tasks})
+
+        done, pending = set(), set()
+        if nodes:
+            done, pending = await asyncio.wait(
+                nodes.values(), timeout=self.ctx.deadline.timeout()
+            )
+        if pending:
+            logger.warning(f"deadline reached , cancelling {len(pending)} tasks")
+            for t in pending:
+                t.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        outcomes = [t.result() for t in nodes.values() if t in done]
+        self.data = self._merge_data(base, *(o["new"] for o in outcomes))
+
+        result = None
+        for outcome in reversed(outcomes):
+            if outcome["result"] and self.check_response(outcome["result"]):
+                result = outcome["result"]
+                break
+        if result is None:
+            logger.warning("no report was written , reporting the sources instead")
+            result = self._degraded_report()
+        # a run with failed tasks or a plan cut short stays resumable
+        if plan.get("complete", True) and len(completed) == len(tasks):
+            self._save_checkpoint(plan, completed, result=result)
+        return result
+
+    async def _feed_plan(self, stream, plan: dict, completed: dict, schedule):
+        """
+        schedule the tasks of a streamed plan as they arrive , every new task
+        emits the plan so far. When the planner fails or the deadline comes
+        the tasks that did arrive still run. True when the whole plan arrived
+        """
+        tasks = plan["tasks"]
+        taken = {task["id"] for task in tasks}
+
+        async def feed():
+            async for task in stream:
+                _assign_id(task, len(tasks) + 1, taken)
+                tasks.append(task)
+                schedule(task)
+                emit(PlanEvent(tasks=list(tasks)))
+                self._save_checkpoint(plan, completed)
+
+        feeder = asyncio.create_task(feed())
+        try:
+            await asyncio.wait({feeder}, timeout=self.ctx.deadline.timeout())
+        except asyncio.CancelledError:
+            feeder.cancel()
+            raise
+        if not feeder.done():
+            logger.warning(f"deadline reached while planning , running {len(tasks)} tasks")
+            feeder.cancel()
+            await asyncio.gather(feeder, return_exceptions=True)
+            complete = False
+        elif feeder.exception() is not None:
+            logger.error(f"planner failed after {len(tasks)} tasks: {feeder.exception()}")
+            complete = False
+        else:
+            complete = True
+        if not tasks:
+            emit(PlanEvent(tasks=[]))
+            self._save_checkpoint(plan, completed)
+        return complete
+
+    def _degraded_report(self) -> dict:
+        """
+        a short report of the evidence gathered so far , for runs whose reporter
+        didn't finish , the raw evidence list is never handed out as the report
+        """
+        records = [
+            d
+            for d in self._merge_data(self.data, list(self.ctx.evidence))
+            if isinstance(d, (Evidence, dict))
+        ]
+        lines = [
+            f"# {self.ctx.query}".rstrip(),
+            "",
+            "The report could not be finished in time , these are the sources gathered so far.",
+            "",
+        ]
+        for record in records:
+            url = record.get("url") or ""
+            title = record.get("title") or url or "untitled"
+            line = f"- [{title}]({url})" if url else f"- {title}"
+            brief = record.get("brief_summary") or (record.get("summary") or "")[:300]
+            if brief:
+                line += f": {brief}"
+            lines.append(line)
+        if not records:
+            lines.append("No sources were found.")
+        return {"agent": "TERMINATE", "task": "TERMINATE", "data": "\n".join(lines)}
+
+    def _save_checkpoint(self, plan: dict, completed: dict, result: dict = None):
+        if self.checkpoint is None or not self.run_id:
+            return
+        state = {
+            "run_id": self.run_id,
+            "query": self.ctx.query,
+            "status": "running" if result is None else "done",
+            "plan_complete": plan.get("complete", True),
+            "plan": {
+                "tasks": plan.get("tasks", []),
+                "data": self._ref(plan.get("data") or []),
+            },
+            "completed": completed,
+            "result": self.export(result) if result is not None else None,
+            "evidence": self.ctx.evidence.to_list(),
+        }
+        try:
+            self.checkpoint.save(self.run_id, state)
+        except Exception as e:
+            # a failed checkpoint should never fail the report itself
+            logger.error(f"saving checkpoint {self.run_id} failed: {e}")
+
+    def _ref(self, data: list) -> list:
+        """
+        evidence records are saved by id , the records themselves once per checkpoint
+        """
+        return [{"ref": d.id} if isinstance(d, Evidence) else d for d in data]
+
+    def _deref(self, data: list) -> list:
+        items = []
+        for d in data:
+            if isinstance(d, dict) and set(d) == {"ref"}:
+                record = self.ctx.evidence.get(d["ref"])
+                if record is not None:
+                    items.append(record)
+            else:
+                items.append(d)
+        return items
+
+    def export(self, result: dict) -> dict:
+        """
+        the result with evidence records turned back into plain dicts
+        """
+        data = result.get("data")
+        if isinstance(data, list):
+            data = [d.to_dict() if isinstance(d, Evidence) else d for d in data]
+            result = {**result, "data": data}
+        return result
+
+    def _merge_data(self, base: list, *parts: list) -> list:
+        merged = list(base)
+        seen = {id(d) for d in merged}
+        for part in parts:
+            for d in part:
+                if id(d) not in seen:
+                    seen.add(id(d))
+                    merged.append(d)
+        return merged
+
     def query_handler(self, query: dict):
         """
         This should parese the query and get
@@ -77,6 +478,12 @@ class Server:
             return True
         return False
 
+    def check_plan(self, msg: dict):
+        """
+        The planner may send the whole plan at once instead of one task
+        """
+        return msg["agent"] == "PLAN"
+
     def set_initial_router(self, name: str, msg: str):
         self.initial_router = name
         self.initial_message = msg
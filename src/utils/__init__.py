@@ -1 +1,6 @@
 from .config import read_config, write_config
+from .tracing import span, start_trace, Trace
+from .cache import LRUCache
+from .disk_cache import DiskCache
+from .json_stream import JSONArrayStream
+from .json_extract import extract_json, repair_json
@@ -0,0 +1,158 @@
+"""
+Find the JSON value in an LLM answer
+
+The answer may hold the value in a ```json fence , in the middle of prose , or
+slightly broken. extract_json() scans the text once, keeps track of strings so
+brackets inside them don't count, and parses each outermost {...} / [...] it
+closes. The largest value that parses wins. A value that doesn't parse is
+repaired (trailing commas , single quotes , True / False / None) and, when it
+still fails, the values nested in it are tried.
+
+Every character is scanned a bounded number of times , the old extractor
+tried every "{" and "[" as a start and could take hundreds of ms on long
+answers. See benchmarks/bench_json_extract.py.
+"""
+
+from typing import Any, Optional
+
+import json
+import re
+
+_FENCE = re.compile(r"```(?:json\s*)?\n?(.*?)\n?```", re.DOTALL)
+_CLOSE = {"}": "{", "]": "["}
+_PYTHON = {"True": "true", "False": "false", "None": "null"}
+_MISSING = object()
+_SPECIAL = re.compile(r"[\[\]{}\"']")
+# strings are matched whole so nothing inside them is repaired
+_REPAIR = re.compile(
+    r'"(?:\\.|[^"\\])*"'
+    r"|'(?:\\.|[^'\\])*'"
+    r"|,(?=\s*[}\]])"
+    r"|\b(?:True|False|None)\b"
+)
+_STRING_END = {q: re.compile(r"\\.|" + q, re.DOTALL) for q in "\"'"}
+
+
+def extract_json(text: str) -> Optional[Any]:
+    """
+    the dict or list in text , None when there is none
+    """
+    if not text:
+        return None
+    # a fenced block is what the model meant , the first one that parses wins
+    if "```" in text:
+        for match in _FENCE.finditer(text):
+            block = match.group(1).strip()
+            if block.startswith(("{", "[")):
+                value = _loads(block)
+                if value is not _MISSING:
+                    return value
+
+    best, best_size = None, -1
+    for start, end in _outermost(text, 0, len(text)):
+        if end - start <= best_size:
+            continue
+        value = _parse(text, start, end)
+        if value is not _MISSING:
+            best, best_size = value[0], value[1]
+    return best
+
+
+def repair_json(text: str) -> str:
+    """
+    the usual damage of LLM json made valid in one pass:
+    trailing commas , 'single quoted' strings and python constants
+    """
+    return _REPAIR.sub(_repair, text)
+
+
+def _repair(match: re.Match) -> str:
+    token = match.group()
+    if token[0] == '"':
+        return token
+    if token[0] == "'":
+        return json.dumps(token[1:-1].replace("\\'", "'"), ensure_ascii=False)
+    if token[0] == ",":
+        return ""
+    return _PYTHON[token]
+
+
+def _parse(text: str, start: int, end: int):
+    """
+    (value , size) of the largest value in text[start:end] , _MISSING if none parses
+    """
+    value = _loads(text[start:end])
+    if value is not _MISSING:
+        return value, end - start
+    # the outer brackets were prose or too broken , try what they hold
+    best = _MISSING
+    for inner_start, inner_end in _outermost(text, start + 1, end - 1):
+        if best is not _MISSING and inner_end - inner_start <= best[1]:
+            continue
+        inner = _parse(text, inner_start, inner_end)
+        if inner is not _MISSING:
+            best = inner
+    return best
+
+
+def _loads(candidate: str):
+    try:
+        # strict=False lets raw newlines inside strings through
+        return json.loads(candidate, strict=False)
+    except ValueError:
+        pass
+    try:
+        return json.loads(repair_json(candidate), strict=False)
+    except ValueError:
+        return _MISSING
+
+
+def _outermost(text: str, start: int, end: int) -> list[tuple[int, int]]:
+    """
+    (start , end) of every outermost balanced {...} / [...] in text[start:end]
+    """
+    stack = []
+    closed = []
+    i = start
+    while True:
+        # jump from one bracket or quote to the next , the text between is never looked at in python
+        match = _SPECIAL.search(text, i, end)
+        if match is None:
+            break
+        pos = match.start()
+        ch = text[pos]
+        i = pos + 1
+        if ch in "{[":
+            stack.append((ch, pos))
+        elif ch in "}]":
+            if stack and stack[-1][0] == _CLOSE[ch]:
+                closed.append((stack.pop()[1], pos + 1))
+            elif stack:
+                # mismatched bracket , whatever was open can't be valid
+                stack.clear()
+        elif stack and (ch == '"' or not text[pos - 1].isalnum()):
+            # quotes only count inside brackets , prose is full of apostrophes
+            i = min(_string_end(text, pos, ch), end)
+
+    # a bracket that never closed (a cut off answer , a "[3" in prose) doesn't hide
+    # the values closed after it , keep every value that no other value contains
+    spans = []
+    for span_start, span_end in sorted(closed):
+        if not spans or span_start >= spans[-1][1]:
+            spans.append((span_start, span_end))
+    return spans
+
+
+def _string_end(text: str, start: int, quote: str) -> int:
+    """
+    index after the quote closing the string opened at start
+    """
+    pattern = _STRING_END[quote]
+    i = start + 1
+    while True:
+        match = pattern.search(text, i)
+        if match is None:
+            return len(text)
+        i = match.end()
+        if match.group() == quote:
+            return i
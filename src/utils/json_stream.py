@@ -0,0 +1,98 @@
+"""
+Incremental parser for a streamed JSON array of objects
+
+feed() takes the chunks of a streaming completion and returns every object of
+the array as soon as its closing brace arrived, so the caller can act on the
+first items while the model is still writing the rest. Text around the array
+(prose , ```json fences) is skipped. Every character is looked at once.
+"""
+
+from typing import Any
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class JSONArrayStream:
+    def __init__(self):
+        self._buffer = ""
+        # position of the next character to scan
+        self._pos = 0
+        # "search" for the "[" , "open" right after it , "array" inside , "done" after "]"
+        self._state = "search"
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = -1
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, chunk: str) -> list[Any]:
+        """
+        the objects completed by chunk
+        """
+        if self.done or not chunk:
+            return []
+        self._buffer += chunk
+        items = []
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer):
+            ch = buffer[pos]
+            if self._state == "search":
+                if ch == "[":
+                    self._state = "open"
+            elif self._state == "open":
+                # "[" only starts the plan when an object or "]" follows , not in prose like [1]
+                if ch == "{":
+                    self._state = "array"
+                    self._depth = 1
+                    self._start = pos
+                elif ch == "]":
+                    self._state = "done"
+                    break
+                elif not ch.isspace():
+                    self._state = "search"
+                    continue
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0 and ch == "{":
+                    self._start = pos
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # the "]" of the array
+                    self._state = "done"
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._start >= 0:
+                    items.extend(self._parse(buffer[self._start : pos + 1]))
+                    self._start = -1
+            pos += 1
+
+        # what was scanned and closed is never needed again
+        cut = self._start if self._start >= 0 else pos
+        self._buffer = buffer[cut:]
+        if self._start >= 0:
+            self._start = 0
+        self._pos = pos - cut
+        return items
+
+    def _parse(self, text: str) -> list[Any]:
+        try:
+            return [json.loads(text)]
+        except json.JSONDecodeError as e:
+            logger.warning(f"skipping malformed item of the streamed array: {e}")
+            return []
@@ -0,0 +1,121 @@
+"""
+Lightweight in-process tracing
+
+A Trace collects the nested spans of one request. span() opens a child of the
+current span and records how long it took, its attributes (prompt / response
+size, url ...) and the error if it raised. The current span lives in a context
+variable so it follows asyncio tasks and asyncio.to_thread.
+
+When no trace is running span() does nothing, so it is safe to leave in hot paths.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from uuid import uuid4
+
+import json
+import os
+import time
+
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "end", "error", "children")
+
+    def __init__(self, name: str, attrs: dict = None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+        self.children: list["Span"] = []
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self, origin: float) -> dict:
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "attrs": self.attrs,
+            "error": self.error,
+            "children": [child.to_dict(origin) for child in list(self.children)],
+        }
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+class Trace:
+    def __init__(self, name: str = "request"):
+        self.id = uuid4().hex
+        self.started_at = time.time()
+        self.root = Span(name)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.id,
+            "started_at": self.started_at,
+            "spans": self.root.to_dict(self.root.start),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), default=str)
+
+    def export(self, directory: str) -> str:
+        """
+        write the timeline to <directory>/<trace id>.json and return the path
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.id}.json")
+        with open(path, "w") as f:
+            f.write(self.to_json())
+        return path
+
+
+@contextmanager
+def start_trace(name: str = "request", **attrs):
+    """
+    with start_trace("report") as trace:
+        ...
+    every span opened inside the block is recorded in trace
+    """
+    trace = Trace(name)
+    trace.root.set(**attrs)
+    token = _current.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        trace.root.end = time.perf_counter()
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    parent = _current.get()
+    if parent is None:
+        yield _NOOP
+        return
+
+    s = Span(name, attrs)
+    parent.children.append(s)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.end = time.perf_counter()
+        _current.reset(token)
@@ -0,0 +1,116 @@
+import asyncio
+
+from src.model import CachedModel, HedgedModel, Model
+from src.model.hedge import hedge_stats
+
+
+class FakeModel(Model):
+    """
+    answers after delay seconds and keeps its history like the OpenAI compatible clients ,
+    or like Ollama with keeps_replies
+    """
+
+    def __init__(
+        self,
+        name: str = "fake",
+        keeps_replies: bool = False,
+        calls: list = None,
+        delay: float = 0.0,
+    ):
+        self.name = name
+        self.delay = delay
+        self.messages = []
+        self.keeps_replies = keeps_replies
+        # shared with the forks
+        self.calls = [] if calls is None else calls
+
+    def completion(self, query):
+        self.calls.append(query)
+        self.messages.append({"role": "user", "content": query})
+        reply = f"{self.name} answers {query}"
+        if self.keeps_replies:
+            self.messages.append({"role": "assistant", "content": reply})
+        return reply
+
+    def completion_stream(self, message):
+        self.calls.append(message)
+        self.messages.append({"role": "user", "content": message})
+        yield f"{self.name} answers {message}"
+
+    async def acompletion_stream(self, message):
+        await asyncio.sleep(self.delay)
+        for chunk in self.completion_stream(message):
+            yield chunk
+
+    def get_client(self):
+        return None
+
+    def get_model(self):
+        return self.name
+
+    def get_llm_config(self):
+        return None
+
+    def set_api(self, api):
+        pass
+
+    def clear_message(self):
+        self.messages = []
+
+    def fork(self):
+        return FakeModel(self.name, self.keeps_replies, self.calls, self.delay)
+
+
+class DictCache(dict):
+    def set(self, key, value, ttl=None):
+        self[key] = value
+
+
+def _two_turns(model: Model) -> list:
+    async def run():
+        await model.acompletion("first question")
+        await model.acompletion("second question")
+
+    asyncio.run(run())
+    return list(model.messages)
+
+
+def _hedged(keeps_replies: bool) -> tuple[FakeModel, HedgedModel]:
+    primary = FakeModel("primary", keeps_replies)
+    return primary, HedgedModel(primary, FakeModel("secondary", keeps_replies), default_delay=5)
+
+
+def test_hedged_history_matches_the_primary():
+    for keeps_replies in (False, True):
+        alone = FakeModel("primary", keeps_replies)
+        alone.completion("first question")
+        alone.completion("second question")
+
+        _, hedged = _hedged(keeps_replies)
+        assert hedged.keeps_replies is keeps_replies
+        assert _two_turns(hedged) == alone.messages
+
+
+def test_cache_hit_and_miss_leave_the_same_history():
+    for keeps_replies in (False, True):
+        cache = DictCache()
+        primary, hedged = _hedged(keeps_replies)
+        missed = _two_turns(CachedModel(hedged, cache))
+        assert len(primary.calls) == 2
+        assert len(cache) == 2
+
+        primary, hedged = _hedged(keeps_replies)
+        # the second turn only hits when the first left the same history
+        assert _two_turns(CachedModel(hedged, cache)) == missed
+        assert primary.calls == []
+
+
+def test_a_primary_that_loses_still_counts_as_slow():
+    primary = FakeModel("slow primary", delay=1.0)
+    hedged = HedgedModel(primary, FakeModel("secondary"), min_delay=0.05, default_delay=0.05)
+    assert asyncio.run(hedged.acompletion("question")) == "secondary answers question"
+
+    latencies = hedge_stats()["latencies"]
+    # the cancelled primary took at least the hedge delay
+    assert latencies["FakeModel:slow primary:stream"]["samples"] == 1
+    assert latencies["FakeModel:slow primary:stream"]["p50"] >= 0.05
@@ -0,0 +1,10 @@
+from src.model import history
+from src.model.history import context_budget
+
+
+def test_a_provider_prefixed_name_gets_the_window_of_the_model(monkeypatch):
+    monkeypatch.setattr(history, "read_config", lambda: {})
+    assert context_budget("openai/gpt-4o") == context_budget("gpt-4o")
+    assert context_budget("anthropic/claude-3.5-sonnet") == context_budget("claude-3.5-sonnet")
+    assert context_budget("meta-llama/llama-3.1-70b-instruct") == 128_000 - 4_096
+    assert context_budget("someone/unknown-model") == history.DEFAULT_WINDOW - 2_048
@@ -0,0 +1,48 @@
+import asyncio
+
+from src.browser import search_cache
+from src.browser.googlesearch import GoogleSearch
+from src.browser.search_cache import SearchCache
+from src.utils import DiskCache
+
+
+def _google(monkeypatch, tmp_path, failing_pages=()):
+    monkeypatch.setenv("GOOGLE_CSE_API_KEY", "key")
+    monkeypatch.setenv("GOOGLE_CSE_ID", "id")
+    cache = SearchCache(DiskCache(str(tmp_path / "search.sqlite")))
+    monkeypatch.setattr(search_cache, "_cache", cache)
+    monkeypatch.setattr(search_cache, "_loaded", True)
+
+    google = GoogleSearch()
+    calls = []
+
+    async def page(query, start_index, num):
+        calls.append(start_index)
+        if start_index in failing_pages:
+            return None
+        return [
+            {"title": f"result {i}", "link": f"https://example.com/{i}", "snippet": ""}
+            for i in range(start_index, start_index + num)
+        ]
+
+    monkeypatch.setattr(google, "_search_google_cse_page", page)
+    return google, calls
+
+
+def _search(google: GoogleSearch) -> list:
+    return asyncio.run(google.asearch_result("what is a transformer", k=20, deep_search=False))
+
+
+def test_a_search_with_a_failed_page_is_not_cached(monkeypatch, tmp_path):
+    google, calls = _google(monkeypatch, tmp_path, failing_pages=(11,))
+    assert len(_search(google)) == 10
+    assert len(_search(google)) == 10
+    # both searches asked the API , the partial result wasn't kept
+    assert calls.count(11) == 2
+
+
+def test_a_whole_search_is_cached(monkeypatch, tmp_path):
+    google, calls = _google(monkeypatch, tmp_path)
+    assert len(_search(google)) == 20
+    assert len(_search(google)) == 20
+    assert sorted(calls) == [1, 11]
@@ -0,0 +1,93 @@
+import asyncio
+
+from src.agent import RunContext
+from src.router import Router, Server
+from src.router.checkpoint import CheckpointStore
+
+PLAN = [
+    {"id": "1", "task": "search a", "agent": "search", "depends_on": []},
+    {"id": "2", "task": "search b", "agent": "search", "depends_on": []},
+    {"id": "3", "task": "write", "agent": "reporter", "depends_on": ["1", "2"]},
+]
+
+
+class FakePlanner:
+    """
+    streams the plan , fails after `fail_after` tasks when it is set
+    """
+
+    name = "planner"
+    description = "plan the tasks"
+
+    def __init__(self, fail_after: int = None):
+        self.fail_after = fail_after
+
+    def add_model(self, name, description):
+        pass
+
+    async def _stream(self):
+        for i, task in enumerate(PLAN):
+            if i == self.fail_after:
+                raise RuntimeError("the planner stopped")
+            yield dict(task)
+
+    async def run(self, response, data=None, ctx=None):
+        return {"agent": "PLAN", "task": "", "tasks": [], "stream": self._stream(), "data": []}
+
+
+class FakeAgent:
+    def __init__(self, name: str, calls: list):
+        self.name = name
+        self.description = name
+        self.calls = calls
+
+    async def run(self, response, data=None, ctx=None):
+        self.calls.append(response)
+        if self.name == "reporter":
+            return {"agent": "TERMINATE", "task": "TERMINATE", "data": f"report of {len(data)}"}
+        return {"agent": "planner", "task": response, "data": data + [{"found": response}]}
+
+
+def _server(store: CheckpointStore, planner: FakePlanner, calls: list) -> Server:
+    server = Server(checkpoint=store, run_id="run", ctx=RunContext(query="q", run_id="run"))
+    server.add_router(planner.name, Router(server, planner))
+    for name in ("search", "reporter"):
+        server.add_router(name, Router(server, FakeAgent(name, calls)))
+    server.set_initial_router(planner.name, "q")
+    return server
+
+
+def test_a_plan_cut_short_is_planned_again_on_resume(tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    calls = []
+    asyncio.run(_server(store, FakePlanner(fail_after=1), calls).start("q"))
+    state = store.load("run")
+    assert calls == ["search a"]
+    assert state["status"] == "running"
+    assert state["plan_complete"] is False
+
+    calls.clear()
+    result = asyncio.run(_server(store, FakePlanner(), calls).resume(state))
+    # the finished task is kept , the rest of the plan runs
+    assert calls == ["search b", "write"]
+    assert result["data"] == "report of 2"
+    state = store.load("run")
+    assert state["status"] == "done"
+    assert state["plan_complete"] is True
+
+
+def test_a_single_depends_on_is_one_id():
+    calls = []
+    server = Server()
+    for name in ("search", "reporter"):
+        server.add_router(name, Router(server, FakeAgent(name, calls)))
+    tasks = [
+        {"id": str(i), "task": f"search {i}", "agent": "search", "depends_on": []}
+        for i in range(1, 13)
+    ]
+    tasks.append({"id": "13", "task": "write", "agent": "reporter", "depends_on": "12"})
+    tasks.append({"id": "14", "task": "write again", "agent": "reporter", "depends_on": 2})
+    asyncio.run(server.run_plan({"tasks": tasks}))
+    assert tasks[-2]["depends_on"] == ["12"]
+    assert tasks[-1]["depends_on"] == ["2"]
+    assert sorted(calls[-2:]) == ["write", "write again"]